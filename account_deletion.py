@@ -0,0 +1,103 @@
+# account_deletion.py
+# 帳號刪除工作：在背景呼叫 storage.delete_user_data 並提供進度查詢，中斷後可繼續。
+#   python account_deletion.py delete <username> ...
+#   python account_deletion.py resume
+#   python account_deletion.py purge-inactive --days 180 [--dry-run]
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import leaderboard
+import storage
+
+class DeletionManager:
+    """在背景執行刪除工作並提供進度查詢 (整個 process 共用)"""
+    def __init__(self, store, max_jobs=2):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="account-deletion")
+        self._lock = threading.Lock()
+        self._jobs = {}  # username -> {'status', 'deleted', 'total', 'error'}
+
+    def submit(self, username):
+        """送出刪除工作並立即返回；同一位使用者已在刪除中時不會重複送出"""
+        with self._lock:
+            job = self._jobs.get(username)
+            if job and job['status'] in ('queued', 'running'):
+                return
+            self._jobs[username] = {'status': 'queued', 'deleted': 0, 'total': None, 'error': None}
+        self._executor.submit(self._run, username)
+
+    def _run(self, username):
+        def on_progress(deleted, total):
+            with self._lock:
+                self._jobs[username].update(status='running', deleted=deleted, total=total)
+        try:
+            self.store.delete_user_data(username, progress=on_progress)
+            leaderboard.get_service(self.store).remove_user(username, leaderboard.all_boards())
+            status, error = 'done', None
+        except Exception as e:
+            status, error = 'failed', str(e)
+        with self._lock:
+            self._jobs[username].update(status=status, error=error)
+
+    def progress(self, username):
+        with self._lock:
+            job = self._jobs.get(username)
+            return dict(job) if job else None
+
+_instance = None
+_instance_lock = threading.Lock()
+
+def get_manager(store):
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = DeletionManager(store)
+        return _instance
+
+# --- CLI ---
+
+def main(argv=None):
+    import firebase_setup
+
+    parser = argparse.ArgumentParser(description="帳號刪除工具")
+    parser.add_argument('--backend', choices=storage.BACKENDS, help="資料庫類型 (預設依設定值 storage_backend)")
+    parser.add_argument('--secrets', default=str(firebase_setup.SECRETS_PATH), help="Streamlit secrets 檔案 (Firestore)")
+    parser.add_argument('--parallel', type=int, default=4, help="同時送出的 batch 數 (Firestore)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    delete = sub.add_parser('delete', help="刪除指定帳號")
+    delete.add_argument('usernames', nargs='+')
+    sub.add_parser('resume', help="繼續所有被中斷的刪除工作")
+    purge = sub.add_parser('purge-inactive', help="刪除長時間未登入的帳號")
+    purge.add_argument('--days', type=int, required=True, help="未登入天數")
+    purge.add_argument('--dry-run', action='store_true', help="只列出帳號，不刪除")
+    args = parser.parse_args(argv)
+
+    backend = args.backend or config.get_setting('storage_backend', 'firestore')
+    if backend == 'firestore':
+        import storage_firestore
+        store = storage_firestore.FirestoreStorage.from_secrets_file(args.secrets)
+    else:
+        store = storage.open_storage(backend)
+    if args.command == 'delete':
+        usernames = args.usernames
+    elif args.command == 'resume':
+        usernames = store.pending_deletions()
+    else:
+        usernames = store.inactive_users(args.days)
+        if args.dry_run:
+            print("\n".join(usernames))
+            print(f"共 {len(usernames)} 個帳號超過 {args.days} 天未登入。")
+            return
+
+    for username in usernames:
+        def on_progress(deleted, total, username=username):
+            print(f"\r{username}: 已刪除 {deleted}" + (f" / {total}" if total else ""), end="", flush=True)
+        store.delete_user_data(username, progress=on_progress, parallel=args.parallel)
+        leaderboard.get_service(store).remove_user(username, leaderboard.all_boards())
+        print()
+    print(f"完成！共刪除 {len(usernames)} 個帳號。")
+
+if __name__ == "__main__":
+    main()
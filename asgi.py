@@ -0,0 +1,14 @@
+# asgi.py
+# 以 ASGI 伺服器執行時的進入點，可為卡圖與合併圖的靜態網址加上長期快取標頭：
+#   uvicorn asgi:app --host 0.0.0.0 --port 8501
+# 一般部署 (streamlit run main.py) 不需要這個檔案。
+from starlette.middleware import Middleware
+import streamlit as st
+
+import sprite_atlas
+import static_assets
+
+app = st.App("main.py", middleware=[
+    Middleware(static_assets.ImmutableCardsMiddleware),
+    Middleware(static_assets.ImmutableCardsMiddleware, prefix=sprite_atlas.URL_PREFIX),
+])
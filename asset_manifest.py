@@ -0,0 +1,187 @@
+# asset_manifest.py
+# 圖片資源索引：python asset_manifest.py 會掃描 image/ 並寫出 image/manifest.json
+# 遊戲模組在執行時只讀這份索引，不再逐一檢查檔案是否存在。
+import argparse
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+
+IMAGE_ROOT = Path("image")
+MANIFEST_PATH = IMAGE_ROOT / "manifest.json"
+MANIFEST_VERSION = 1
+RARITIES = ['R', 'SR', 'SSR', 'SP']
+SIMPLE_GAMES = ['flash_card', 'more_less']
+
+CARD_BACK_NAME = "卡背"
+R_CARD_BACK_NAME = "卡背2"
+POOL_COVER_NAME = "卡池封面"
+
+# --- Build ---
+
+def _natural_key(path):
+    """讓 2.jpg 排在 10.jpg 前面"""
+    stem = path.stem
+    return (0, int(stem), stem) if stem.isdigit() else (1, 0, stem)
+
+def _file_info(path, with_hash=True):
+    """讀取單一檔案的大小、尺寸與 sha256"""
+    info = {'size': path.stat().st_size}
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            info['width'], info['height'] = im.size
+    except ImportError:
+        pass
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        info['sha256'] = digest.hexdigest()
+    return info
+
+def card_id_for(rarity, path):
+    """卡片編號，例如 SSR/12.jpg -> 'SSR-12'"""
+    return f"{rarity}-{Path(path).stem}"
+
+def build_manifest(image_root=IMAGE_ROOT, with_hash=True):
+    """掃描圖片資料夾，回傳完整的資源索引 (dict)"""
+    image_root = Path(image_root)
+    files = {}
+
+    def register(path):
+        key = path.as_posix()
+        files[key] = _file_info(path, with_hash)
+        return key
+
+    def optional(path):
+        return register(path) if path.is_file() else None
+
+    games = {}
+    for game in SIMPLE_GAMES:
+        folder = image_root / game
+        faces = {}
+        for path in sorted(folder.glob('*.jpg'), key=_natural_key):
+            if path.stem != CARD_BACK_NAME:
+                faces[path.stem] = register(path)
+        games[game] = {'card_back': optional(folder / f"{CARD_BACK_NAME}.jpg"), 'faces': faces}
+
+    pools = {}
+    gacha_root = image_root / "gacha"
+    pool_dirs = sorted(p for p in gacha_root.iterdir() if p.is_dir()) if gacha_root.is_dir() else []
+    for pool_dir in pool_dirs:
+        rarities = {}
+        cards = {}
+        for rarity in RARITIES:
+            rarity_dir = pool_dir / rarity
+            if not rarity_dir.is_dir():
+                continue
+            paths = []
+            # 卡背2.jpg 是 R 卡專屬卡背，不算在卡片內
+            for path in sorted(rarity_dir.glob('*.jpg'), key=_natural_key):
+                if path.stem == R_CARD_BACK_NAME:
+                    continue
+                key = register(path)
+                paths.append(key)
+                cards[card_id_for(rarity, key)] = key
+            rarities[rarity] = paths
+        pools[pool_dir.name] = {
+            'cover': optional(pool_dir / f"{POOL_COVER_NAME}.jpg"),
+            'card_back': optional(pool_dir / f"{CARD_BACK_NAME}.jpg"),
+            'R_card_back': optional(pool_dir / "R" / f"{R_CARD_BACK_NAME}.jpg"),
+            'rarities': rarities,
+            'cards': cards,
+        }
+
+    return {'version': MANIFEST_VERSION, 'games': games, 'pools': pools, 'files': files}
+
+def write_manifest(manifest, path=MANIFEST_PATH):
+    Path(path).write_text(json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True) + "\n", encoding='utf-8')
+
+# --- Runtime Loader ---
+
+@lru_cache(maxsize=1)
+def load_manifest(path=MANIFEST_PATH):
+    """
+    讀取資源索引 (整個 process 只讀一次)。
+    索引檔不存在或版本不符時，改為直接掃描資料夾 (不計算 hash)。
+    """
+    try:
+        manifest = json.loads(Path(path).read_text(encoding='utf-8'))
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return build_manifest(with_hash=False)
+
+def pool_names():
+    """所有有圖片的卡池名稱"""
+    return list(load_manifest()['pools'])
+
+def pool_cards(pool_name):
+    """
+    回傳卡池內容：{'R': [...], 'SR': [...], ..., 'card_back': 路徑或 None, 'R_card_back': 路徑或 None}
+    卡池不存在時回傳空卡池。
+    """
+    pool = load_manifest()['pools'].get(pool_name)
+    if pool is None:
+        return {'card_back': None, 'R_card_back': None}
+    all_cards = {rarity: list(paths) for rarity, paths in pool['rarities'].items()}
+    all_cards['card_back'] = pool['card_back']
+    all_cards['R_card_back'] = pool['R_card_back']
+    return all_cards
+
+def pool_cover(pool_name):
+    """卡池封面路徑，沒有封面時回傳 None"""
+    pool = load_manifest()['pools'].get(pool_name)
+    return pool['cover'] if pool else None
+
+def card_path(pool_name, card_id):
+    """由卡片編號取得圖片路徑，找不到時回傳 None"""
+    pool = load_manifest()['pools'].get(pool_name)
+    return pool['cards'].get(card_id) if pool else None
+
+def game_image(game, name):
+    """
+    取得 flash_card / more_less 的卡面路徑，name 為卡面名稱 (例如 '1-1') 或 'card_back'。
+    找不到圖片時拋出 KeyError，避免畫面上出現破圖。
+    """
+    game_assets = load_manifest()['games'][game]
+    if name == 'card_back':
+        if game_assets['card_back'] is None:
+            raise KeyError(f"{game} 缺少卡背圖片")
+        return game_assets['card_back']
+    return game_assets['faces'][str(name)]
+
+def file_info(path):
+    """單一圖片的大小、尺寸與 hash，不在索引內時回傳 None"""
+    return load_manifest()['files'].get(path)
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生圖片資源索引 (manifest)")
+    parser.add_argument('--image-root', default=str(IMAGE_ROOT), help="圖片根目錄")
+    parser.add_argument('--output', default=str(MANIFEST_PATH), help="輸出檔案")
+    parser.add_argument('--check', action='store_true', help="只比對現有索引是否過期，不寫檔")
+    args = parser.parse_args(argv)
+
+    manifest = build_manifest(args.image_root)
+    if args.check:
+        try:
+            current = json.loads(Path(args.output).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            current = None
+        if current != manifest:
+            print(f"{args.output} 已過期，請重新執行 python asset_manifest.py")
+            raise SystemExit(1)
+        print(f"{args.output} 是最新的。")
+        return
+
+    write_manifest(manifest, args.output)
+    card_count = sum(len(pool['cards']) for pool in manifest['pools'].values())
+    print(f"完成！共 {len(manifest['files'])} 個檔案、{len(manifest['pools'])} 個卡池、{card_count} 張卡片。")
+
+if __name__ == "__main__":
+    main()
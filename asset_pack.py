@@ -0,0 +1,196 @@
+# asset_pack.py
+# 卡圖打包檔：python asset_pack.py 會把所有卡圖 (資源索引中的原圖 + 縮圖) 合併成 image/assets.pack。
+# 縮圖有更新時需在 thumbnails.py 之後重新執行。
+# 部署時由 build_assets.py 依序建置全部衍生圖檔 (本工具為其中一步)。
+#
+# 檔案格式：
+#   標頭 (HEADER)  : MAGIC + 索引位置 (u64) + 索引長度 (u64)
+#   圖片資料       : 每張圖從 PAGE_SIZE 的倍數開始，內容相同的圖片只存一份
+#   索引 (JSON)    : {圖片路徑: [位置, 長度, 內容 hash]}
+#
+# 執行時以唯讀 mmap 開啟，get() 回傳不複製資料的 memoryview。
+# 同一台機器上的多個 worker process 共用作業系統的 page cache，不必各自開檔讀取。
+# open_pack() 最多每 CHECK_INTERVAL 秒檢查一次檔案 (inode、mtime、大小)，重新建置後自動改用新檔。
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+import asset_manifest
+import static_assets
+
+PACK_PATH = asset_manifest.IMAGE_ROOT / "assets.pack"
+MAGIC = b"POPPACK1"
+HEADER = struct.Struct("<8sQQ")
+PAGE_SIZE = mmap.ALLOCATIONGRANULARITY
+HASH_LENGTH = 20
+CHECK_INTERVAL = 1.0   # 秒
+
+class AssetPackError(ValueError):
+    pass
+
+# --- Build ---
+
+def _align(offset, size=PAGE_SIZE):
+    return -(-offset // size) * size
+
+def build_pack(path=PACK_PATH, sources=None):
+    """
+    寫出打包檔並回傳 (圖片數, 實際存入的檔案數, 檔案大小)。
+    先寫到暫存檔再取代，正在使用舊檔的 process 不受影響 (舊檔的 mmap 在關閉前仍然有效)。
+    """
+    path = Path(path)
+    sources = static_assets.source_images() if sources is None else sources
+    index = {}
+    stored = {}   # 內容 hash -> (位置, 長度)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 0, 0))
+            for source in sources:
+                if not os.path.isfile(source):
+                    continue
+                data = Path(source).read_bytes()
+                digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+                if digest not in stored:
+                    offset = _align(f.tell())
+                    f.seek(offset)
+                    f.write(data)
+                    stored[digest] = (offset, len(data))
+                index[source] = [*stored[digest], digest]
+            index_data = json.dumps(index, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            index_offset = f.tell()
+            f.write(index_data)
+            size = f.tell()
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, index_offset, len(index_data)))
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    with _packs_lock:
+        _packs.pop(str(path), None)
+    return len(index), len(stored), size
+
+# --- Runtime Reader ---
+
+class AssetPack:
+    """唯讀的打包檔，get() 回傳 mmap 上的 memoryview (不複製資料)"""
+    def __init__(self, path=PACK_PATH):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if len(self._mmap) < HEADER.size:
+            raise AssetPackError(f"{self.path} 不是有效的打包檔")
+        magic, index_offset, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or index_offset + index_length > len(self._mmap):
+            raise AssetPackError(f"{self.path} 不是有效的打包檔")
+        self.index = json.loads(bytes(self._view[index_offset:index_offset + index_length]).decode('utf-8'))
+
+    def __contains__(self, image_path):
+        return image_path in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, image_path):
+        """圖片內容的 memoryview，不在打包檔中時回傳 None"""
+        entry = self.index.get(image_path)
+        if entry is None:
+            return None
+        offset, length, _ = entry
+        return self._view[offset:offset + length]
+
+    def get_card(self, pool_name, card_id):
+        """由卡片編號 (例如 'SSR-12') 取得圖片內容"""
+        image_path = asset_manifest.card_path(pool_name, card_id)
+        return self.get(image_path) if image_path else None
+
+    def content_hash(self, image_path):
+        entry = self.index.get(image_path)
+        return entry[2] if entry else None
+
+    def verify(self):
+        """重新計算每張圖的 hash，回傳內容不符的圖片路徑"""
+        return [image_path for image_path, (offset, length, digest) in self.index.items()
+                if hashlib.sha256(self._view[offset:offset + length]).hexdigest()[:HASH_LENGTH] != digest]
+
+_packs = {}   # 路徑 -> (檢查時間, 檔案識別 (inode, mtime, 大小), AssetPack 或 None)
+_packs_lock = threading.Lock()
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def open_pack(path=PACK_PATH):
+    """
+    整個 process 共用一份 mmap；尚未建置或檔案損壞時回傳 None (改為逐檔讀取)。
+    檔案被取代 (inode 或 mtime 改變) 後重新開啟；舊的 mmap 不主動關閉，
+    仍在使用中的 memoryview 不受影響，沒有參照後自動釋放。
+    """
+    path = str(path)
+    now = time.monotonic()
+    cached = _packs.get(path)
+    if cached is not None and now - cached[0] < CHECK_INTERVAL:
+        return cached[2]
+    with _packs_lock:
+        cached = _packs.get(path)
+        if cached is not None and now - cached[0] < CHECK_INTERVAL:
+            return cached[2]
+        key = _file_key(path)
+        if cached is not None and key == cached[1]:
+            pack = cached[2]
+        elif key is None:
+            pack = None
+        else:
+            try:
+                pack = AssetPack(path)
+            except FileNotFoundError:
+                pack = None
+            except (OSError, ValueError) as e:
+                # 記下檔案識別，同一份損壞的檔案不會每秒重新開啟
+                print(f"[asset_pack] 無法開啟 {path}，改為逐檔讀取: {e}")
+                pack = None
+        _packs[path] = (now, key, pack)
+        return pack
+
+def read_image(image_path):
+    """圖片內容的 memoryview (來自打包檔)，沒有打包檔或不在其中時回傳 None"""
+    pack = open_pack()
+    return pack.get(image_path) if pack is not None else None
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把卡圖合併成一個 mmap 用的打包檔")
+    parser.add_argument('--output', default=str(PACK_PATH), help="輸出檔案")
+    parser.add_argument('--verify', action='store_true', help="只檢查現有打包檔的內容 hash，不重新建置")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        pack = open_pack(args.output)
+        if pack is None:
+            print(f"找不到可用的打包檔：{args.output}")
+            raise SystemExit(1)
+        broken = pack.verify()
+        for image_path in broken:
+            print(f"內容不符：{image_path}")
+        if broken:
+            raise SystemExit(1)
+        print(f"{args.output} 共 {len(pack)} 張圖片，內容正確。")
+        return
+
+    total, stored, size = build_pack(args.output)
+    print(f"完成！共 {total} 張圖片 (存入 {stored} 個檔案)，{size / 2**20:.1f} MB。打包檔：{args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# auth_pool.py
+# 密碼雜湊 (PBKDF2) 交給獨立的 process pool 計算，避免佔住 Streamlit 的執行緒與 GIL。
+#   python auth_pool.py bench --workers 4 --seconds 5
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+
+from passlib.hash import pbkdf2_sha256
+
+import config
+
+DEFAULT_ROUNDS = 29000      # passlib 預設值
+DEFAULT_MAX_PENDING = 32    # 排隊中的雜湊工作上限，超過時直接回報忙碌
+DEFAULT_TIMEOUT = 10        # 秒
+
+class AuthBusyError(Exception):
+    """雜湊工作排隊已滿或等待逾時，請使用者稍後再試"""
+
+# --- Worker Functions (在子 process 中執行) ---
+
+def _hash_password(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+def _verify_password(password, stored_hash, rounds):
+    """驗證密碼；若成功且雜湊參數已過時，順便算出新的雜湊"""
+    if not stored_hash or not pbkdf2_sha256.identify(stored_hash):
+        return False, None
+    if not pbkdf2_sha256.verify(password, stored_hash):
+        return False, None
+    hasher = pbkdf2_sha256.using(rounds=rounds)
+    new_hash = hasher.hash(password) if hasher.needs_update(stored_hash) else None
+    return True, new_hash
+
+# --- Pool ---
+
+class AuthPool:
+    """有上限的雜湊工作池：同時排隊的工作超過 max_pending 時立即拋出 AuthBusyError"""
+    def __init__(self, workers=None, max_pending=DEFAULT_MAX_PENDING, rounds=DEFAULT_ROUNDS, timeout=DEFAULT_TIMEOUT):
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.rounds = rounds
+        self.timeout = timeout
+        # 使用 spawn 避免在多執行緒的 Streamlit server 中 fork
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusyError("登入人數過多")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise AuthBusyError("雜湊計算逾時")
+
+    def hash_password(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def verify_password(self, password, stored_hash):
+        """回傳 (是否正確, 新雜湊或 None)；新雜湊不為 None 時呼叫端應寫回資料庫"""
+        return self._run(_verify_password, password, stored_hash, self.rounds)
+
+    def warm_up(self):
+        """預先啟動所有 worker process"""
+        for future in [self._executor.submit(_hash_password, "", 1000) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self, wait=False):
+        """wait=True 會等 worker process 結束 (在子 process 中使用時需要，否則結束時會卡住)"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+@lru_cache(maxsize=1)
+def get_pool():
+    """整個 process 共用的雜湊工作池，參數由設定值 auth_workers / auth_max_pending / pbkdf2_rounds 決定"""
+    workers = config.get_int_setting('auth_workers', 0) or None
+    return AuthPool(
+        workers=workers,
+        max_pending=config.get_int_setting('auth_max_pending', DEFAULT_MAX_PENDING),
+        rounds=config.get_int_setting('pbkdf2_rounds', DEFAULT_ROUNDS),
+    )
+
+def hash_password(password):
+    return get_pool().hash_password(password)
+
+def verify_password(password, stored_hash):
+    return get_pool().verify_password(password, stored_hash)
+
+# --- Benchmark ---
+
+def benchmark(workers, seconds, rounds):
+    """持續送出驗證工作，回傳每秒登入數"""
+    pool = AuthPool(workers=workers, max_pending=workers * 4, rounds=rounds, timeout=60)
+    pool.warm_up()
+    stored_hash = _hash_password("benchmark-password", rounds)
+    done = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            pool.verify_password("benchmark-password", stored_hash)
+            with lock:
+                done += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(workers * 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return done / elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="密碼雜湊效能測試")
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help="測量每秒可處理的登入數")
+    bench.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1], help="worker 數")
+    bench.add_argument('--seconds', type=float, default=5, help="每組測試秒數")
+    bench.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help="PBKDF2 回合數")
+    args = parser.parse_args(argv)
+
+    print(f"PBKDF2 回合數 {args.rounds:,}")
+    for workers in args.workers:
+        rate = benchmark(workers, args.seconds, args.rounds)
+        print(f"{workers} 個 worker：每秒 {rate:,.1f} 次登入 (每核心 {rate / workers:,.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# build_assets.py
+# 建置所有衍生圖檔的單一入口：python build_assets.py [--if-missing]
+# 依序執行 thumbnails.py → static_assets.py → sprite_atlas.py → asset_pack.py，
+# 輸出 (縮圖、靜態網址、合併圖、打包檔) 都不進版本控制。
+#
+# 部署時應在啟動前執行一次 (見 .devcontainer/devcontainer.json)；
+# 漏掉時 main.py 啟動後發現缺少輸出，會在背景執行緒建置一次 (設定值 build_assets_on_start 可關閉)，
+# 建置完成前頁面使用較慢的退回路徑 (逐檔讀取、逐張 st.image)。
+import argparse
+import logging
+import threading
+import time
+
+import asset_pack
+import config
+import metrics
+import sprite_atlas
+import static_assets
+import thumbnails
+
+logger = logging.getLogger(__name__)
+
+# 各步驟的輸出 (以索引檔是否存在判斷是否已建置)
+OUTPUTS = {
+    'thumbnails': thumbnails.INDEX_PATH,
+    'static_assets': static_assets.INDEX_PATH,
+    'sprite_atlas': sprite_atlas.INDEX_PATH,
+    'asset_pack': asset_pack.PACK_PATH,
+}
+
+_build_lock = threading.Lock()   # 同一時間只執行一次建置
+_start_lock = threading.Lock()
+_build_thread = None
+
+def missing_outputs():
+    """尚未建置的步驟名稱"""
+    return [name for name, path in OUTPUTS.items() if not path.exists()]
+
+def build_all():
+    """依序重新建置全部輸出 (未變更的縮圖與合併圖會沿用)，完成後讓本 process 改用新的輸出"""
+    with _build_lock:
+        start = time.perf_counter()
+        thumbnails.build_thumbnails()
+        static_assets.build_static()
+        sprite_atlas.build_all()
+        asset_pack.build_pack()
+        # 這些查詢會快取「尚未建置」的結果，建置後需清除
+        static_assets.serving_enabled.cache_clear()
+        sprite_atlas.atlas_for.cache_clear()
+        print(f"[build_assets] 建置完成 ({time.perf_counter() - start:.1f}s)")
+
+def _build_in_background():
+    try:
+        build_all()
+    except Exception:
+        metrics.record_failure('build_assets')
+        logger.exception("建置衍生圖檔失敗，繼續使用退回路徑")
+
+def ensure_built():
+    """
+    啟動時呼叫：有缺少的輸出時在背景執行緒建置一次 (整個 process 只啟動一次)。
+    回傳建置中的執行緒，不需要建置時回傳 None。
+    """
+    global _build_thread
+    if str(config.get_setting('build_assets_on_start', 'true')).lower() not in ('1', 'true', 'yes'):
+        return None
+    missing = missing_outputs()
+    if not missing:
+        return None
+    with _start_lock:
+        if _build_thread is None:
+            print(f"[build_assets] 缺少 {', '.join(missing)}，在背景建置")
+            _build_thread = threading.Thread(target=_build_in_background, name="build_assets", daemon=True)
+            _build_thread.start()
+        return _build_thread
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="建置縮圖、靜態網址、合併圖與打包檔")
+    parser.add_argument('--if-missing', action='store_true', help="全部輸出都已存在時不重新建置")
+    args = parser.parse_args(argv)
+    missing = missing_outputs()
+    if args.if_missing and not missing:
+        print("[build_assets] 輸出都已存在，略過")
+        return
+    build_all()
+
+if __name__ == '__main__':
+    main()
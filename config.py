@@ -0,0 +1,19 @@
+# config.py
+# 讀取設定值：環境變數 (大寫名稱) 優先，其次為 Streamlit secrets，最後使用預設值。
+import os
+
+def get_setting(key, default=None):
+    """例如 get_setting('inventory_layout') 會依序讀取 INVENTORY_LAYOUT 與 st.secrets['inventory_layout']"""
+    value = os.environ.get(key.upper())
+    if value not in (None, ''):
+        return value
+    try:
+        import streamlit as st
+        value = st.secrets.get(key)
+    except Exception:
+        # 命令列工具或沒有 secrets.toml 時
+        value = None
+    return default if value is None else value
+
+def get_int_setting(key, default):
+    return int(get_setting(key, default))
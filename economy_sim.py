@@ -0,0 +1,215 @@
+# economy_sim.py
+# 爆米花經濟模擬：大量虛擬玩家依策略遊玩三個遊戲，統計餘額分布、集滿卡池所需時間與收支比例。
+#   python economy_sim.py --players 1000000 --sessions 60 --strategy casual grinder gambler
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gacha_engine
+
+REGISTER_BONUS = 100      # 註冊贈送
+FLASH_CARD_PAIRS = 8      # 翻翻樂每局最多配對數 (每組 1 爆米花)
+MORE_LESS_DECK = 7        # 比大小牌組 1~7
+SINGLE_COST = 10          # 單抽消耗 (卡池設定中沒有此卡池時使用)
+TEN_PULL_COST = 100       # 十連抽消耗
+
+# --- Strategies ---
+
+class Strategy:
+    """
+    玩家策略，每個方法都以「一批玩家」為單位 (numpy 陣列) 運算。
+    要加入新策略時繼承此類別並覆寫需要的方法，再登記到 STRATEGIES。
+    """
+    def __init__(self, flash_games=3, flash_skill=0.6, bet_rounds=3, bet_fraction=0.1,
+                 guess='optimal', gacha_reserve=0, prefer_ten_pull=True, max_pulls=20):
+        self.flash_games = flash_games          # 每次上線玩幾局翻翻樂
+        self.flash_skill = flash_skill          # 每組配對成功的機率
+        self.bet_rounds = bet_rounds            # 每次上線玩幾局比大小
+        self.bet_fraction = bet_fraction        # 每局下注餘額的比例
+        self.guess = guess                      # 'optimal' 或 'random'
+        self.gacha_reserve = gacha_reserve      # 抽卡後至少保留的爆米花
+        self.prefer_ten_pull = prefer_ten_pull  # 夠錢時優先十連抽
+        self.max_pulls = max_pulls              # 每次上線最多抽幾張
+
+    def flash_card_matches(self, rng, n):
+        """一局翻翻樂的配對數"""
+        return rng.binomial(FLASH_CARD_PAIRS, self.flash_skill, n)
+
+    def bet_amounts(self, balance):
+        """比大小每局的下注數，餘額為 0 的玩家回傳 0"""
+        bets = np.maximum(1, (balance * self.bet_fraction).astype(np.int64))
+        return np.where(balance > 0, np.minimum(bets, balance), 0)
+
+    def guess_bigger(self, rng, player_card):
+        """回傳是否猜「比電腦大」"""
+        if self.guess == 'random':
+            return rng.random(player_card.shape) < 0.5
+        middle = (MORE_LESS_DECK + 1) / 2
+        coin = rng.random(player_card.shape) < 0.5
+        return np.where(player_card == middle, coin, player_card > middle)
+
+STRATEGIES = {
+    'casual': Strategy(flash_games=2, flash_skill=0.5, bet_rounds=1, bet_fraction=0.1),
+    'grinder': Strategy(flash_games=8, flash_skill=0.8, bet_rounds=0, gacha_reserve=0),
+    'gambler': Strategy(flash_games=1, flash_skill=0.5, bet_rounds=10, bet_fraction=0.5, guess='random'),
+    'saver': Strategy(flash_games=4, flash_skill=0.7, bet_rounds=2, bet_fraction=0.05, gacha_reserve=100),
+}
+
+# --- Simulation ---
+
+def pool_rules(pool_name):
+    """卡池的機率、保底與價格 (可傳給 worker process 的 dict)，依 pools.toml 設定"""
+    import pool_registry
+
+    pool = pool_registry.get_registry().get(pool_name)
+    if pool is None:
+        return {'rates': None, 'guarantee_rates': None, 'guarantee_block': gacha_engine.GUARANTEE_BLOCK,
+                'single_cost': SINGLE_COST, 'ten_pull_cost': TEN_PULL_COST}
+    return {'rates': dict(pool.rates), 'guarantee_rates': dict(pool.guarantee_rates),
+            'guarantee_block': pool.guarantee_block, 'single_cost': pool.single_cost,
+            'ten_pull_cost': pool.ten_pull_cost}
+
+def simulate_chunk(strategy, pool_cards, num_players, sessions, seed, rules=None):
+    """
+    模擬一批玩家 (在 worker process 中執行)。
+    回傳最終餘額、集滿卡池的上線次數與抽數 (未集滿為 -1) 以及各項收支總和。
+    """
+    rules = rules or pool_rules(None)
+    sampler = gacha_engine.PoolSampler(pool_cards, rules['rates'], rules['guarantee_rates'], rules['guarantee_block'])
+    costs = {10: rules['ten_pull_cost'], 1: rules['single_cost']}
+    rng = np.random.default_rng(seed)
+    n = num_players
+    balance = np.full(n, REGISTER_BONUS, dtype=np.int64)
+    owned = np.zeros((n, len(sampler.cards)), dtype=bool)
+    pulls = np.zeros(n, dtype=np.int64)
+    completed_session = np.full(n, -1, dtype=np.int64)
+    completed_pulls = np.full(n, -1, dtype=np.int64)
+    totals = {'register': REGISTER_BONUS * n, 'flash_card': 0, 'more_less_win': 0,
+              'more_less_loss': 0, 'gacha': 0}
+
+    for session in range(sessions):
+        # 翻翻樂 (來源)
+        for _ in range(strategy.flash_games):
+            earned = strategy.flash_card_matches(rng, n)
+            balance += earned
+            totals['flash_card'] += int(earned.sum())
+
+        # 比大小：玩家從 1~7 抽一張，電腦從剩下的牌抽一張，不會平手
+        for _ in range(strategy.bet_rounds):
+            bets = strategy.bet_amounts(balance)
+            player = rng.integers(1, MORE_LESS_DECK + 1, n)
+            computer = rng.integers(1, MORE_LESS_DECK, n)
+            computer += computer >= player
+            bigger = strategy.guess_bigger(rng, player)
+            win = np.where(bigger, player > computer, player < computer)
+            delta = np.where(win, bets, -bets)
+            balance += delta
+            totals['more_less_win'] += int(delta[delta > 0].sum())
+            totals['more_less_loss'] += int(-delta[delta < 0].sum())
+
+        # 抽卡 (去處)
+        pulled = np.zeros(n, dtype=np.int64)
+        while True:
+            spendable = balance - strategy.gacha_reserve
+            room = strategy.max_pulls - pulled
+            ten = (spendable >= costs[10]) & (room >= 10) if strategy.prefer_ten_pull else np.zeros(n, bool)
+            one = ~ten & (spendable >= costs[1]) & (room >= 1)
+            if not ten.any() and not one.any():
+                break
+            for mask, size in ((ten, 10), (one, 1)):
+                idx = np.flatnonzero(mask)
+                if idx.size == 0:
+                    continue
+                draws = sampler.sample_batch(idx.size, size, rng)
+                owned[idx[:, None], draws] = True
+                balance[idx] -= costs[size]
+                pulled[idx] += size
+                totals['gacha'] += int(idx.size * costs[size])
+        pulls += pulled
+
+        newly_done = (completed_session < 0) & owned.all(axis=1)
+        completed_session[newly_done] = session + 1
+        completed_pulls[newly_done] = pulls[newly_done]
+
+    return balance, completed_session, completed_pulls, totals
+
+def run_simulation(strategy, pool_name, num_players, sessions, workers=None, chunk_size=50_000, seed=None):
+    """
+    把玩家切成多批，以 process pool 平行模擬後合併結果。
+    strategy 可以是 STRATEGIES 中的名稱或 Strategy 物件 (會被傳到各個 worker)。
+    """
+    import asset_manifest
+
+    if isinstance(strategy, str):
+        strategy = STRATEGIES[strategy]
+    pool_cards = {r: paths for r, paths in asset_manifest.pool_cards(pool_name).items() if r in gacha_engine.RARITIES}
+    rules = pool_rules(pool_name)
+    chunks = [min(chunk_size, num_players - start) for start in range(0, num_players, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    workers = workers or os.cpu_count()
+
+    balances, sessions_done, pulls_done = [], [], []
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(simulate_chunk, strategy, pool_cards, size, sessions, s, rules)
+                   for size, s in zip(chunks, seeds)]
+        for future in futures:
+            balance, completed_session, completed_pulls, chunk_totals = future.result()
+            balances.append(balance)
+            sessions_done.append(completed_session)
+            pulls_done.append(completed_pulls)
+            for key, value in chunk_totals.items():
+                totals[key] = totals.get(key, 0) + value
+    return np.concatenate(balances), np.concatenate(sessions_done), np.concatenate(pulls_done), totals
+
+# --- Report ---
+
+PERCENTILES = [10, 25, 50, 75, 90, 99]
+
+def format_percentiles(values):
+    if values.size == 0:
+        return "無資料"
+    points = np.percentile(values, PERCENTILES)
+    return "  ".join(f"p{p}={v:,.0f}" for p, v in zip(PERCENTILES, points))
+
+def report(strategy_name, pool_name, balances, completed_session, completed_pulls, totals, elapsed):
+    done = completed_session >= 0
+    sources = totals['register'] + totals['flash_card'] + totals['more_less_win']
+    sinks = totals['gacha'] + totals['more_less_loss']
+    print(f"=== 策略 {strategy_name} / 卡池 {pool_name}：{balances.size:,} 位玩家 ({elapsed:.1f} 秒) ===")
+    print(f"最終餘額      {format_percentiles(balances)}")
+    print(f"集滿卡池比例  {done.mean():.2%}")
+    print(f"集滿上線次數  {format_percentiles(completed_session[done])}")
+    print(f"集滿所需抽數  {format_percentiles(completed_pulls[done])}")
+    print(f"來源  註冊 {totals['register']:,}  翻翻樂 {totals['flash_card']:,}  比大小贏 {totals['more_less_win']:,}")
+    print(f"去處  抽卡 {totals['gacha']:,}  比大小輸 {totals['more_less_loss']:,}")
+    print(f"去處/來源 = {sinks / sources:.3f}" if sources else "去處/來源 = 無來源")
+    print()
+
+# --- CLI ---
+
+def main(argv=None):
+    import asset_manifest
+
+    parser = argparse.ArgumentParser(description="爆米花經濟模擬")
+    parser.add_argument('--players', type=int, default=100_000, help="虛擬玩家數")
+    parser.add_argument('--sessions', type=int, default=30, help="每位玩家上線次數")
+    parser.add_argument('--strategy', nargs='+', default=sorted(STRATEGIES), choices=sorted(STRATEGIES), help="玩家策略")
+    parser.add_argument('--pool', nargs='+', default=None, help="卡池名稱 (預設全部)")
+    parser.add_argument('--workers', type=int, default=None, help="process 數 (預設 CPU 核心數)")
+    parser.add_argument('--chunk-size', type=int, default=50_000, help="每個工作批次的玩家數")
+    parser.add_argument('--seed', type=int, default=None, help="亂數種子")
+    args = parser.parse_args(argv)
+
+    for pool_name in args.pool or asset_manifest.pool_names():
+        for strategy_name in args.strategy:
+            start = time.perf_counter()
+            results = run_simulation(strategy_name, pool_name, args.players, args.sessions,
+                                     args.workers, args.chunk_size, args.seed)
+            report(strategy_name, pool_name, *results, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# event_log.py
+# 事件紀錄 (只會附加寫入)：每次抽卡、爆米花入帳、翻翻樂與比大小的結果各寫一行 JSON。
+#
+# - 事件先累積在記憶體中，由背景執行緒每 FLUSH_INTERVAL 秒寫入 <event_log_dir>/events-<時間>-<pid>-<序號>.jsonl
+#   (每個 process 各自一個檔案，不需要跨 process 加鎖)。
+# - 檔案超過 ROTATE_BYTES 或 ROTATE_SECONDS 時換新檔，舊檔以 gzip 壓縮為 .jsonl.gz。
+# - 設定值 event_log 為 0 / false 時不記錄。
+#
+# 分析 (串流讀取，記憶體用量與事件數無關，多個檔案平行處理)：
+#   python event_log.py stats [--dir events] [--since 2026-10-01] [--workers 8]
+#
+# 事件格式 (欄位名稱縮短以節省空間，t 為 Unix 時間、u 為使用者)：
+#   draw       : p 卡池、n 張數、c 卡片編號 (例如 'SSR-12')、g 保底卡的位置、b 保底區塊張數 (結果依區塊排列)、
+#                cost、bal 扣款後餘額
+#   popcorn    : d 變動總和、src {來源: 變動量} (來源為冪等鍵冒號前的部分，例如 'flash_card')
+#   flash_card : m 配對數、pairs 總組數、reward 獎勵
+#   more_less  : bet 下注、pc 玩家的牌、cc 電腦的牌、r 'win' / 'lose' / 'tie'、d 爆米花變動
+import argparse
+import atexit
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+DEFAULT_DIR = "events"
+FLUSH_INTERVAL = 1.0              # 秒
+ROTATE_BYTES = 64 * 1024 * 1024   # 單一檔案超過此大小時換新檔
+ROTATE_SECONDS = 3600             # 單一檔案最長寫入時間
+
+# --- Writer ---
+
+class EventLog:
+    def __init__(self, directory=DEFAULT_DIR, flush_interval=FLUSH_INTERVAL,
+                 rotate_bytes=ROTATE_BYTES, rotate_seconds=ROTATE_SECONDS):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._lock = threading.Lock()
+        self._buffer = []        # 尚未寫入的事件 (已編碼的字串)
+        self._write_lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._sequence = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log(self, event_type, username, **fields):
+        """記錄一筆事件 (只放進記憶體，由背景執行緒寫入檔案)"""
+        event = {'t': round(time.time(), 3), 'e': event_type, 'u': username}
+        event.update(fields)
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._buffer.append(line)
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        with self._write_lock:
+            if self._file is None or self._should_rotate():
+                self._rotate()
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+
+    def _should_rotate(self):
+        return (self._file.tell() >= self.rotate_bytes
+                or time.monotonic() - self._opened_at >= self.rotate_seconds)
+
+    def _rotate(self):
+        """關閉目前的檔案並壓縮，再開一個新檔案"""
+        self._close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        # 同一秒內換檔多次時以序號區分
+        self._sequence += 1
+        self._path = self.directory / f"events-{stamp}-{os.getpid()}-{self._sequence}.jsonl"
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if self._path.stat().st_size:
+            compress(self._path)
+        else:
+            self._path.unlink()
+
+    # --- 背景執行緒 ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[event_log] 寫入事件失敗: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+        with self._write_lock:
+            self._close()
+
+class DisabledEventLog:
+    """event_log 設定關閉時使用，不做任何事"""
+    def log(self, event_type, username, **fields):
+        pass
+
+    def flush(self):
+        pass
+
+def compress(path):
+    """把 .jsonl 壓縮成 .jsonl.gz 後刪除原檔"""
+    path = Path(path)
+    target = path.with_name(path.name + ".gz")
+    with open(path, 'rb') as source, gzip.open(target, 'wb', compresslevel=6) as dest:
+        shutil.copyfileobj(source, dest, 1 << 20)
+    path.unlink()
+    return target
+
+_instance = None
+_instance_lock = threading.Lock()
+
+def get_event_log():
+    """整個 process 共用一個事件紀錄 (第一次呼叫時建立並啟動背景寫入)"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            if str(config.get_setting('event_log', '1')).lower() in ('0', 'false', 'no'):
+                _instance = DisabledEventLog()
+            else:
+                _instance = EventLog(config.get_setting('event_log_dir', DEFAULT_DIR))
+                _instance.start()
+        return _instance
+
+def log(event_type, username, **fields):
+    get_event_log().log(event_type, username, **fields)
+
+def popcorn_listener(username, entries, balance=None, as_of=None):
+    """帳本入帳後的回呼：依冪等鍵的前綴 (遊戲名稱) 彙總變動量"""
+    sources = {}
+    for key, amount in entries.items():
+        source = key.split(':', 1)[0] if ':' in key else 'other'
+        sources[source] = sources.get(source, 0) + amount
+    log('popcorn', username, d=sum(entries.values()), src=sources)
+
+# --- Reader ---
+
+def event_files(directory, since=None):
+    """依時間順序列出所有事件檔 (.jsonl 與 .jsonl.gz)；since 為 datetime 時略過更早結束的檔案"""
+    files = sorted(Path(directory).glob('events-*.jsonl*'))
+    if since is not None:
+        files = [path for path in files if path.stat().st_mtime >= since.timestamp()]
+    return files
+
+def iter_events(path):
+    """逐行讀取單一事件檔 (不會整個載入記憶體)，略過無法解析的行 (例如寫到一半的最後一行)"""
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+# --- Analytics ---
+
+def new_stats():
+    return {
+        'events': 0,
+        'draws': {},       # pool -> {'pulls': {size: 次數}, 'rarity': {size: {rarity: 張數}}, 'guarantee': [有保底的區塊數, 保底有作用的區塊數]}
+        'spent': {},       # pool -> 爆米花
+        'games': {},       # game -> {'rounds', 'payout', 'wins', 'losses', 'ties'}
+        'popcorn': {},     # source -> 入帳總和
+    }
+
+def _game(stats, name):
+    return stats['games'].setdefault(name, {'rounds': 0, 'payout': 0, 'wins': 0, 'losses': 0, 'ties': 0})
+
+def add_event(stats, event, since_ts=0):
+    """把一筆事件累加到統計中 (所有計數的 key 數量有上限，與事件數無關)"""
+    if event.get('t', 0) < since_ts:
+        return
+    stats['events'] += 1
+    kind = event.get('e')
+    if kind == 'draw':
+        pool = stats['draws'].setdefault(event['p'], {'pulls': {}, 'rarity': {}, 'guarantee': [0, 0]})
+        size = str(event['n'])
+        pool['pulls'][size] = pool['pulls'].get(size, 0) + 1
+        rarities = pool['rarity'].setdefault(size, {})
+        guaranteed = set(event.get('g', []))
+        # 每個區塊各自保底；舊事件沒有 b 欄位，整次視為一個區塊
+        block = event.get('b') or len(event['c']) or 1
+        blocks = {}   # 區塊編號 -> 該區塊非保底卡是否全為 R
+        for i, card_id in enumerate(event['c']):
+            rarity = card_id.split('-', 1)[0]
+            rarities[rarity] = rarities.get(rarity, 0) + 1
+            if i not in guaranteed:
+                blocks[i // block] = blocks.get(i // block, True) and rarity == 'R'
+        for b in {i // block for i in guaranteed}:
+            pool['guarantee'][0] += 1
+            # 區塊中其他張都是 R 時，保底才真正改變了結果
+            if blocks.get(b, True):
+                pool['guarantee'][1] += 1
+        stats['spent'][event['p']] = stats['spent'].get(event['p'], 0) + event.get('cost', 0)
+    elif kind == 'popcorn':
+        for source, amount in event.get('src', {}).items():
+            stats['popcorn'][source] = stats['popcorn'].get(source, 0) + amount
+    elif kind == 'flash_card':
+        game = _game(stats, 'flash_card')
+        game['rounds'] += 1
+        game['payout'] += event.get('reward', 0)
+    elif kind == 'more_less':
+        game = _game(stats, 'more_less')
+        game['rounds'] += 1
+        game['payout'] += event.get('d', 0)
+        game[{'win': 'wins', 'lose': 'losses'}.get(event.get('r'), 'ties')] += 1
+
+def merge_stats(total, part):
+    """合併兩份統計 (巢狀的數字逐項相加)"""
+    for key, value in part.items():
+        if isinstance(value, dict):
+            merge_stats(total.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            current = total.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+def stats_for_file(path, since_ts=0):
+    """單一檔案的統計 (在 worker process 中執行)"""
+    stats = new_stats()
+    for event in iter_events(Path(path)):
+        add_event(stats, event, since_ts)
+    return stats
+
+def collect_stats(files, since_ts=0, workers=None):
+    """平行統計多個檔案後合併"""
+    total = new_stats()
+    if not files:
+        return total
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for part in executor.map(stats_for_file, [str(path) for path in files], [since_ts] * len(files)):
+            merge_stats(total, part)
+    return total
+
+def expected_rates(pool_name, size):
+    """pools.toml 設定下的理論稀有度比例 {rarity: 比例}，無法計算時回傳 None"""
+    try:
+        import gacha_engine
+        import pool_registry
+        pool = pool_registry.get_registry().get(pool_name)
+        if pool is None:
+            return None
+        return dict(zip(gacha_engine.RARITIES, pool.sampler().expected_rarity_rates(int(size))))
+    except Exception:
+        return None
+
+def report(stats):
+    print(f"共 {stats['events']:,} 筆事件")
+    for pool_name, pool in sorted(stats['draws'].items()):
+        print(f"\n=== 卡池 {pool_name}：消耗 {stats['spent'].get(pool_name, 0):,} 🍿 ===")
+        for size, pulls in sorted(pool['pulls'].items(), key=lambda item: int(item[0])):
+            rarities = pool['rarity'].get(size, {})
+            cards = sum(rarities.values())
+            expected = expected_rates(pool_name, size) or {}
+            print(f"{size} 抽 x {pulls:,} 次 ({cards:,} 張)")
+            print(f"  {'稀有度':<6}{'觀察':>10}{'理論':>10}")
+            for rarity in ('R', 'SR', 'SSR', 'SP'):
+                observed = rarities.get(rarity, 0) / cards if cards else 0
+                exp = f"{expected[rarity]:>10.4%}" if rarity in expected else f"{'-':>10}"
+                print(f"  {rarity:<8}{observed:>10.4%}{exp}")
+        fired, hits = pool['guarantee']
+        if fired:
+            print(f"保底：{fired:,} 個區塊，其中 {hits:,} 個 ({hits / fired:.2%}) 區塊內其餘卡片皆為 R (保底改變了結果)")
+
+    if stats['games']:
+        print("\n=== 遊戲收支 ===")
+        for name, game in sorted(stats['games'].items()):
+            rounds = game['rounds']
+            line = f"{name:<12}{rounds:>10,} 局  發出 {game['payout']:>+12,} 🍿  平均 {game['payout'] / rounds if rounds else 0:+.3f}/局"
+            if name == 'more_less' and rounds:
+                line += f"  勝 {game['wins'] / rounds:.1%} / 負 {game['losses'] / rounds:.1%} / 平 {game['ties'] / rounds:.1%}"
+            print(line)
+    if stats['popcorn']:
+        print("\n=== 爆米花入帳 (依來源) ===")
+        for source, amount in sorted(stats['popcorn'].items()):
+            print(f"{source:<12}{amount:>+14,}")
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="事件紀錄分析")
+    sub = parser.add_subparsers(dest='command', required=True)
+    stats_parser = sub.add_parser('stats', help="統計抽卡機率、保底與各遊戲收支")
+    stats_parser.add_argument('--dir', default=None, help="事件紀錄資料夾 (預設 event_log_dir 設定或 events)")
+    stats_parser.add_argument('--since', default=None, help="只統計此時間之後的事件 (ISO 8601)")
+    stats_parser.add_argument('--workers', type=int, default=None, help="process 數 (預設 CPU 核心數)")
+    stats_parser.add_argument('--json', action='store_true', help="以 JSON 輸出原始統計")
+    args = parser.parse_args(argv)
+
+    directory = args.dir or config.get_setting('event_log_dir', DEFAULT_DIR)
+    since = datetime.fromisoformat(args.since) if args.since else None
+    files = event_files(directory, since)
+    start = time.perf_counter()
+    stats = collect_stats(files, since.timestamp() if since else 0, args.workers)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=1))
+        return
+    report(stats)
+    elapsed = time.perf_counter() - start
+    print(f"\n讀取 {len(files)} 個檔案，耗時 {elapsed:.1f} 秒 ({stats['events'] / elapsed if elapsed else 0:,.0f} 筆/秒)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# firebase_setup.py
+# Firebase 金鑰與 Firestore client 的建立 (Streamlit 頁面與命令列工具共用)
+import tomllib
+from pathlib import Path
+
+SECRETS_PATH = Path(".streamlit") / "secrets.toml"
+CREDENTIAL_FIELDS = [
+    "type", "project_id", "private_key_id", "private_key", "client_email", "client_id",
+    "auth_uri", "token_uri", "auth_provider_x509_cert_url", "client_x509_cert_url",
+]
+
+def build_credentials(section):
+    """由 secrets 中的 firebase_credentials 區塊組出服務帳號金鑰 dict"""
+    creds_dict = {field: section[field] for field in CREDENTIAL_FIELDS}
+    creds_dict["private_key"] = creds_dict["private_key"].replace('\\n', '\n')
+    return creds_dict
+
+def init_firestore(section):
+    """初始化 firebase_admin (只做一次) 並回傳 Firestore client"""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(build_credentials(section)))
+    return firestore.client()
+
+def client_from_secrets_file(path=SECRETS_PATH):
+    """命令列工具用：直接讀取 .streamlit/secrets.toml 建立 Firestore client"""
+    with open(path, 'rb') as f:
+        secrets = tomllib.load(f)
+    return init_firestore(secrets["firebase_credentials"])
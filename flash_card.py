@@ -1,126 +1,172 @@
 # flash_card.py
 import streamlit as st
+import streamlit.components.v1 as components
 import random
 import time
-import os
+import uuid
+from functools import lru_cache
+import asset_manifest
+import event_log
+import game_state
+import metrics
+import ui_images
+
+GAME_SECONDS = 90
+# 盤面欄數：16 張為 4 欄，較大的盤面 (例如設計文件中的 42 張) 用 7 欄
+BOARD_COLUMNS = 4
+WIDE_BOARD_COLUMNS = 7
+GAME = 'flash_card'
+
+class FlashCardState:
+    """
+    一局翻翻樂。board 的每個 byte 是一張牌：卡面組別序號 * 2 + (0 為 X-1、1 為 X-2)，
+    face_up (翻開中) 與 matched (已配對) 是位元遮罩，第 i 個位元代表第 i 張牌。
+    """
+    __slots__ = ('pairs', 'board', 'face_up', 'matched', 'start_time', 'game_id', 'game_over', 'reward_claimed')
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+        codes = list(range(2 * len(pairs)))
+        random.shuffle(codes)
+        self.board = bytes(codes)
+        self.face_up = 0
+        self.matched = 0
+        self.start_time = time.time()
+        self.game_id = uuid.uuid4().hex
+        self.game_over = False
+        self.reward_claimed = False
+
+    @property
+    def total_pairs(self):
+        return len(self.pairs)
+
+    @property
+    def matched_pairs(self):
+        return self.matched.bit_count() // 2
+
+    def card_name(self, index):
+        """卡面名稱，例如 '3-2'"""
+        code = self.board[index]
+        return f"{self.pairs[code >> 1]}-{(code & 1) + 1}"
+
+    def is_hidden(self, index):
+        return not game_state.has_bit(self.face_up | self.matched, index)
+
+    def flip(self, index):
+        """翻開一張牌：已有兩張未配對的牌翻開時先蓋回去，翻開第二張時判斷是否配對"""
+        if self.face_up.bit_count() == 2:
+            self.face_up = 0
+        if not self.is_hidden(index):
+            return
+        self.face_up = game_state.set_bit(self.face_up, index)
+        if self.face_up.bit_count() == 2:
+            first, second = [i for i in range(len(self.board)) if game_state.has_bit(self.face_up, i)]
+            if self.board[first] >> 1 == self.board[second] >> 1:  # 配對成功
+                self.matched |= self.face_up
+                self.face_up = 0
+                if self.matched_pairs == self.total_pairs:
+                    self.game_over = True
 
 def start_game(user_email, db_update_func):
     st.title("🧠 記憶翻翻樂")
 
     # --- 備註提醒 ---
-    st.warning("⚠️ 由於使用的是免費資源，系統反應較慢，遊玩時請勿操作太快避免畫面混亂影響判斷。")
     st.info("💡 建議使用電腦或將手機橫置遊玩，以獲得最佳體驗。")
 
-    if 'game_started' not in st.session_state or not st.session_state.game_started:
-        initialize_game()
+    state = game_state.get(GAME, new_game)
 
     # 遊戲結束 UI
-    if st.session_state.get('game_over', False):
-        if st.session_state.matched_pairs == st.session_state.total_pairs:
+    if state.game_over:
+        if state.matched_pairs == state.total_pairs:
             st.balloons()
             st.success(f"恭喜！您在時間內完成了所有配對！")
         else:
             st.success(f"時間到！")
             
-        st.info(f"最終成績：成功配對 {st.session_state.matched_pairs} 組！")
-        st.info(f"你獲得了 {st.session_state.matched_pairs} 個爆米花 🍿")
-
-        if not st.session_state.get('reward_claimed', False):
-            if db_update_func(user_email, st.session_state.matched_pairs):
-                st.session_state.reward_claimed = True
+        st.info(f"最終成績：成功配對 {state.matched_pairs} 組！")
+        st.info(f"你獲得了 {state.matched_pairs} 個爆米花 🍿")
+
+        if not state.reward_claimed:
+            reward_key = f"flash_card:{state.game_id}"
+            if db_update_func(user_email, state.matched_pairs, reward_key):
+                state.reward_claimed = True
+                event_log.log('flash_card', user_email, m=state.matched_pairs,
+                              pairs=state.total_pairs, reward=state.matched_pairs)
         if st.button("返回大廳"):
             st.session_state.page = "主頁"
-            reset_game_state()
+            game_state.reset(GAME)
             st.rerun()
         return
 
-    # 顯示計時器和分數
-    elapsed_time = time.time() - st.session_state.start_time
-    remaining_time = max(0, 90 - int(elapsed_time))
-    
-    col1, col2 = st.columns(2)
-    col1.metric(label="剩餘時間", value=f"{remaining_time} 秒")
-    col2.metric(label="已配對", value=f"{st.session_state.matched_pairs} / {st.session_state.total_pairs} 組")
-
-    if remaining_time <= 0:
-        st.session_state.game_over = True
-        st.rerun()
-
+    # 倒數計時在瀏覽器端進行，不需要伺服器重新執行
+    remaining_time = GAME_SECONDS - (time.time() - state.start_time)
+    show_countdown(remaining_time)
     st.markdown("---")
+    show_board()
+
+def show_countdown(remaining_time):
+    """以前端 JavaScript 顯示倒數計時"""
+    components.html(f"""
+        <div id="countdown" style="font-family: sans-serif; font-size: 1.6rem; text-align: center;"></div>
+        <script>
+            const deadline = Date.now() + {max(0.0, remaining_time) * 1000:.0f};
+            const el = document.getElementById("countdown");
+            function tick() {{
+                const left = Math.max(0, Math.ceil((deadline - Date.now()) / 1000));
+                el.textContent = left > 0 ? `⏱️ 剩餘時間 ${{left}} 秒` : "⏰ 時間到！點任一張牌查看結果";
+                if (left > 0) setTimeout(tick, 250);
+            }}
+            tick();
+        </script>
+    """, height=50)
+
+@st.fragment
+def show_board():
+    """
+    遊戲盤面：點擊卡片時只重新執行這個 fragment，不會重跑整個頁面。
+    時間到或全部配對完成時才觸發整頁重新執行以顯示結算畫面。
+    """
+    with metrics.profile_rerun("flash_card:board"):
+        render_board()
+
+def render_board():
+    state = game_state.get(GAME)
+    if state is None:
+        # 閒置過久被釋放，整頁重新執行以開始新的一局
+        st.rerun()
+    if not state.game_over and time.time() - state.start_time >= GAME_SECONDS:
+        state.game_over = True
+    if state.game_over:
+        st.rerun()
 
-    image_folder = os.path.join("image", "flash_card")
-    card_back_image_path = os.path.join(image_folder, "卡背.jpg")
+    st.metric(label="已配對", value=f"{state.matched_pairs} / {state.total_pairs} 組")
 
-    # 排版為4欄佈局
-    cols = st.columns(4)
-    for i, card_value in enumerate(st.session_state.game_board):
-        col = cols[i % 4]
+    # 所有卡片都是同一張合併圖的裁切 (未建置合併圖時逐張顯示)
+    num_columns = BOARD_COLUMNS if len(state.board) <= 16 else WIDE_BOARD_COLUMNS
+    cols = st.columns(num_columns)
+    for i in range(len(state.board)):
+        col = cols[i % num_columns]
         with col.container(border=True):
-            card_status = st.session_state.card_status[i]
-            
-            if card_status in ['flipped', 'matched']:
-                image_name = f"{card_value}.jpg"
-                current_image_path = os.path.join(image_folder, image_name)
-                st.image(current_image_path, use_container_width=True)
-            else: # hidden
-                st.image(card_back_image_path, use_container_width=True)
-            
-            is_disabled = (card_status != 'hidden')
-            
-            if st.button("翻開", key=f"card_{i}", use_container_width=True, disabled=is_disabled):
-                handle_card_click(i)
-                st.rerun()
-
-def initialize_game():
-    """初始化或重置遊戲"""
-    base_cards = ["1", "2", "3", "4", "5", "6", "7", "8"]
-    card_pairs = [f"{c}-1" for c in base_cards] + [f"{c}-2" for c in base_cards]
-    random.shuffle(card_pairs)
-
-    st.session_state.game_board = card_pairs
-    st.session_state.card_status = ['hidden'] * 16
-    st.session_state.flipped_indices = []
-    st.session_state.matched_pairs = 0
-    st.session_state.total_pairs = len(base_cards)
-    st.session_state.start_time = time.time()
-    st.session_state.game_started = True
-    st.session_state.game_over = False
-    st.session_state.reward_claimed = False
+            hidden = state.is_hidden(i)
+            ui_images.show_game_card("flash_card", "card_back" if hidden else state.card_name(i))
+            st.button("翻開", key=f"card_{i}", use_container_width=True, disabled=not hidden,
+                      on_click=handle_card_click, args=(i,))
+
+def new_game():
+    return FlashCardState(board_pairs())
+
+@lru_cache(maxsize=1)
+def board_pairs():
+    """資源索引中成對 (X-1 與 X-2 都存在) 的卡面編號，加入新卡面後盤面會自動變大"""
+    faces = asset_manifest.load_manifest()['games']['flash_card']['faces']
+    return tuple(name[:-2] for name in faces if name.endswith('-1') and f"{name[:-2]}-2" in faces)
 
 def handle_card_click(index):
     """處理卡片點擊事件"""
-    if len(st.session_state.flipped_indices) == 2:
-        idx1, idx2 = st.session_state.flipped_indices
-        if st.session_state.card_status[idx1] != 'matched':
-            st.session_state.card_status[idx1] = 'hidden'
-        if st.session_state.card_status[idx2] != 'matched':
-            st.session_state.card_status[idx2] = 'hidden'
-        st.session_state.flipped_indices = []
-
-    if st.session_state.card_status[index] == 'hidden':
-        st.session_state.card_status[index] = 'flipped'
-        st.session_state.flipped_indices.append(index)
-
-    if len(st.session_state.flipped_indices) == 2:
-        idx1, idx2 = st.session_state.flipped_indices
-        card1 = st.session_state.game_board[idx1]
-        card2 = st.session_state.game_board[idx2]
-        
-        if card1.split('-')[0] == card2.split('-')[0]: # 配對成功
-            st.session_state.card_status[idx1] = 'matched'
-            st.session_state.card_status[idx2] = 'matched'
-            st.session_state.matched_pairs += 1
-            st.session_state.flipped_indices = []
-
-            if st.session_state.matched_pairs == st.session_state.total_pairs:
-                st.session_state.game_over = True
-
-def reset_game_state():
-    """清除遊戲相關的 session state"""
-    keys_to_delete = [
-        'game_board', 'card_status', 'flipped_indices', 'matched_pairs', 'start_time',
-        'game_started', 'game_over', 'reward_claimed', 'total_pairs'
-    ]
-    for key in keys_to_delete:
-        if key in st.session_state:
-            del st.session_state[key]
\ No newline at end of file
+    state = game_state.get(GAME)
+    if state is None:
+        return
+    if time.time() - state.start_time >= GAME_SECONDS:
+        state.game_over = True
+        return
+    state.flip(index)
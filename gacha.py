@@ -1,197 +1,424 @@
 # gacha.py
 import streamlit as st
-import random
 import os
-from pathlib import Path
-from firebase_admin import firestore
+import threading
+from array import array
+from collections import Counter
+from functools import lru_cache
 import time
+import asset_manifest
+import event_log
+import game_state
+import leaderboard
+import ledger
+import metrics
+import pool_registry
+import static_assets
+import thumbnails
+import ui_images
+from storage import InsufficientPopcornError
+
+# 卡冊與抽卡結果格子用的縮圖寬度 (px)
+GRID_THUMB_WIDTH = 240
+# 已擁有卡片快取的存活時間 (秒)
+OWNED_CARDS_TTL = 600
+# 卡冊每頁顯示的卡片數與欄數
+COLLECTION_PAGE_SIZE = 24
+COLLECTION_COLUMNS = 6
+COLLECTION_RARITIES = ['SP', 'SSR', 'SR', 'R']
+# 大量抽卡的張數選項 (一次抽完、一次寫入)
+BULK_DRAW_SIZES = (50, 100)
+# 超過這個張數的抽卡結果改為依稀有度彙總，只顯示新卡與這些稀有度的卡圖
+SUMMARY_THRESHOLD = 10
+HIGHLIGHT_RARITIES = ('SP', 'SSR')
+GAME = 'gacha'
+# 抽卡遊戲的頁面
+MAIN_MENU, DRAW_PAGE, COLLECTION_PAGE = 'main_menu', 'draw_page', 'collection_page'
 
 # --- Helper Functions ---
 
-@st.cache_data
 def get_all_cards_in_pool(pool_name):
     """
-    掃描指定卡池的資料夾，獲取所有卡片的稀有度和路徑。
+    從資源索引取得指定卡池所有卡片的稀有度和路徑。
     """
-    base_path = Path(f"image/gacha/{pool_name}")
-    all_cards = {}
-    rarities = ['R', 'SR', 'SSR', 'SP']
-    
-    for rarity in rarities:
-        rarity_path = base_path / rarity
-        if rarity_path.is_dir():
-            all_cards[rarity] = sorted([p.as_posix() for p in rarity_path.glob('*.jpg')])
-            
-    # 獲取預設卡背
-    card_back_path = base_path / "卡背.jpg"
-    if card_back_path.exists():
-        all_cards['card_back'] = card_back_path.as_posix()
-    else:
-        all_cards['card_back'] = None 
-    
-    # --- 【新增】獲取 R 卡的專屬卡背 ---
-    r_card_back_path = base_path / "R" / "卡背2.jpg"
-    if r_card_back_path.exists():
-        all_cards['R_card_back'] = r_card_back_path.as_posix()
-    else:
-        all_cards['R_card_back'] = None
+    return asset_manifest.pool_cards(pool_name)
 
-    return all_cards
+def card_id(card_path):
+    """圖片路徑 -> 卡片編號 (例如 'SSR-12')，路徑的上一層資料夾就是稀有度"""
+    return asset_manifest.card_id_for(card_rarity(card_path), card_path)
 
-def save_cards_to_db(username, drawn_cards, db):
-    """將抽到的卡片儲存到使用者的 Firestore subcollection 中"""
-    if not drawn_cards:
-        return
-    
-    user_ref = db.collection('users').document(username)
-    
-    for card_path in drawn_cards:
-        doc_id = card_path.replace('/', '_').replace('\\', '_')
-        card_ref = user_ref.collection('cards').document(doc_id)
-        card_ref.set({'path': card_path, 'count': firestore.Increment(1)}, merge=True)
+def card_rarity(card_path):
+    return os.path.basename(os.path.dirname(card_path))
+
+@lru_cache(maxsize=None)
+def pool_card_index(pool_name):
+    """卡池內所有卡片的固定順序 (卡片路徑 tuple, {路徑: 序號})，抽卡結果以序號保存"""
+    pool_data = get_all_cards_in_pool(pool_name)
+    cards = tuple(card for rarity in asset_manifest.RARITIES for card in pool_data.get(rarity) or [])
+    return cards, {card: i for i, card in enumerate(cards)}
+
+def get_pool_config(pool_name):
+    """目前的卡池設定 (pools.toml 修改後自動更新)，沒有此卡池時回傳 None"""
+    return pool_registry.get_registry().get(pool_name)
+
+@st.dialog("🔍 卡片檢視", width="large")
+def show_card_dialog(card_path):
+    """點開卡片時才載入原尺寸圖片"""
+    ui_images.show_image(card_path, use_container_width=True)
+
+def show_card_thumbnail(card_path, key, caption=None):
+    """在格子中顯示縮圖，並提供按鈕開啟原圖"""
+    ui_images.show_image(thumbnails.thumbnail_for(card_path, GRID_THUMB_WIDTH), caption=caption, use_container_width=True)
+    if st.button("🔍", key=key, use_container_width=True):
+        show_card_dialog(card_path)
+
+class GachaState:
+    """
+    抽卡遊戲的頁面狀態。最近一次的抽卡結果與其中的新卡以卡池內的卡片序號 (array('H')) 保存，
+    new_cards 為 None 表示讀不到抽卡前的卡冊、不標示新卡。
+    """
+    __slots__ = ('page', 'pool', 'collection_pool', 'results', 'new_cards', 'pages')
+
+    def __init__(self):
+        self.page = MAIN_MENU
+        self.pool = None             # 抽卡頁的卡池
+        self.collection_pool = None  # 卡冊頁的卡池
+        self.results = None
+        self.new_cards = None
+        self.pages = {}              # 卡冊分頁 -> 目前頁數
+
+    def save_results(self, pool_name, cards, new_cards):
+        _, index = pool_card_index(pool_name)
+        self.pool = pool_name
+        self.results = array('H', [index[card] for card in cards])
+        self.new_cards = None if new_cards is None else array('H', [index[card] for card in new_cards])
+
+    def clear_results(self):
+        self.results = None
+        self.new_cards = None
+
+    def last_results(self):
+        """最近一次抽卡結果的卡片路徑，沒有時回傳 None"""
+        if self.results is None:
+            return None
+        cards, _ = pool_card_index(self.pool)
+        return [cards[i] for i in self.results]
+
+    def last_new_cards(self):
+        if self.new_cards is None:
+            return None
+        cards, _ = pool_card_index(self.pool)
+        return [cards[i] for i in self.new_cards]
+
+def get_state():
+    return game_state.get(GAME, GachaState)
+
+class OwnedCardsCache:
+    """
+    每位使用者已擁有卡片 {path: count} 的快取，所有 session 共用。
+    抽卡成功後由 perform_draw 直接更新內容，過期或登出時才會重新讀取資料庫。
+    """
+    def __init__(self, ttl=OWNED_CARDS_TTL):
+        self.ttl = ttl
+        self._entries = {}  # username -> (到期時間, {path: count})
+        self._lock = threading.Lock()
+
+    def get(self, username, loader):
+        """取得快取內容，沒有或已過期時呼叫 loader() 重新讀取"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry and entry[0] > now:
+                return dict(entry[1])
+        owned_cards = loader()
+        with self._lock:
+            self._entries[username] = (now + self.ttl, dict(owned_cards))
+        return owned_cards
+
+    def apply_draw(self, username, drawn_cards):
+        """抽卡寫入成功後更新快取 (write-through)，尚未載入過的使用者不處理"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return
+            for card_path in drawn_cards:
+                entry[1][card_path] = entry[1].get(card_path, 0) + 1
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+@st.cache_resource
+def owned_cards_cache():
+    """整個 process 共用同一份已擁有卡片快取"""
+    return OwnedCardsCache()
+
+def load_owned_cards(username, store):
+    """從資料庫讀取使用者所有卡片"""
+    return store.read_owned_cards(username)
 
 # --- Core Game Logic ---
 
-def perform_draw(pool_name, num_draws, username, current_popcorn, db_update_func, db):
-    """執行抽卡邏輯，包含機率計算和保底"""
-    cost = num_draws * 10
+def perform_draw(pool_name, num_draws, username, current_popcorn, store):
+    """
+    執行抽卡邏輯，機率、保底與價格依卡池設定。
+    不論張數都只抽樣一次、寫入一次 (每 10 張各自保底)。
+    回傳 (抽到的卡片, 其中的新卡)，失敗時回傳 None；讀不到抽卡前的卡冊時新卡為 None。
+    """
+    pool = get_pool_config(pool_name)
+    # 畫面顯示後卡池可能已關閉，抽卡前再確認一次
+    if pool is None or not pool.is_open():
+        st.error(pool.status_text() if pool else f"找不到卡池 {pool_name}。")
+        return None
+    cost = pool.cost(num_draws)
+    # 先用畫面上的餘額快速檢查，真正的扣款檢查在 store.commit_draw 的交易中
     if current_popcorn < cost:
         st.error(f"爆米花不足！本次抽卡需要 {cost} 🍿，您只有 {current_popcorn} 🍿。")
         return None
 
-    db_update_func(username, -cost)
+    try:
+        sampler = pool.sampler()
+        drawn_cards, guaranteed = sampler.draw_detailed(num_draws)
+    except ValueError as e:
+        st.error(f"卡池 {pool_name} 無法抽卡: {e}")
+        return None
+
+    try:
+        owned_before = owned_cards_cache().get(username, lambda: load_owned_cards(username, store))
+    except Exception:
+        owned_before = None  # 讀不到時不標示新卡
+
+    try:
+        # 先把帳本中累積的爆米花變動寫入，交易中讀到的才是最新餘額
+        ledger.get_ledger(store).flush(username)
+        new_balance = store.commit_draw(username, cost, drawn_cards)
+    except InsufficientPopcornError as e:
+        st.session_state.popcorn = e.balance
+        st.error(f"爆米花不足！本次抽卡需要 {cost} 🍿，您只有 {e.balance} 🍿。")
+        return None
+    except Exception as e:
+        st.error(f"抽卡失敗，爆米花未扣除: {e}")
+        return None
+
+    st.session_state.popcorn = new_balance
+    new_cards = None if owned_before is None else sorted({card for card in drawn_cards if owned_before.get(card, 0) <= 0})
+    owned_cards_cache().apply_draw(username, drawn_cards)
+    event_log.log('draw', username, p=pool_name, n=num_draws, c=[card_id(card_path) for card_path in drawn_cards],
+                  g=guaranteed, b=sampler.block_size(num_draws), cost=cost, bal=new_balance)
+    update_leaderboards(username, pool_name, store)
+    # 停頓期間讓瀏覽器先下載結果的縮圖，重新執行後直接從快取顯示
+    ui_images.prefetch_images(thumbnails.thumbnail_for(card_path, GRID_THUMB_WIDTH) for card_path in drawn_cards)
     st.success(f"已消耗 {cost} 爆米花...")
-    time.sleep(1)
-
-    pool_cards = get_all_cards_in_pool(pool_name)
-    probabilities = {'R': 80, 'SR': 15, 'SSR': 4, 'SP': 1}
-    rarities = list(probabilities.keys())
-    weights = list(probabilities.values())
-    
-    drawn_cards = []
-    
-    def draw_one_card(custom_rarities=None, custom_weights=None):
-        r_list = custom_rarities or rarities
-        w_list = custom_weights or weights
-        chosen_rarity = random.choices(r_list, weights=w_list, k=1)[0]
-        if pool_cards.get(chosen_rarity) and pool_cards[chosen_rarity]:
-            return random.choice(pool_cards[chosen_rarity])
-        else:
-            st.warning(f"警告：找不到稀有度為 {chosen_rarity} 的卡片，將重新抽取...")
-            return draw_one_card(r_list, w_list)
+    with metrics.span("gacha:pause"):
+        time.sleep(1)
+    return drawn_cards, new_cards
 
-    if num_draws == 10:
-        guaranteed_rarity = random.choices(['SR', 'SSR', 'SP'], weights=[80, 17, 3], k=1)[0]
-        if pool_cards.get(guaranteed_rarity) and pool_cards[guaranteed_rarity]:
-            drawn_cards.append(random.choice(pool_cards[guaranteed_rarity]))
-        else:
-             st.warning(f"警告：找不到保底稀有度 {guaranteed_rarity} 的卡片，將改為普通抽卡...")
-             drawn_cards.append(draw_one_card())
-        
-        for _ in range(9):
-            drawn_cards.append(draw_one_card())
-    else:
-        for _ in range(num_draws):
-            drawn_cards.append(draw_one_card())
-            
-    random.shuffle(drawn_cards)
-    save_cards_to_db(username, drawn_cards, db)
-    return drawn_cards
+def update_leaderboards(username, pool_name, store):
+    """
+    抽卡成功後更新爆米花與該卡池收集進度的排行榜 (失敗不影響抽卡結果)。
+    餘額與刪除中標記以重新讀取的使用者資料為準，與帳本執行緒的更新依讀取時間排序。
+    """
+    try:
+        owned_cards = owned_cards_cache().get(username, lambda: load_owned_cards(username, store))
+        summary = collection_summary(get_all_cards_in_pool(pool_name), owned_cards)
+        leaderboard.get_service(store).refresh_user(username, {pool_name: summary})
+    except Exception as e:
+        print(f"[leaderboard] 更新 {username} 的排行榜失敗: {e}")
 
 # --- UI Functions ---
 
-def show_draw_page(pool_name, username, current_popcorn, db_update_func, db):
+def show_draw_page(pool_name, username, current_popcorn, store):
     st.header(f"卡池: {pool_name}")
     if st.button("⬅️ 返回卡池選擇"):
-        st.session_state.gacha_page = 'main_menu'
+        get_state().page = MAIN_MENU
         st.rerun()
     st.markdown("---")
-    if st.session_state.get('last_draw_results'):
+    pool = get_pool_config(pool_name)
+    if pool is None or not pool.is_open():
+        st.warning(pool.status_text() if pool else f"找不到卡池 {pool_name}。")
+        return
+    results = get_state().last_results()
+    if results:
         st.subheader("🎉 抽卡結果 🎉")
-        cols = st.columns(5)
-        results = st.session_state.last_draw_results
-        for i, card_path in enumerate(results):
-            with cols[i % 5]:
-                st.image(card_path, use_container_width=True)
-        st.session_state.last_draw_results = None
+        if len(results) > SUMMARY_THRESHOLD:
+            show_draw_summary(results, get_state().last_new_cards())
+        else:
+            cols = st.columns(5)
+            for i, card_path in enumerate(results):
+                with cols[i % 5]:
+                    show_card_thumbnail(card_path, key=f"draw_result_{i}")
         st.markdown("---")
-    st.info(f"每次抽卡消耗 10 🍿，十連抽消耗 100 🍿。")
+    st.info(f"每次抽卡消耗 {pool.cost(1)} 🍿，十連抽消耗 {pool.cost(10)} 🍿。")
     col1, col2 = st.columns(2)
     with col1:
         if st.button("抽一次", use_container_width=True):
-            results = perform_draw(pool_name, 1, username, current_popcorn, db_update_func, db)
-            if results:
-                st.session_state.last_draw_results = results
-                st.rerun()
+            draw_and_rerun(pool_name, 1, username, current_popcorn, store)
     with col2:
-        if st.button("十連抽 (保底 SR 以上！)", use_container_width=True, type="primary"):
-            results = perform_draw(pool_name, 10, username, current_popcorn, db_update_func, db)
-            if results:
-                st.session_state.last_draw_results = results
-                st.rerun()
+        ten_pull_label = "十連抽 (保底 SR 以上！)" if 0 < pool.guarantee_block <= 10 else "十連抽"
+        if st.button(ten_pull_label, use_container_width=True, type="primary"):
+            draw_and_rerun(pool_name, 10, username, current_popcorn, store)
+    # 大量抽卡：一次請求完成，效果等同連續多次十連抽
+    cols = st.columns(len(BULK_DRAW_SIZES))
+    for col, size in zip(cols, BULK_DRAW_SIZES):
+        if col.button(f"{size} 連抽 ({pool.cost(size)} 🍿)", key=f"bulk_draw_{size}", use_container_width=True):
+            draw_and_rerun(pool_name, size, username, current_popcorn, store)
+
+def draw_and_rerun(pool_name, num_draws, username, current_popcorn, store):
+    drawn = perform_draw(pool_name, num_draws, username, current_popcorn, store)
+    if drawn:
+        get_state().save_results(pool_name, *drawn)
+        st.rerun()
+
+def show_draw_summary(results, new_cards):
+    """
+    大量抽卡的結果：各稀有度的張數與種類數，卡圖只顯示新卡與 SP / SSR (同一張卡只顯示一次並標示張數)。
+    new_cards 為 None 時 (讀不到抽卡前的卡冊) 不標示新卡。
+    """
+    counts = Counter(results)
+    new_cards = set(new_cards or [])
+    by_rarity = {}
+    for card_path, count in counts.items():
+        by_rarity.setdefault(card_rarity(card_path), []).append((card_path, count))
+
+    cols = st.columns(len(COLLECTION_RARITIES))
+    for col, rarity in zip(cols, COLLECTION_RARITIES):
+        cards = by_rarity.get(rarity, [])
+        col.metric(rarity, f"{sum(count for _, count in cards)} 張", f"{len(cards)} 種", delta_color="off")
+    if new_cards:
+        st.success(f"🆕 獲得 {len(new_cards)} 張新卡！")
+
+    highlights = []
+    for rarity in COLLECTION_RARITIES:
+        for card_path, count in sorted(by_rarity.get(rarity, [])):
+            if card_path in new_cards or rarity in HIGHLIGHT_RARITIES:
+                highlights.append((card_path, f"{'🆕 ' if card_path in new_cards else ''}{rarity} x{count}"))
+    if not highlights:
+        st.caption("這次沒有新卡或 SSR 以上的卡片，所有卡片都已收入卡冊。")
+        return
+    shown = sum(counts[card_path] for card_path, _ in highlights)
+    if shown < len(results):
+        st.caption(f"其餘 {len(results) - shown} 張重複的卡片已收入卡冊。")
+    if static_assets.serving_enabled():
+        ui_images.lazy_image_grid([(static_assets.url_for(thumbnails.thumbnail_for(card_path, GRID_THUMB_WIDTH)),
+                                    caption, static_assets.url_for(card_path)) for card_path, caption in highlights])
+        return
+    cols = st.columns(COLLECTION_COLUMNS)
+    for i, (card_path, caption) in enumerate(highlights):
+        with cols[i % COLLECTION_COLUMNS]:
+            show_card_thumbnail(card_path, key=f"draw_highlight_{i}", caption=caption)
 
-def show_collection_page(username, db):
+def show_collection_page(username, store):
     st.header("📚 我的卡冊")
+    state = get_state()
     if st.button("⬅️ 返回抽卡主選單"):
-        st.session_state.gacha_page = 'main_menu'
-        st.session_state.collection_selected_pool = None
+        state.page = MAIN_MENU
+        state.collection_pool = None
         st.rerun()
 
-    if st.session_state.collection_selected_pool is None:
+    if state.collection_pool is None:
         st.subheader("請選擇要查看的卡池")
-        pool_names = ["春日記憶"]
+        # 已開放或已結束的卡池都可以查看收集進度
+        pool_names = [pool.name for pool in pool_registry.get_registry().pools()
+                      if pool.status() in (pool_registry.OPEN, pool_registry.ENDED)]
         for pool in pool_names:
             if st.button(pool, use_container_width=True):
-                st.session_state.collection_selected_pool = pool
+                state.collection_pool = pool
                 st.rerun()
     else:
-        selected_pool = st.session_state.collection_selected_pool
+        selected_pool = state.collection_pool
         if st.button(f"⬅️ 返回卡冊主頁"):
-            st.session_state.collection_selected_pool = None
+            state.collection_pool = None
             st.rerun()
         st.subheader(f"卡池: {selected_pool}")
-        show_owned_only = st.checkbox("✅ 僅顯示已擁有", key=f"filter_{selected_pool}")
-        
+
         pool_data = get_all_cards_in_pool(selected_pool)
         try:
-            cards_ref = db.collection('users').document(username).collection('cards').stream()
-            owned_cards = {doc.to_dict()['path']: doc.to_dict()['count'] for doc in cards_ref}
+            owned_cards = owned_cards_cache().get(username, lambda: load_owned_cards(username, store))
         except Exception as e:
             st.error(f"讀取卡冊資料失敗: {e}")
             return
-        
-        default_card_back = pool_data.get('card_back')
-        r_card_back = pool_data.get('R_card_back')
-
-        rarities_to_show = ['SP', 'SSR', 'SR', 'R']
-        for rarity in rarities_to_show:
-            if pool_data.get(rarity):
-                cards_in_rarity = pool_data[rarity]
-                owned_in_rarity = [card for card in cards_in_rarity if card in owned_cards]
-                if show_owned_only and not owned_in_rarity:
-                    continue
-                st.markdown(f"**{rarity} ({len(owned_in_rarity)} / {len(cards_in_rarity)})**")
-                cols = st.columns(6)
-                col_index = 0
-                for card_path in cards_in_rarity:
-                    count = owned_cards.get(card_path, 0)
-                    if show_owned_only and count == 0:
-                        continue
-                    with cols[col_index % 6]:
-                        if count > 0:
-                            st.image(card_path, caption=f"擁有: {count}", use_container_width=True)
-                        else:
-                            # --- 【核心修改】判斷 R 卡並使用不同的卡背 ---
-                            if rarity == 'R' and r_card_back:
-                                st.image(r_card_back, caption="未擁有", use_container_width=True)
-                            elif default_card_back:
-                                st.image(default_card_back, caption="未擁有", use_container_width=True)
-                            else:
-                                st.caption("卡背遺失")
-                    col_index += 1
+
+        # 各稀有度的收集進度 (只計算數量，不顯示圖片)
+        summary = collection_summary(pool_data, owned_cards)
+        cols = st.columns(len(summary) or 1)
+        for col, (rarity, (owned, total)) in zip(cols, summary.items()):
+            col.metric(rarity, f"{owned} / {total}")
+        if not summary:
+            st.info("此卡池沒有卡片。")
+            return
+
+        c1, c2 = st.columns([3, 1])
+        rarity = c1.radio("稀有度", list(summary), horizontal=True, key=f"collection_rarity_{selected_pool}")
+        show_owned_only = c2.checkbox("✅ 僅顯示已擁有", key=f"filter_{selected_pool}")
+
+        entries = collection_entries(pool_data, owned_cards, rarity, show_owned_only)
+        if not entries:
+            st.info("還沒有這個稀有度的卡片。")
+            return
+        page_entries = show_pagination(len(entries), key=f"collection_page_{selected_pool}_{rarity}_{show_owned_only}")
+        show_collection_grid([entries[i] for i in page_entries], pool_data, rarity)
         st.markdown("---")
 
-def show_main_menu(username, db):
+def collection_summary(pool_data, owned_cards):
+    """{稀有度: (已擁有種類數, 總數)}，依 SP、SSR、SR、R 排序，略過沒有卡片的稀有度"""
+    summary = {}
+    for rarity in COLLECTION_RARITIES:
+        cards = pool_data.get(rarity) or []
+        if cards:
+            summary[rarity] = (sum(1 for card in cards if owned_cards.get(card, 0) > 0), len(cards))
+    return summary
+
+def collection_entries(pool_data, owned_cards, rarity, owned_only=False):
+    """指定稀有度的 [(卡片路徑, 擁有張數)]"""
+    entries = [(card, owned_cards.get(card, 0)) for card in pool_data.get(rarity) or []]
+    if owned_only:
+        entries = [(card, count) for card, count in entries if count > 0]
+    return entries
+
+def show_pagination(total, key, page_size=None):
+    """顯示上一頁/下一頁，回傳本頁的索引範圍"""
+    page_size = page_size or COLLECTION_PAGE_SIZE
+    num_pages = max(1, -(-total // page_size))
+    pages = get_state().pages
+    page = min(pages.get(key, 0), num_pages - 1)
+    if num_pages > 1:
+        c1, c2, c3 = st.columns([1, 2, 1])
+        if c1.button("⬅️ 上一頁", key=f"{key}_prev", disabled=page == 0, use_container_width=True):
+            page -= 1
+        if c3.button("下一頁 ➡️", key=f"{key}_next", disabled=page >= num_pages - 1, use_container_width=True):
+            page += 1
+        c2.markdown(f"<div style='text-align: center;'>第 {page + 1} / {num_pages} 頁</div>", unsafe_allow_html=True)
+    pages[key] = page
+    return range(page * page_size, min(total, (page + 1) * page_size))
+
+def show_collection_grid(entries, pool_data, rarity):
+    """
+    顯示一頁卡片。有靜態網址時以 HTML 格子延遲載入 (點擊開啟原圖)，
+    否則退回 Streamlit 元件 (每張卡附放大按鈕)。
+    """
+    card_back = pool_data.get('R_card_back') if rarity == 'R' and pool_data.get('R_card_back') else pool_data.get('card_back')
+    if static_assets.serving_enabled():
+        items = []
+        for card_path, count in entries:
+            if count > 0:
+                items.append((static_assets.url_for(thumbnails.thumbnail_for(card_path, GRID_THUMB_WIDTH)),
+                              f"擁有: {count}", static_assets.url_for(card_path)))
+            elif card_back:
+                items.append((static_assets.url_for(thumbnails.thumbnail_for(card_back, GRID_THUMB_WIDTH)), "未擁有", None))
+        ui_images.lazy_image_grid(items)
+        return
+
+    cols = st.columns(COLLECTION_COLUMNS)
+    for i, (card_path, count) in enumerate(entries):
+        with cols[i % COLLECTION_COLUMNS]:
+            if count > 0:
+                show_card_thumbnail(card_path, key=f"open_{card_path}", caption=f"擁有: {count}")
+            elif card_back:
+                ui_images.show_image(thumbnails.thumbnail_for(card_back, GRID_THUMB_WIDTH), caption="未擁有", use_container_width=True)
+            else:
+                st.caption("卡背遺失")
+
+def show_main_menu(username, store):
     st.header("🎁 卡池選擇")
     if st.button("⬅️ 返回遊戲大廳"):
         st.session_state.page = "主頁"
@@ -199,39 +426,40 @@ def show_main_menu(username, db):
         return
     st.markdown("---")
     if st.button("📚 查看我的卡冊"):
-        st.session_state.gacha_page = 'collection_page'
-        st.session_state.collection_selected_pool = None
+        state = get_state()
+        state.page = COLLECTION_PAGE
+        state.collection_pool = None
         st.rerun()
     st.markdown("---")
-    pools = ["春日記憶", "夏日記憶", "秋日記憶", "冬日記憶"]
+    pools = pool_registry.get_registry().pools()
+    if not pools:
+        st.info("目前沒有任何卡池。")
+        return
     cols = st.columns(len(pools))
-    for i, pool_name in enumerate(pools):
+    for i, pool in enumerate(pools):
         with cols[i]:
-            pool_image_path = Path(f"image/gacha/{pool_name}/卡池封面.jpg")
-            if pool_image_path.exists():
-                st.image(pool_image_path.as_posix(), use_container_width=True)
-            if st.button(pool_name, key=pool_name, use_container_width=True):
-                if pool_name == "春日記憶":
-                    st.session_state.gacha_page = 'draw_page'
-                    st.session_state.selected_pool = pool_name
-                    st.session_state.last_draw_results = None
+            pool_image_path = asset_manifest.pool_cover(pool.name)
+            if pool_image_path:
+                ui_images.show_image(pool_image_path, use_container_width=True)
+            if st.button(pool.name, key=pool.name, use_container_width=True):
+                if pool.is_open():
+                    state = get_state()
+                    state.page = DRAW_PAGE
+                    state.pool = pool.name
+                    state.clear_results()
                     st.rerun()
                 else:
-                    st.warning("此卡池正在開發中，敬請期待！")
+                    st.warning(pool.status_text())
 
 def start_game(username, db_update_func):
     st.title("🎰 抽卡遊戲")
-    db = st.session_state['db']
+    store = st.session_state['storage']
     current_popcorn = st.session_state.get('popcorn', 0)
-    
-    if 'gacha_page' not in st.session_state:
-        st.session_state.gacha_page = 'main_menu'
-    if 'collection_selected_pool' not in st.session_state:
-        st.session_state.collection_selected_pool = None
-
-    if st.session_state.gacha_page == 'main_menu':
-        show_main_menu(username, db)
-    elif st.session_state.gacha_page == 'draw_page':
-        show_draw_page(st.session_state.selected_pool, username, current_popcorn, db_update_func, db)
-    elif st.session_state.gacha_page == 'collection_page':
-        show_collection_page(username, db)
\ No newline at end of file
+    state = get_state()
+
+    if state.page == MAIN_MENU:
+        show_main_menu(username, store)
+    elif state.page == DRAW_PAGE:
+        show_draw_page(state.pool, username, current_popcorn, store)
+    elif state.page == COLLECTION_PAGE:
+        show_collection_page(username, store)
\ No newline at end of file
@@ -0,0 +1,170 @@
+# gacha_engine.py
+# 不依賴 Streamlit 的抽卡引擎：可用於頁面抽卡，也可大量模擬以驗證公告機率。
+#   python gacha_engine.py audit --pool 春日記憶 --pulls 1000000
+import argparse
+
+import numpy as np
+
+RARITIES = ['R', 'SR', 'SSR', 'SP']
+DEFAULT_RATES = {'R': 80, 'SR': 15, 'SSR': 4, 'SP': 1}
+# 十連抽保底：每 10 抽中有 1 張從 SR 以上抽出
+GUARANTEE_RATES = {'SR': 80, 'SSR': 17, 'SP': 3}
+GUARANTEE_BLOCK = 10
+
+class AliasTable:
+    """Vose alias method：建表 O(n)，每次抽樣 O(1)"""
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or len(weights) == 0 or weights.sum() <= 0:
+            raise ValueError("權重必須是非空且總和大於 0 的一維陣列")
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        # 迴圈結束後仍未配對的項目 (只差浮點誤差) 機率視為 1
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        self.prob = prob
+        self.alias = alias
+        self.size = n
+
+    def sample(self, rng, size):
+        """一次抽出 size 個索引 (np.ndarray)"""
+        columns = rng.integers(0, self.size, size=size)
+        keep = rng.random(size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
+
+class PoolSampler:
+    """
+    單一卡池的抽樣器。建立時先把每張卡的機率 (稀有度機率 / 該稀有度卡片數) 編成 alias table。
+    沒有卡片的稀有度不會被抽到，其機率依比例分配給其他稀有度。
+    """
+    def __init__(self, cards_by_rarity, rates=None, guarantee_rates=None, guarantee_block=GUARANTEE_BLOCK):
+        rates = rates or DEFAULT_RATES
+        guarantee_rates = guarantee_rates or GUARANTEE_RATES
+        self.cards = []
+        rarity_index = []
+        for i, rarity in enumerate(RARITIES):
+            paths = cards_by_rarity.get(rarity) or []
+            self.cards.extend(paths)
+            rarity_index.extend([i] * len(paths))
+        if not self.cards:
+            raise ValueError("卡池中沒有任何卡片")
+        self.card_rarity = np.asarray(rarity_index, dtype=np.int8)
+        self.guarantee_block = guarantee_block
+        self.normal_weights = self._card_weights(cards_by_rarity, rates)
+        self.normal_table = AliasTable(self.normal_weights)
+        guarantee_weights = self._card_weights(cards_by_rarity, guarantee_rates)
+        # 保底稀有度都沒有卡片時，改用一般機率 (與舊版行為相同)
+        self.guarantee_weights = guarantee_weights if guarantee_weights.sum() > 0 else self.normal_weights
+        self.guarantee_table = AliasTable(self.guarantee_weights)
+
+    def _card_weights(self, cards_by_rarity, rates):
+        weights = []
+        for rarity in RARITIES:
+            paths = cards_by_rarity.get(rarity) or []
+            if paths:
+                weights.extend([rates.get(rarity, 0) / len(paths)] * len(paths))
+        return np.asarray(weights, dtype=np.float64)
+
+    def guarantees_for(self, num_draws):
+        """一次抽 num_draws 張時有幾張保底"""
+        return num_draws // self.guarantee_block if self.guarantee_block else 0
+
+    def block_size(self, num_draws):
+        """draw_detailed 每個保底區塊的張數 (抽的張數不到一個區塊時整次為一個區塊)"""
+        return self.guarantee_block if 0 < self.guarantee_block <= num_draws else num_draws
+
+    def sample_batch(self, num_pulls, pull_size, rng=None):
+        """
+        模擬 num_pulls 次、每次 pull_size 張的抽卡，回傳 (num_pulls, pull_size) 的卡片索引陣列。
+        每次抽卡的前幾張為保底卡 (順序不影響統計)。
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        draws = self.normal_table.sample(rng, (num_pulls, pull_size))
+        guaranteed = self.guarantees_for(pull_size)
+        if guaranteed:
+            draws[:, :guaranteed] = self.guarantee_table.sample(rng, (num_pulls, guaranteed))
+        return draws
+
+    def draw(self, num_draws, rng=None):
+        """頁面用：抽 num_draws 張卡，回傳打亂順序後的圖片路徑列表"""
+        return self.draw_detailed(num_draws, rng)[0]
+
+    def draw_detailed(self, num_draws, rng=None):
+        """
+        同 draw，另外回傳保底卡在結果中的位置 (事件紀錄用)。
+        大量抽卡 (例如 100 抽) 時一次抽出所有區塊，每 guarantee_block 張為一個區塊各自保底，
+        與連續抽十連的機率相同；結果依區塊排列，區塊內順序打亂。
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        block = self.block_size(num_draws)
+        full_blocks, rest = divmod(num_draws, block)
+        indices, guaranteed = [], []
+        for pulls, size in ((full_blocks, block), (1 if rest else 0, rest)):
+            if not pulls:
+                continue
+            order = rng.permuted(np.tile(np.arange(size), (pulls, 1)), axis=1)
+            draws = np.take_along_axis(self.sample_batch(pulls, size, rng), order, axis=1)
+            marks = np.flatnonzero((order < self.guarantees_for(size)).ravel())
+            guaranteed.extend((marks + len(indices)).tolist())
+            indices.extend(draws.ravel().tolist())
+        return [self.cards[i] for i in indices], guaranteed
+
+    def rarities_of(self, indices):
+        """卡片索引 -> 稀有度索引 (對應 RARITIES)"""
+        return self.card_rarity[indices]
+
+    def expected_rarity_rates(self, pull_size):
+        """理論上每個稀有度在一次 pull_size 抽中的平均比例"""
+        guaranteed = self.guarantees_for(pull_size)
+        normal = np.bincount(self.card_rarity, self.normal_weights / self.normal_weights.sum(), len(RARITIES))
+        special = np.bincount(self.card_rarity, self.guarantee_weights / self.guarantee_weights.sum(), len(RARITIES))
+        return (normal * (pull_size - guaranteed) + special * guaranteed) / pull_size
+
+def audit(sampler, num_pulls, pull_size, seed=None, chunk=1_000_000):
+    """大量模擬抽卡，回傳各稀有度的觀察比例與理論比例"""
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(len(RARITIES), dtype=np.int64)
+    remaining = num_pulls
+    while remaining > 0:
+        pulls = min(remaining, max(1, chunk // pull_size))
+        draws = sampler.sample_batch(pulls, pull_size, rng)
+        counts += np.bincount(sampler.rarities_of(draws).ravel(), minlength=len(RARITIES))
+        remaining -= pulls
+    observed = counts / counts.sum()
+    return observed, sampler.expected_rarity_rates(pull_size)
+
+# --- CLI ---
+
+def main(argv=None):
+    import pool_registry
+
+    parser = argparse.ArgumentParser(description="抽卡機率模擬與驗證")
+    sub = parser.add_subparsers(dest='command', required=True)
+    audit_parser = sub.add_parser('audit', help="大量模擬抽卡並比對各稀有度機率")
+    audit_parser.add_argument('--pool', default="春日記憶", help="卡池名稱")
+    audit_parser.add_argument('--pulls', type=int, default=1_000_000, help="模擬抽卡次數")
+    audit_parser.add_argument('--size', type=int, default=10, help="每次抽幾張 (1 或 10)")
+    audit_parser.add_argument('--seed', type=int, default=None, help="亂數種子")
+    args = parser.parse_args(argv)
+
+    # 使用 pools.toml 中的機率與保底設定
+    pool = pool_registry.get_registry().get(args.pool)
+    if pool is None:
+        parser.error(f"pools.toml 中沒有卡池 {args.pool}")
+    sampler = pool.sampler()
+    observed, expected = audit(sampler, args.pulls, args.size, args.seed)
+    print(f"卡池 {args.pool}：模擬 {args.pulls:,} 次 x {args.size} 抽")
+    print(f"{'稀有度':<6}{'觀察':>10}{'理論':>10}")
+    for rarity, obs, exp in zip(RARITIES, observed, expected):
+        print(f"{rarity:<8}{obs:>10.4%}{exp:>10.4%}")
+
+if __name__ == "__main__":
+    main()
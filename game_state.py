@@ -0,0 +1,184 @@
+# game_state.py
+# 各遊戲的 session 狀態：
+#
+# - 每個遊戲的狀態是一個 __slots__ 物件 (定義在各遊戲模組)，盤面以小整數與位元遮罩表示，
+#   全部放在 st.session_state[STATE_KEY] 這個 dict 中 (遊戲名稱 -> 狀態物件)。
+# - reset() 是唯一的重置入口：結束一局、登出、刪除帳號都經由這裡清除遊戲狀態。
+# - SessionTracker 記錄每個 session 最後一次使用遊戲狀態的時間，背景執行緒定期釋放
+#   閒置超過 session_idle_timeout 秒的遊戲狀態；玩家之後回來時遊戲從頭開始。
+#   tracker 只以弱參照指向各 session 的狀態，session 關閉後狀態照常被回收，
+#   下一次掃描時移除；session_idle_timeout 為 0 (不釋放) 時完全不追蹤。
+# - memory_report() 估算每個 session 的遊戲狀態大小 (除錯面板與 load_test 使用)。
+import atexit
+import sys
+import threading
+import time
+import weakref
+
+import config
+
+STATE_KEY = 'game_states'
+DEFAULT_IDLE_TIMEOUT = 1800   # 秒，0 表示不釋放
+SWEEP_INTERVAL = 60.0         # 秒
+
+# --- Bitmask Helpers ---
+
+def has_bit(mask, i):
+    return (mask >> i) & 1 == 1
+
+def set_bit(mask, i):
+    return mask | (1 << i)
+
+def clear_bit(mask, i):
+    return mask & ~(1 << i)
+
+# --- Memory Estimate ---
+
+def deep_sizeof(obj, seen=None):
+    """物件與其內容 (容器元素、__slots__ 屬性) 的大小估算 (bytes)，同一個物件只算一次"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    else:
+        for name in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), seen)
+    return size
+
+# --- Idle Session Tracker ---
+
+class GameStates(dict):
+    """一個 session 的遊戲狀態 {遊戲名稱: 狀態物件} (dict 子類別才能被弱參照)"""
+
+class SessionTracker:
+    """各 session 的遊戲狀態 (弱參照) 與最後使用時間 (整個 process 共用)"""
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, sweep_interval=SWEEP_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sessions = {}   # session_id -> (最後使用時間, GameStates 的弱參照)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.idle_timeout > 0
+
+    def touch(self, session_id, states):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), weakref.ref(states))
+
+    def evict_idle(self, now=None):
+        """
+        釋放閒置超過 idle_timeout 秒的 session 的遊戲狀態，回傳釋放的 session 數。
+        已關閉的 session (狀態已被回收) 不論閒置多久都在這時移除。
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            closed = [session_id for session_id, (_, ref) in self._sessions.items() if ref() is None]
+            for session_id in closed:
+                del self._sessions[session_id]
+            idle = [session_id for session_id, (last_seen, _) in self._sessions.items()
+                    if now - last_seen > self.idle_timeout]
+            evicted = [self._sessions.pop(session_id)[1]() for session_id in idle]
+        evicted = [states for states in evicted if states is not None]
+        for states in evicted:
+            states.clear()
+        return len(evicted)
+
+    def report(self):
+        """[{'session', 'idle_s', 'games': {遊戲: bytes}, 'bytes'}]，依大小排序 (不含已關閉的 session)"""
+        now = time.monotonic()
+        with self._lock:
+            sessions = [(session_id, last_seen, ref()) for session_id, (last_seen, ref) in self._sessions.items()]
+        rows = []
+        for session_id, last_seen, states in sessions:
+            if states is None:
+                continue
+            games = {game: deep_sizeof(state) for game, state in list(states.items())}
+            rows.append({'session': session_id[:8], 'idle_s': round(now - last_seen, 1),
+                         'games': games, 'bytes': sum(games.values())})
+        return sorted(rows, key=lambda row: row['bytes'], reverse=True)
+
+    # --- 背景執行緒 ---
+
+    def start(self):
+        if self._thread is None and self.enabled:
+            self._thread = threading.Thread(target=self._run, name="game-state-evict", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            evicted = self.evict_idle()
+            if evicted:
+                print(f"[game_state] 釋放 {evicted} 個閒置 session 的遊戲狀態")
+
+    def stop(self):
+        self._stop.set()
+
+_instance = None
+_instance_lock = threading.Lock()
+
+def get_tracker():
+    """整個 process 共用一個 tracker (第一次呼叫時建立並啟動背景釋放)"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            timeout = float(config.get_setting('session_idle_timeout', DEFAULT_IDLE_TIMEOUT))
+            _instance = SessionTracker(idle_timeout=timeout, sweep_interval=min(SWEEP_INTERVAL, timeout or SWEEP_INTERVAL))
+            _instance.start()
+        return _instance
+
+# --- Session API ---
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except Exception:
+        ctx = None
+    return ctx.session_id if ctx else None
+
+def _states():
+    import streamlit as st
+
+    states = st.session_state.get(STATE_KEY)
+    if not isinstance(states, GameStates):
+        states = st.session_state[STATE_KEY] = GameStates(states or {})
+    session_id = _session_id()
+    if session_id:
+        get_tracker().touch(session_id, states)
+    return states
+
+def get(game, factory=None):
+    """目前 session 的遊戲狀態；還沒有時以 factory() 建立 (factory 為 None 時回傳 None)"""
+    states = _states()
+    state = states.get(game)
+    if state is None and factory is not None:
+        state = states[game] = factory()
+    return state
+
+def reset(game=None):
+    """清除指定遊戲的狀態，game 為 None 時清除所有遊戲"""
+    states = _states()
+    if game is None:
+        states.clear()
+    else:
+        states.pop(game, None)
+
+def session_memory():
+    """目前 session 各遊戲狀態的大小 {遊戲: bytes}"""
+    return {game: deep_sizeof(state) for game, state in _states().items()}
+
+def memory_report():
+    """整個 process 中每個 session 的遊戲狀態大小 (session_idle_timeout 為 0 時不追蹤，回傳空列表)"""
+    return get_tracker().report()
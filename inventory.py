@@ -0,0 +1,201 @@
+# inventory.py
+# 使用者卡片庫存的資料庫格式
+#
+#   legacy : users/<name>/cards/<doc_id>        每張卡一份文件 {'path', 'count'}
+#   pool   : users/<name>/inventory/<卡池名稱>    每個卡池一份文件 {'cards': {card_id: count}}
+#   dual   : 過渡期，同時寫入兩種格式；已遷移的使用者讀新格式，其餘讀舊格式
+#
+# 遷移工具：python inventory.py migrate [--checkpoint 檔案] [--dry-run]
+#           python inventory.py status
+import argparse
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from firebase_admin import firestore
+
+import asset_manifest
+import config
+
+LAYOUTS = ('legacy', 'dual', 'pool')
+DEFAULT_LAYOUT = 'legacy'
+META_DOC_ID = '_meta'  # inventory 子集合中的遷移標記文件
+CHECKPOINT_PATH = Path(".inventory_migration.json")
+
+# --- Helper Functions ---
+
+def configured_layout():
+    """目前使用的庫存格式 (設定值 inventory_layout)"""
+    layout = config.get_setting('inventory_layout', DEFAULT_LAYOUT)
+    if layout not in LAYOUTS:
+        raise ValueError(f"未知的庫存格式: {layout} (可用: {', '.join(LAYOUTS)})")
+    return layout
+
+def legacy_doc_id(card_path):
+    """舊格式的卡片文件 ID 由圖片路徑轉換而來"""
+    return card_path.replace('/', '_').replace('\\', '_')
+
+def parse_card_path(card_path):
+    """
+    由圖片路徑取得 (卡池名稱, 卡片編號)，例如
+    image/gacha/春日記憶/SSR/12.jpg -> ('春日記憶', 'SSR-12')。不是卡片路徑時回傳 None。
+    """
+    parts = Path(card_path).parts
+    if len(parts) != 5 or parts[:2] != ('image', 'gacha'):
+        return None
+    return parts[2], asset_manifest.card_id_for(parts[3], card_path)
+
+def group_by_pool(card_counts):
+    """{path: count} -> {pool: {card_id: count}}"""
+    grouped = defaultdict(dict)
+    for card_path, count in card_counts.items():
+        parsed = parse_card_path(card_path)
+        if parsed:
+            pool_name, card_id = parsed
+            grouped[pool_name][card_id] = grouped[pool_name].get(card_id, 0) + count
+    return dict(grouped)
+
+# --- Read ---
+
+def read_legacy_cards(user_ref, transaction=None):
+    """讀取舊格式的所有卡片，回傳 {path: count}"""
+    docs = user_ref.collection('cards').stream(transaction=transaction)
+    return {doc.to_dict()['path']: doc.to_dict()['count'] for doc in docs}
+
+def read_owned_cards(db, username, layout=None):
+    """
+    讀取使用者擁有的所有卡片，回傳 {path: count}。
+    新格式只需讀取 (卡池數量 + 1) 份文件。
+    """
+    layout = layout or configured_layout()
+    user_ref = db.collection('users').document(username)
+    if layout == 'legacy':
+        return read_legacy_cards(user_ref)
+
+    docs = {doc.id: doc.to_dict() for doc in user_ref.collection('inventory').stream()}
+    migrated = docs.pop(META_DOC_ID, {}).get('migrated', False)
+    if layout == 'dual' and not migrated:
+        return read_legacy_cards(user_ref)
+
+    owned_cards = {}
+    for pool_name, data in docs.items():
+        for card_id, count in data.get('cards', {}).items():
+            card_path = asset_manifest.card_path(pool_name, card_id)
+            if card_path and count > 0:
+                owned_cards[card_path] = count
+    return owned_cards
+
+# --- Write ---
+
+def stage_card_increments(writer, user_ref, card_paths, layout=None):
+    """
+    將抽到的卡片加到 writer (transaction 或 batch) 中，不會自行 commit。
+    同一張卡只會寫入一次，新格式每個卡池只寫一份文件。
+    """
+    layout = layout or configured_layout()
+    card_counts = Counter(card_paths)
+    if layout in ('legacy', 'dual'):
+        for card_path, count in card_counts.items():
+            card_ref = user_ref.collection('cards').document(legacy_doc_id(card_path))
+            writer.set(card_ref, {'path': card_path, 'count': firestore.Increment(count)}, merge=True)
+    if layout in ('dual', 'pool'):
+        for pool_name, cards in group_by_pool(card_counts).items():
+            increments = {card_id: firestore.Increment(count) for card_id, count in cards.items()}
+            writer.set(user_ref.collection('inventory').document(pool_name), {'cards': increments}, merge=True)
+
+def subcollection_names():
+    """刪除帳號時需要一併清除的子集合"""
+    return ['cards', 'inventory']
+
+# --- Migration ---
+
+def migrate_user(db, username, dry_run=False):
+    """
+    在同一個 transaction 中讀取舊格式並覆寫新格式，與同時進行的抽卡互斥。
+    已遷移過的使用者會直接略過，重複執行是安全的。回傳寫入的卡池數，略過時回傳 None。
+    """
+    user_ref = db.collection('users').document(username)
+    meta_ref = user_ref.collection('inventory').document(META_DOC_ID)
+
+    @firestore.transactional
+    def run(transaction):
+        meta = meta_ref.get(transaction=transaction)
+        if meta.exists and meta.to_dict().get('migrated'):
+            return None
+        grouped = group_by_pool(read_legacy_cards(user_ref, transaction=transaction))
+        if dry_run:
+            return len(grouped)
+        for pool_name, cards in grouped.items():
+            transaction.set(user_ref.collection('inventory').document(pool_name), {'cards': cards})
+        transaction.set(meta_ref, {'migrated': True, 'migrated_at': firestore.SERVER_TIMESTAMP})
+        return len(grouped)
+
+    return run(db.transaction())
+
+def load_checkpoint(path):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {'last_user': None, 'migrated': 0, 'skipped': 0}
+
+def save_checkpoint(path, checkpoint):
+    Path(path).write_text(json.dumps(checkpoint, ensure_ascii=False), encoding='utf-8')
+
+def migrate_all(db, checkpoint_path=CHECKPOINT_PATH, page_size=200, dry_run=False):
+    """
+    依使用者名稱順序逐頁遷移所有使用者，每處理完一位就更新檢查點。
+    中斷後重新執行會從檢查點之後繼續。
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    users = db.collection('users')
+    while True:
+        query = users.order_by('__name__').limit(page_size)
+        if checkpoint['last_user']:
+            query = query.start_after(users.document(checkpoint['last_user']).get())
+        page = list(query.select([]).stream())
+        if not page:
+            return checkpoint
+        for user_doc in page:
+            result = migrate_user(db, user_doc.id, dry_run=dry_run)
+            checkpoint['skipped' if result is None else 'migrated'] += 1
+            checkpoint['last_user'] = user_doc.id
+            if not dry_run:
+                save_checkpoint(checkpoint_path, checkpoint)
+        print(f"已處理到 {checkpoint['last_user']} (遷移 {checkpoint['migrated']}、略過 {checkpoint['skipped']})")
+
+def migration_status(db):
+    """統計已遷移與尚未遷移的使用者數"""
+    done = pending = 0
+    for user_doc in db.collection('users').select([]).stream():
+        meta = user_doc.reference.collection('inventory').document(META_DOC_ID).get()
+        if meta.exists and meta.to_dict().get('migrated'):
+            done += 1
+        else:
+            pending += 1
+    return done, pending
+
+# --- CLI ---
+
+def main(argv=None):
+    import firebase_setup
+
+    parser = argparse.ArgumentParser(description="卡片庫存格式遷移工具")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="將舊格式卡片轉換為每卡池一份文件")
+    migrate.add_argument('--checkpoint', default=str(CHECKPOINT_PATH), help="檢查點檔案")
+    migrate.add_argument('--page-size', type=int, default=200, help="每次讀取的使用者數")
+    migrate.add_argument('--dry-run', action='store_true', help="只統計，不寫入")
+    sub.add_parser('status', help="顯示遷移進度")
+    parser.add_argument('--secrets', default=str(firebase_setup.SECRETS_PATH), help="Streamlit secrets 檔案")
+    args = parser.parse_args(argv)
+
+    db = firebase_setup.client_from_secrets_file(args.secrets)
+    if args.command == 'migrate':
+        checkpoint = migrate_all(db, args.checkpoint, args.page_size, args.dry_run)
+        print(f"完成！遷移 {checkpoint['migrated']} 位、略過 {checkpoint['skipped']} 位使用者。")
+    else:
+        done, pending = migration_status(db)
+        print(f"已遷移 {done} 位，尚未遷移 {pending} 位。")
+
+if __name__ == "__main__":
+    main()
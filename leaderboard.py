@@ -0,0 +1,190 @@
+# leaderboard.py
+# 排行榜：爆米花餘額與各卡池的收集進度。
+#
+# - 不掃描所有使用者：餘額或卡片有變動時 (帳本寫入後、抽卡成功後) 才更新該使用者所在的分片。
+# - 每個排行榜分成 NUM_SHARDS 個分片 (使用者依名稱 hash 分配)，分散同時寫入造成的衝突；
+#   每個分片只保留分數最高的 SHARD_CAPACITY 筆，被擠出的使用者下次分數變動時會重新加入。
+# - 讀取時合併所有分片後排序，結果快取 LEADERBOARD_TTL 秒，讀取次數與使用者人數無關。
+# - 帳本執行緒與抽卡請求可能同時更新同一位使用者：每筆項目帶有讀取資料前的時間 'at'，
+#   分片中只保留 'at' 較新的項目 (storage.merge_leaderboard_entry)，較晚寫入的舊資料不會蓋掉新資料。
+# - 帳本入帳後直接使用入帳時得到的餘額，不再讀取使用者資料；分片內容沒變時 storage 不寫入，
+#   快取中的分片已滿且分數不夠進入時連 transaction 都不執行 (快取最多 ttl 秒，過期後才會再嘗試)。
+import hashlib
+import threading
+import time
+
+import config
+
+POPCORN_BOARD = 'popcorn'
+NUM_SHARDS = 8
+TOP_N = 20
+SHARD_CAPACITY = 2 * TOP_N
+LEADERBOARD_TTL = 30.0   # 秒
+COLLECTION_RARITIES = ['SP', 'SSR', 'SR', 'R']
+
+def collection_board(pool_name):
+    return f"collection:{pool_name}"
+
+def shard_for(username, num_shards=NUM_SHARDS):
+    """使用者固定分配到同一個分片"""
+    return int(hashlib.sha1(username.encode('utf-8')).hexdigest(), 16) % num_shards
+
+def collection_entry(name, summary):
+    """
+    收集進度的排行榜項目。summary 為 {稀有度: (已擁有種類數, 總數)} (gacha.collection_summary)。
+    依收集總種類數排名，同分時比較 SP、SSR、SR、R 的種類數。
+    """
+    owned = [summary.get(rarity, (0, 0))[0] for rarity in COLLECTION_RARITIES]
+    return {
+        'name': name,
+        'score': [sum(owned)] + owned,
+        'counts': {rarity: list(counts) for rarity, counts in summary.items()},
+    }
+
+class LeaderboardService:
+    """排行榜的寫入與讀取 (整個 process 共用)"""
+    def __init__(self, storage, num_shards=NUM_SHARDS, capacity=SHARD_CAPACITY, ttl=LEADERBOARD_TTL):
+        self.storage = storage
+        self.num_shards = num_shards
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}        # board -> (到期時間, [(username, entry), ...])
+        self._last_written = {}  # (board, username) -> (as_of, entry)，內容沒變或較舊時不重複寫入
+        self._shards = {}       # (board, shard) -> (到期時間, {username: entry}) 最近讀到或寫入的分片內容
+        self._names = {}        # username -> 顯示名稱
+
+    # --- 寫入 ---
+
+    def _update(self, board, username, entry, as_of=None):
+        """as_of 為讀取分數前的時間；同一個 process 中比已寫入的項目舊的更新直接略過"""
+        key = (board, username)
+        shard = shard_for(username, self.num_shards)
+        with self._lock:
+            last = self._last_written.get(key)
+            if entry is not None and last is not None and (last[0] >= as_of or last[1] == entry):
+                return
+            if entry is not None and self._outranked(board, shard, username, entry):
+                return
+            # 先登記再寫入，同時進行的較舊更新會在上面被略過
+            if entry is None:
+                self._last_written.pop(key, None)
+            else:
+                self._last_written[key] = (as_of, entry)
+        try:
+            # 移除一律寫入：這個 process 可能從未寫過該使用者 (例如命令列刪除帳號、重新啟動後)
+            entries = self.storage.update_leaderboard(board, shard, username,
+                                                      None if entry is None else dict(entry, at=as_of), self.capacity)
+        except Exception:
+            with self._lock:
+                if entry is not None and self._last_written.get(key) == (as_of, entry):
+                    del self._last_written[key]
+            raise
+        self._remember_shards(board, {shard: entries})
+
+    def _outranked(self, board, shard, username, entry):
+        """快取中的分片已滿、使用者不在其中且分數低於分片最低分時，寫入不會改變分片 (呼叫時已持有鎖)"""
+        cached = self._shards.get((board, shard))
+        if cached is None or cached[0] <= time.monotonic():
+            return False
+        entries = cached[1]
+        return (username not in entries and len(entries) >= self.capacity
+                and entry['score'] < min(other['score'] for other in entries.values()))
+
+    def _remember_shards(self, board, shards):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for shard, entries in shards.items():
+                self._shards[(board, shard)] = (expires, entries)
+
+    def _name(self, username):
+        """使用者的顯示名稱 (第一次讀取使用者資料後快取)；使用者不存在或刪除中時回傳 None"""
+        with self._lock:
+            name = self._names.get(username)
+        if name is not None:
+            return name
+        user = self.storage.get_user(username)
+        if user is None or user.get('deleting'):
+            return None
+        return self._remember_name(username, user)
+
+    def _remember_name(self, username, user):
+        name = user.get('name', username)
+        with self._lock:
+            self._names[username] = name
+        return name
+
+    def record_balance(self, username, name, balance, as_of):
+        self._update(POPCORN_BOARD, username, {'name': name, 'score': [balance]}, as_of)
+
+    def record_collection(self, username, name, pool_name, summary, as_of):
+        self._update(collection_board(pool_name), username, collection_entry(name, summary), as_of)
+
+    def refresh_user(self, username, collections=None, balance=None, as_of=None):
+        """
+        更新爆米花排行榜，以及 collections ({卡池: 收集進度}) 的收集排行榜。
+        balance 為呼叫端已知的最新餘額 (例如帳本入帳後)，as_of 為讀取該餘額前的時間；
+        沒有傳入時讀取一次使用者資料。使用者不存在或刪除中時不更新，回傳是否有更新。
+        """
+        if balance is None:
+            # 讀取前的時間：較晚開始的讀取看到的資料一定相同或更新
+            as_of = time.time()
+            user = self.storage.get_user(username)
+            if user is None or user.get('deleting'):
+                return False
+            name = self._remember_name(username, user)
+            balance = user.get('popcorn', 0)
+        else:
+            name = self._name(username)
+            if name is None:
+                return False
+        self.record_balance(username, name, balance, as_of)
+        for pool_name, summary in (collections or {}).items():
+            self.record_collection(username, name, pool_name, summary, as_of)
+        return True
+
+    def popcorn_changed(self, username, entries=None, balance=None, as_of=None):
+        """帳本寫入後的回呼：使用入帳後的餘額 (不需要 entries)"""
+        self.refresh_user(username, balance=balance, as_of=as_of)
+
+    def remove_user(self, username, boards):
+        """刪除帳號時從指定的排行榜移除"""
+        with self._lock:
+            self._names.pop(username, None)
+        for board in boards:
+            self._update(board, username, None)
+
+    # --- 讀取 ---
+
+    def top(self, board, n=TOP_N):
+        """排行榜前 n 名 [(username, entry)]，快取 ttl 秒"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(board)
+            if cached and cached[0] > now:
+                return cached[1][:n]
+        entries = self.storage.read_leaderboard(board, self.num_shards)
+        shards = {shard: {} for shard in range(self.num_shards)}
+        for username, entry in entries.items():
+            shards[shard_for(username, self.num_shards)][username] = entry
+        self._remember_shards(board, shards)
+        ranked = sorted(entries.items(), key=lambda item: (item[1]['score'], item[0]), reverse=True)[:max(n, TOP_N)]
+        with self._lock:
+            self._cache[board] = (now + self.ttl, ranked)
+        return ranked[:n]
+
+def all_boards():
+    """所有排行榜的名稱 (爆米花 + pools.toml 中的每個卡池)"""
+    import pool_registry
+    return [POPCORN_BOARD] + [collection_board(pool.name) for pool in pool_registry.get_registry().pools()]
+
+_instance = None
+_instance_lock = threading.Lock()
+
+def get_service(storage):
+    """整個 process 共用一個排行榜服務"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = LeaderboardService(storage, ttl=float(config.get_setting('leaderboard_ttl', LEADERBOARD_TTL)))
+        return _instance
@@ -0,0 +1,66 @@
+# leaderboard_page.py
+import streamlit as st
+import leaderboard
+import pool_registry
+
+def start_game(username, db_update_func):
+    st.title("🏆 排行榜")
+    if st.button("⬅️ 返回遊戲大廳"):
+        st.session_state.page = "主頁"
+        st.rerun()
+        return
+    st.caption(f"排行榜每 {leaderboard.get_service(st.session_state['storage']).ttl:g} 秒更新一次。")
+
+    # 已開放或已結束的卡池才有收集排行榜
+    pools = [pool.name for pool in pool_registry.get_registry().pools()
+             if pool.status() in (pool_registry.OPEN, pool_registry.ENDED)]
+    tabs = st.tabs(["🍿 爆米花"] + [f"📚 {pool}" for pool in pools])
+    with tabs[0]:
+        show_popcorn_board(username)
+    for tab, pool in zip(tabs[1:], pools):
+        with tab:
+            show_collection_board(username, pool)
+
+def load_board(board):
+    try:
+        return leaderboard.get_service(st.session_state['storage']).top(board)
+    except Exception as e:
+        st.error(f"讀取排行榜失敗: {e}")
+        return None
+
+def show_popcorn_board(username):
+    ranked = load_board(leaderboard.POPCORN_BOARD)
+    if ranked is None:
+        return
+    if not ranked:
+        st.info("還沒有人上榜。")
+        return
+    rows = [{"名次": i, "玩家": entry['name'], "爆米花": entry['score'][0]}
+            for i, (_, entry) in enumerate(ranked, start=1)]
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    show_own_rank(username, ranked)
+
+def show_collection_board(username, pool_name):
+    ranked = load_board(leaderboard.collection_board(pool_name))
+    if ranked is None:
+        return
+    if not ranked:
+        st.info("還沒有人上榜。")
+        return
+    rows = []
+    for i, (_, entry) in enumerate(ranked, start=1):
+        row = {"名次": i, "玩家": entry['name'], "收集種類": entry['score'][0]}
+        for rarity in leaderboard.COLLECTION_RARITIES:
+            owned, total = entry['counts'].get(rarity, (0, 0))
+            if total:
+                row[rarity] = f"{owned} / {total}"
+        rows.append(row)
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    show_own_rank(username, ranked)
+
+def show_own_rank(username, ranked):
+    for i, (name, _) in enumerate(ranked, start=1):
+        if name == username:
+            st.success(f"您目前排名第 {i} 名！")
+            return
+    st.caption("您目前不在榜上。")
@@ -0,0 +1,185 @@
+# ledger.py
+# 爆米花帳本 (write-behind)：遊戲獎懲先累積在記憶體中，定期合併成一次寫入。
+#
+# - 每筆變動都帶有冪等鍵 (idempotency key)，同一個鍵只會入帳一次：記憶體中先去重，
+#   storage 也保存已入帳的鍵，process 重新啟動後重送同一個鍵仍不會重複入帳。
+# - 每位使用者的變動合併後，以 storage.apply_popcorn_batch 一次寫入 (餘額加總 + 明細)。
+# - 會在固定間隔、登出時、以及需要精確餘額的扣款 (抽卡、下注) 之前寫入。
+# - spend() 直接在資料庫中原子地檢查餘額並扣款 (下注時預扣賭注)，不經過累積。
+# - 批次入帳後呼叫 add_listener 登記的函式 (例如更新排行榜)，並傳入入帳後的餘額，listener 不必再讀取使用者資料。
+import atexit
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 2.0   # 秒
+KEY_TTL = 3600                 # 冪等鍵在記憶體中保留的秒數
+
+class PopcornLedger:
+    def __init__(self, storage, flush_interval=DEFAULT_FLUSH_INTERVAL, key_ttl=KEY_TTL):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.key_ttl = key_ttl
+        self._lock = threading.Lock()
+        self._pending = {}     # username -> {idempotency_key: amount}
+        self._unsent = {}      # username -> [entries, ...] 寫入失敗、需原封不動重送的批次
+        self._seen_keys = {}   # (username, idempotency_key) -> 到期時間
+        self._user_locks = {}  # 同一位使用者的 flush 依序執行
+        self._failures = {}    # username -> 連續寫入失敗次數
+        self._listeners = []   # 入帳後的回呼 listener(username, entries)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- 記錄 ---
+
+    def record(self, username, amount, idempotency_key=None):
+        """
+        記錄一筆爆米花變動，回傳是否為新的變動 (重複的冪等鍵回傳 False)。
+        這裡只以記憶體去重；寫入時 storage 會再略過已入帳的鍵。
+        """
+        key = idempotency_key or uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            if self._seen_keys.get((username, key), 0) > now:
+                return False
+            self._seen_keys[(username, key)] = now + self.key_ttl
+            self._pending.setdefault(username, {})[key] = amount
+        return True
+
+    def pending_delta(self, username):
+        with self._lock:
+            unsent = sum(sum(entries.values()) for entries in self._unsent.get(username, []))
+            return unsent + sum(self._pending.get(username, {}).values())
+
+    def discard(self, username):
+        """刪除帳號時丟棄尚未寫入的變動"""
+        with self._lock:
+            self._pending.pop(username, None)
+            self._unsent.pop(username, None)
+            self._failures.pop(username, None)
+
+    # --- 寫入 ---
+
+    def _user_lock(self, username):
+        with self._lock:
+            return self._user_locks.setdefault(username, threading.Lock())
+
+    def flush(self, username):
+        """
+        把該使用者累積的變動合併寫入資料庫。
+        失敗的批次會保留原本內容 (同一個 flush_id) 等下次重送，並拋出例外。
+        """
+        with self._user_lock(username):
+            with self._lock:
+                batches = self._unsent.pop(username, [])
+                entries = self._pending.pop(username, None)
+                if entries:
+                    batches.append(entries)
+            for i, entries in enumerate(batches):
+                try:
+                    self._commit(username, entries)
+                except Exception:
+                    with self._lock:
+                        self._unsent[username] = batches[i:] + self._unsent.get(username, [])
+                        self._failures[username] = self._failures.get(username, 0) + 1
+                    metrics.record_failure('ledger_flush')
+                    raise
+            with self._lock:
+                self._failures.pop(username, None)
+
+    def _commit(self, username, entries):
+        """批次 ID 由冪等鍵決定，重送同一批時不會重複入帳 (已入帳的鍵或使用者已刪除時 storage 直接略過)"""
+        flush_id = hashlib.sha1("\n".join(sorted(entries)).encode('utf-8')).hexdigest()
+        as_of = time.time()
+        balance, applied = self.storage.apply_popcorn_batch(username, flush_id, entries)
+        if applied:
+            self._notify(username, applied, balance, as_of)
+
+    def add_listener(self, listener):
+        """
+        登記入帳後的回呼 listener(username, entries, balance, as_of) (同一個函式只登記一次)。
+        balance 為入帳後的餘額，as_of 為讀取餘額前的時間 (排行榜依此排序)。
+        """
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def _notify(self, username, entries, balance, as_of):
+        # 回呼失敗不影響入帳結果
+        for listener in list(self._listeners):
+            try:
+                listener(username, entries, balance, as_of)
+            except Exception:
+                metrics.record_failure('ledger_listener')
+                logger.exception("入帳後處理失敗 user=%s listener=%s entries=%d",
+                                 username, getattr(listener, '__qualname__', listener), len(entries))
+
+    def flush_all(self):
+        with self._lock:
+            usernames = set(self._pending) | set(self._unsent)
+            now = time.monotonic()
+            self._seen_keys = {k: exp for k, exp in self._seen_keys.items() if exp > now}
+        for username in usernames:
+            try:
+                self.flush(username)
+            except Exception:
+                with self._lock:
+                    failures = self._failures.get(username, 0)
+                    unsent = self._unsent.get(username, [])
+                    batches, delta = len(unsent), sum(sum(entries.values()) for entries in unsent)
+                # 連續失敗時每次都記錄，次數與累積的變動量可看出是否一直寫不進去
+                logger.exception("寫入爆米花變動失敗，稍後重試 user=%s 連續失敗=%d 未寫入批次=%d 變動量=%+d",
+                                 username, failures, batches, delta)
+
+    def confirmed_balance(self, username):
+        """先寫入累積的變動，再讀取資料庫中的最新餘額 (扣款前使用)"""
+        self.flush(username)
+        return self.storage.get_balance(username)
+
+    def spend(self, username, cost, idempotency_key):
+        """
+        先寫入累積的變動，再原子地扣除 cost 並回傳扣款後餘額。
+        餘額不足時拋出 InsufficientPopcornError；同一個冪等鍵重送時不會再扣一次。
+        """
+        self.flush(username)
+        as_of = time.time()
+        balance, applied = self.storage.spend_popcorn(username, idempotency_key, cost)
+        if applied:
+            self._notify(username, {idempotency_key: -cost}, balance, as_of)
+        return balance
+
+    # --- 背景執行緒 ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="popcorn-ledger", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush_all()
+
+    def stop(self):
+        self._stop.set()
+        self.flush_all()
+
+_instance = None
+_instance_lock = threading.Lock()
+
+def get_ledger(storage):
+    """整個 process 共用一本帳本 (第一次呼叫時建立並啟動背景寫入)"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            interval = float(config.get_setting('ledger_flush_interval', DEFAULT_FLUSH_INTERVAL))
+            _instance = PopcornLedger(storage, flush_interval=interval)
+            _instance.start()
+        return _instance
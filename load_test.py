@@ -0,0 +1,288 @@
+# load_test.py
+# 以 Streamlit 測試 API (AppTest) 模擬大量同時在線的玩家，走完真實流程：
+#   註冊 → 登入 → 翻翻樂一局 → 比大小下注 → 抽卡 (單抽、十連、50 連) → 瀏覽卡冊 → 排行榜
+# 資料存放在本機 (預設所有 worker 共用一個暫存 SQLite 檔)，不會連到 Firebase。
+#
+#   python load_test.py --sessions 200 --workers 8
+#   python load_test.py --sessions 200 --workers 8 --save-baseline load_baseline.json
+#   python load_test.py --sessions 200 --workers 8 --baseline load_baseline.json   # 退步超過門檻時 exit 1
+#
+# AppTest 會替換整個 process 共用的 Runtime，無法在多個執行緒中同時執行，
+# 因此以多個 process 模擬同時連線；每個 worker 內的 session 輪流前進一步，全部同時存活。
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import game_state
+
+APP_PATH = Path(__file__).with_name("main.py")
+PASSWORD = "load-test-password"
+STARTING_GRANT = 700      # 註冊送的 100 爆米花不夠單抽、十連與 50 連抽，註冊後直接在資料庫補發
+DEFAULT_TOLERANCE = 0.25  # p95 或吞吐量退步超過 25% 視為失敗
+
+class StepFailed(Exception):
+    """畫面上找不到預期的元件，或腳本執行時拋出例外"""
+
+# --- Session ---
+
+def _find_button(at, label=None, key=None, prefix=False):
+    for button in at.button:
+        if key is not None and button.key == key:
+            return button
+        if label is not None and (button.label.startswith(label) if prefix else button.label == label):
+            return button
+    raise StepFailed(f"找不到按鈕 {label or key}")
+
+def _click(at, label=None, key=None, prefix=False):
+    return lambda: _find_button(at, label, key, prefix).click()
+
+def last_draw_results(at):
+    gacha_state = at.session_state[game_state.STATE_KEY].get('gacha')
+    return (gacha_state.last_results() if gacha_state else None) or []
+
+def session_steps(at, username):
+    """
+    一位玩家的完整流程，每一步產生 (頁面名稱, 操作)；操作之後由呼叫端執行 at.run() 並計時。
+    翻翻樂依 session_state 中的牌面直接配對，讓每一局都能完整結束並領取獎勵。
+    """
+    yield 'start', lambda: None
+
+    def register():
+        at.text_input(key="reg_name").input(username)
+        at.text_input(key="reg_user").input(username)
+        at.text_input(key="reg_pass").input(PASSWORD)
+        at.text_input(key="reg_confirm").input(PASSWORD)
+        _find_button(at, "註冊").click()
+    yield 'register', register
+    store = at.session_state['storage']
+    store.apply_popcorn_batch(username, f"load-test:{username}", {f"load-test:{username}": STARTING_GRANT})
+
+    def login():
+        at.text_input(key="login_user").input(username)
+        at.text_input(key="login_pass").input(PASSWORD)
+        _find_button(at, "登入").click()
+    yield 'login', login
+    if not at.session_state['authentication_status']:
+        raise StepFailed("登入失敗")
+
+    # 翻翻樂
+    yield 'lobby', _click(at, "🧠 記憶翻翻樂")
+    board = at.session_state[game_state.STATE_KEY]['flash_card']
+    pairs = {}
+    for i in range(len(board.board)):
+        pairs.setdefault(board.card_name(i).split('-')[0], []).append(i)
+    for first, second in pairs.values():
+        yield 'flash_card', _click(at, key=f"card_{first}")
+        yield 'flash_card', _click(at, key=f"card_{second}")
+    if not board.game_over:
+        raise StepFailed("翻翻樂沒有結束")
+    yield 'flash_card', _click(at, "返回大廳")
+
+    # 比大小
+    yield 'lobby', _click(at, "⚖️ 比大小")
+    yield 'more_less', _click(at, "下好離手！")
+    yield 'more_less', _click(at, key="choice_0")
+    yield 'more_less', _click(at, "🔼 比電腦大")
+    yield 'more_less', _click(at, "返回大廳")
+
+    # 抽卡
+    yield 'lobby', _click(at, "🎰 抽卡遊戲")
+    yield 'gacha_menu', _click(at, "春日記憶")
+    yield 'gacha_draw', _click(at, "抽一次")
+    if len(last_draw_results(at)) != 1:
+        raise StepFailed("單抽失敗")
+    yield 'gacha_draw10', _click(at, "十連抽", prefix=True)
+    if len(last_draw_results(at)) != 10:
+        raise StepFailed("十連抽失敗")
+    yield 'gacha_draw50', _click(at, "50 連抽", prefix=True)
+    if len(last_draw_results(at)) != 50:
+        raise StepFailed("50 連抽失敗")
+    yield 'gacha_draw', _click(at, "⬅️ 返回卡池選擇")
+    yield 'gacha_menu', _click(at, "📚 查看我的卡冊")
+    yield 'gacha_collection', _click(at, "春日記憶")
+    yield 'gacha_collection', _click(at, "⬅️ 返回抽卡主選單")
+    yield 'gacha_menu', _click(at, "⬅️ 返回遊戲大廳")
+    yield 'leaderboard', _click(at, "🏆 排行榜")
+
+def run_worker(worker_id, sessions, run_id, trace_memory, timeout):
+    """
+    在一個 process 中建立 sessions 個 AppTest，輪流推進直到全部完成。
+    回傳 {'latencies': {頁面: [秒]}, 'reruns', 'elapsed', 'errors', 'memory_per_session', 'game_state_per_session'}
+    """
+    from streamlit.testing.v1 import AppTest
+
+    # 先執行一次，讓模組載入與共用快取不計入每個 session 的記憶體
+    AppTest.from_file(str(APP_PATH), default_timeout=timeout).run()
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    live = []
+    for i in range(sessions):
+        at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        live.append((at, session_steps(at, f"lt{run_id}w{worker_id}s{i}"), 'start'))
+
+    latencies = {}
+    errors = {}
+    reruns = 0
+    memory_samples = []
+    game_state_samples = []
+    start = time.perf_counter()
+    while live:
+        still_running = []
+        for at, steps, page in live:
+            try:
+                page, action = next(steps)
+                action()
+                t0 = time.perf_counter()
+                at.run()
+                latencies.setdefault(page, []).append(time.perf_counter() - t0)
+                reruns += 1
+                if at.exception:
+                    raise StepFailed(at.exception[0].message)
+            except StopIteration:
+                continue
+            except Exception as e:
+                errors[page] = errors.get(page, 0) + 1
+                print(f"[worker {worker_id}] {page}: {e}")
+                continue
+            still_running.append((at, steps, page))
+        if len(still_running) == len(live):
+            # 所有 session 都還在線時記錄記憶體 (取最大值)
+            if trace_memory:
+                memory_samples.append(tracemalloc.get_traced_memory()[0])
+            else:
+                memory_samples.append((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024)
+            game_state_samples.append(sum(row['bytes'] for row in game_state.memory_report()))
+        live = still_running
+    elapsed = time.perf_counter() - start
+    if trace_memory:
+        tracemalloc.stop()
+    # 關閉登入時建立的雜湊工作池，否則 worker process 無法結束
+    import auth_pool
+    if auth_pool.get_pool.cache_info().currsize:
+        auth_pool.get_pool().shutdown(wait=True)
+
+    return {
+        'latencies': latencies,
+        'reruns': reruns,
+        'elapsed': elapsed,
+        'errors': errors,
+        'memory_per_session': max(memory_samples, default=0) / max(1, sessions),
+        'game_state_per_session': max(game_state_samples, default=0) / max(1, sessions),
+    }
+
+# --- 報告 ---
+
+def summarize(results, wall_time, args):
+    latencies = {}
+    errors = {}
+    for result in results:
+        for page, values in result['latencies'].items():
+            latencies.setdefault(page, []).extend(values)
+        for page, count in result['errors'].items():
+            errors[page] = errors.get(page, 0) + count
+    pages = {}
+    for page, values in sorted(latencies.items()):
+        ms = np.array(values) * 1000
+        pages[page] = {
+            'count': len(values),
+            'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p95_ms': round(float(np.percentile(ms, 95)), 2),
+            'p99_ms': round(float(np.percentile(ms, 99)), 2),
+        }
+    reruns = sum(result['reruns'] for result in results)
+    return {
+        'config': {'sessions': args.sessions, 'workers': args.workers, 'backend': args.backend},
+        'pages': pages,
+        'reruns': reruns,
+        'wall_time_s': round(wall_time, 2),
+        'throughput_rps': round(reruns / wall_time, 2),
+        'memory_per_session_kb': round(float(np.mean([r['memory_per_session'] for r in results])) / 1024, 1),
+        'game_state_per_session_bytes': round(float(np.mean([r['game_state_per_session'] for r in results]))),
+        'errors': errors,
+    }
+
+def print_report(report):
+    print(f"{'頁面':<18}{'次數':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for page, stats in report['pages'].items():
+        print(f"{page:<18}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"總執行次數 {report['reruns']}，耗時 {report['wall_time_s']} 秒，吞吐量 {report['throughput_rps']} 次/秒")
+    print(f"每個 session 約 {report['memory_per_session_kb']} KB (其中遊戲狀態最多 {report['game_state_per_session_bytes']} bytes)")
+    if report['errors']:
+        print(f"錯誤: {report['errors']}")
+
+def compare(report, baseline, tolerance):
+    """與基準比較，回傳退步項目的說明列表"""
+    regressions = []
+    for page, stats in report['pages'].items():
+        base = baseline['pages'].get(page)
+        if not base:
+            continue
+        change = stats['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0
+        print(f"{page:<18} p95 {base['p95_ms']:>9} -> {stats['p95_ms']:>9} ms ({change:+.0%})")
+        if change > tolerance:
+            regressions.append(f"{page} p95 {change:+.0%}")
+    change = report['throughput_rps'] / baseline['throughput_rps'] - 1 if baseline['throughput_rps'] else 0
+    print(f"{'throughput':<18}     {baseline['throughput_rps']:>9} -> {report['throughput_rps']:>9} 次/秒 ({change:+.0%})")
+    if change < -tolerance:
+        regressions.append(f"throughput {change:+.0%}")
+    if report['errors'] and not baseline.get('errors'):
+        regressions.append(f"errors {report['errors']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模擬多位玩家同時遊玩的壓力測試")
+    parser.add_argument('--sessions', type=int, default=100, help="模擬的玩家數")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="process 數")
+    parser.add_argument('--backend', choices=('sqlite', 'memory'), default='sqlite',
+                        help="sqlite: 所有 worker 共用一個暫存資料庫；memory: 每個 worker 各自一份")
+    parser.add_argument('--pbkdf2-rounds', type=int, help="密碼雜湊回合數 (預設與正式環境相同)")
+    parser.add_argument('--tracemalloc', action='store_true', help="以 tracemalloc 量測記憶體 (較精確但較慢)")
+    parser.add_argument('--timeout', type=float, default=30, help="單次執行的逾時秒數")
+    parser.add_argument('--output', help="將報告寫成 JSON 檔")
+    parser.add_argument('--save-baseline', help="將報告存為基準檔")
+    parser.add_argument('--baseline', help="與基準檔比較，退步超過門檻時回傳錯誤碼")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="容許的退步比例")
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.TemporaryDirectory(prefix="popcorn-load-")
+    # worker 以 spawn 啟動，設定透過環境變數傳入
+    os.environ['STORAGE_BACKEND'] = args.backend
+    os.environ['SQLITE_PATH'] = str(Path(tmp_dir.name) / "load.db")
+    os.environ['EVENT_LOG_DIR'] = str(Path(tmp_dir.name) / "events")
+    os.environ.setdefault('AUTH_WORKERS', '1')
+    if args.pbkdf2_rounds:
+        os.environ['PBKDF2_ROUNDS'] = str(args.pbkdf2_rounds)
+
+    counts = [args.sessions // args.workers + (1 if i < args.sessions % args.workers else 0) for i in range(args.workers)]
+    run_id = uuid.uuid4().hex[:6]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(run_worker, i, n, run_id, args.tracemalloc, args.timeout)
+                   for i, n in enumerate(counts) if n]
+        results = [future.result() for future in futures]
+    report = summarize(results, time.perf_counter() - start, args)
+    tmp_dir.cleanup()
+
+    print_report(report)
+    for path in filter(None, [args.output, args.save_baseline]):
+        Path(path).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding='utf-8')
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text(encoding='utf-8')), args.tolerance)
+        if regressions:
+            print(f"效能退步: {', '.join(regressions)}")
+            raise SystemExit(1)
+        print("與基準相比沒有明顯退步。")
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,64 @@
 # main.py
+import importlib
+import sys
+import metrics
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
-from passlib.hash import pbkdf2_sha256
-import time
+import account_deletion
+import auth_pool
+import build_assets
+import event_log
+import game_state
+import leaderboard
+import ledger
+import storage
 
-# 引入遊戲模組
-import flash_card
-import more_less
-import gacha # <-- 新增：引入抽卡遊戲
+# 遊戲模組在第一次進入該頁面時才載入
+GAME_MODULES = {
+    "翻翻樂": "flash_card",
+    "比大小": "more_less",
+    "抽卡": "gacha",
+    "排行榜": "leaderboard_page",
+}
 
 # --- 網頁基礎設定 ---
 st.set_page_config(page_title="爆米花遊樂場", page_icon="🍿", layout="wide")
 
-# --- Firebase 初始化 ---
+# --- 資料庫初始化 ---
+@st.cache_resource
+def get_storage():
+    """整個 process 共用一個資料存取物件 (依設定值 storage_backend)，建立時順便預先建立連線"""
+    with metrics.timed("storage:init"):
+        store = metrics.instrument_storage(storage.open_storage())
+    with metrics.timed("storage:warmup"):
+        store.ping()
+    # 爆米花入帳後更新排行榜並寫入事件紀錄
+    ledger.get_ledger(store).add_listener(leaderboard.get_service(store).popcorn_changed)
+    ledger.get_ledger(store).add_listener(event_log.popcorn_listener)
+    return store
+
 try:
-    if 'db' not in st.session_state:
-        creds_dict = {
-            "type": st.secrets["firebase_credentials"]["type"],
-            "project_id": st.secrets["firebase_credentials"]["project_id"],
-            "private_key_id": st.secrets["firebase_credentials"]["private_key_id"],
-            "private_key": st.secrets["firebase_credentials"]["private_key"].replace('\\n', '\n'),
-            "client_email": st.secrets["firebase_credentials"]["client_email"],
-            "client_id": st.secrets["firebase_credentials"]["client_id"],
-            "auth_uri": st.secrets["firebase_credentials"]["auth_uri"],
-            "token_uri": st.secrets["firebase_credentials"]["token_uri"],
-            "auth_provider_x509_cert_url": st.secrets["firebase_credentials"]["auth_provider_x509_cert_url"],
-            "client_x509_cert_url": st.secrets["firebase_credentials"]["client_x509_cert_url"],
-        }
-        cred = credentials.Certificate(creds_dict)
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(cred)
-        st.session_state['db'] = firestore.client()
+    if 'storage' not in st.session_state:
+        st.session_state['storage'] = get_storage()
 except Exception as e:
-    st.error("Firebase 初始化失敗，請檢查 Streamlit Secrets 中的金鑰設定。")
+    st.error("資料庫初始化失敗，請檢查 Streamlit Secrets 中的金鑰設定。")
     st.error(e)
     st.stop()
 
-db = st.session_state['db']
+store = st.session_state['storage']
+
+@st.cache_resource
+def start_asset_build():
+    """縮圖、靜態網址、合併圖或打包檔尚未建置時在背景建置 (整個 process 一次，見 build_assets.py)"""
+    return build_assets.ensure_built()
+
+start_asset_build()
 
 # --- 登入與註冊邏輯 ---
 def show_login_register_page():
     st.title("🍿 歡迎來到爆米花遊樂場")
+    notice = st.session_state.pop('deletion_notice', None)
+    if notice:
+        st.success(notice)
     login_tab, register_tab = st.tabs(["登入 (Login)", "註冊 (Register)"])
     
     with login_tab:
@@ -55,18 +72,26 @@ def show_login_register_page():
                 if not username or not password:
                     st.error("使用者名稱和密碼不可為空！")
                 else:
-                    user_ref = db.collection('users').document(username).get()
-                    if not user_ref.exists:
+                    user_data = store.get_user(username)
+                    if user_data is None:
                         st.error("使用者不存在！")
+                    elif user_data.get('deleting'):
+                        st.error("此帳號正在刪除中！")
                     else:
-                        user_data = user_ref.to_dict()
-                        if pbkdf2_sha256.verify(password, user_data.get('password_hash', '')):
+                        try:
+                            password_ok, new_hash = auth_pool.verify_password(password, user_data.get('password_hash', ''))
+                        except auth_pool.AuthBusyError:
+                            password_ok, new_hash = None, None
+                            st.warning("目前登入人數眾多，請稍後再試一次。")
+                        if password_ok:
+                            # 記錄登入時間 (清理閒置帳號用)；雜湊參數調整過時順便更新密碼雜湊
+                            store.record_login(username, new_hash)
                             st.session_state['authentication_status'] = True
                             st.session_state['username'] = username
                             st.session_state['name'] = user_data.get('name', username)
                             st.session_state['popcorn'] = user_data.get('popcorn', 0)
                             st.rerun()
-                        else:
+                        elif password_ok is False:
                             st.error("密碼不正確！")
 
     with register_tab:
@@ -86,18 +111,39 @@ def show_login_register_page():
                 elif not new_username.isalnum():
                     st.error("使用者名稱只能包含英文和數字！")
                 else:
-                    user_ref = db.collection('users').document(new_username)
-                    if user_ref.get().exists:
+                    if store.get_user(new_username) is not None:
                         st.error("此使用者名稱已被註冊！")
                     else:
-                        password_hash = pbkdf2_sha256.hash(new_password)
+                        try:
+                            password_hash = auth_pool.hash_password(new_password)
+                        except auth_pool.AuthBusyError:
+                            st.warning("目前註冊人數眾多，請稍後再試一次。")
+                            return
                         user_data = {
                             "name": new_name, 
                             "password_hash": password_hash,
                             "popcorn": 100
                         }
-                        user_ref.set(user_data)
-                        st.success("註冊成功！請前往登入分頁進行登入。")
+                        # 雜湊計算期間可能被搶先註冊，以建立結果為準
+                        if store.create_user(new_username, user_data):
+                            st.success("註冊成功！請前往登入分頁進行登入。")
+                        else:
+                            st.error("此使用者名稱已被註冊！")
+
+def load_game(page):
+    """第一次進入遊戲頁面時才載入對應模組 (並記錄載入時間)"""
+    module_name = GAME_MODULES[page]
+    if module_name not in sys.modules:
+        with metrics.timed(f"import:{module_name}"):
+            importlib.import_module(module_name)
+    return sys.modules[module_name]
+
+def invalidate_user_caches(username):
+    """登出或刪除帳號時清除該使用者的快取 (只處理已載入的模組) 與本 session 的遊戲狀態"""
+    game_state.reset()
+    gacha = sys.modules.get('gacha')
+    if gacha is not None:
+        gacha.owned_cards_cache().invalidate(username)
 
 # --- 刪除帳號後端邏輯 ---
 def delete_user_account():
@@ -106,14 +152,17 @@ def delete_user_account():
     password = st.session_state.get("delete_password", "")
     confirmation = st.session_state.get("delete_confirm", "")
 
-    user_ref = db.collection('users').document(username).get()
-    if not user_ref.exists:
+    user_data = store.get_user(username)
+    if user_data is None:
         st.sidebar.error("找不到使用者資料。")
         return
 
-    user_data = user_ref.to_dict()
-
-    if not pbkdf2_sha256.verify(password, user_data.get('password_hash', '')):
+    try:
+        password_ok, _ = auth_pool.verify_password(password, user_data.get('password_hash', ''))
+    except auth_pool.AuthBusyError:
+        st.sidebar.warning("系統忙碌中，請稍後再試一次。")
+        return
+    if not password_ok:
         st.sidebar.error("密碼不正確！無法刪除帳號。")
         return
     
@@ -121,22 +170,39 @@ def delete_user_account():
         st.sidebar.error("確認文字不符，請輸入 'DELETE'。")
         return
 
-    try:
-        # 刪除 Firestore 中的卡片子集合 (如果存在)
-        cards_ref = db.collection('users').document(username).collection('cards')
-        for doc in cards_ref.stream():
-            doc.reference.delete()
-        
-        # 刪除使用者主文件
-        db.collection('users').document(username).delete()
-        
-        st.success("您的帳號與所有資料已成功刪除。")
-        time.sleep(2)
+    # 刪除工作在背景執行，畫面改為顯示進度
+    ledger.get_ledger(store).discard(username)
+    invalidate_user_caches(username)
+    account_deletion.get_manager(store).submit(username)
+    st.session_state['deleting_account'] = username
+
+@st.fragment(run_every=1)
+def show_deletion_progress():
+    """刪除帳號進度 (每秒更新)，完成後清除 session 回到登入頁 (在登入頁顯示一次完成訊息)"""
+    username = st.session_state['deleting_account']
+    job = account_deletion.get_manager(store).progress(username)
+    if job is None:
+        # 這個 process 沒有刪除工作 (例如伺服器重新啟動)：以資料庫確認是否真的刪除完成
+        try:
+            finished = store.get_user(username) is None
+        except Exception as e:
+            st.error(f"確認刪除狀態失敗: {e}")
+            return
+        job = {'status': 'done'} if finished else {'status': 'failed', 'error': "刪除工作已中斷"}
+    st.title("🗑️ 正在刪除您的帳號")
+    if job['status'] == 'done':
         for key in list(st.session_state.keys()):
             del st.session_state[key]
+        st.session_state['deletion_notice'] = "您的帳號與所有資料已成功刪除。"
         st.rerun()
-    except Exception as e:
-        st.sidebar.error(f"刪除時發生錯誤: {e}")
+    elif job['status'] == 'failed':
+        st.error(f"刪除時發生錯誤: {job['error']}")
+        if st.button("重試"):
+            account_deletion.get_manager(store).submit(username)
+    elif job['total']:
+        st.progress(min(1.0, job['deleted'] / job['total']), text=f"已刪除 {job['deleted']} / {job['total']} 筆資料")
+    else:
+        st.progress(0.0, text=f"已刪除 {job['deleted']} 筆資料")
 
 
 # --- 主應用程式邏輯 ---
@@ -144,6 +210,12 @@ def main_app():
     st.sidebar.title(f"歡迎, {st.session_state['name']}!")
     st.sidebar.write(f"您目前擁有 {st.session_state.get('popcorn', 0)} 🍿")
     if st.sidebar.button("登出"):
+        try:
+            ledger.get_ledger(store).flush(st.session_state['username'])
+        except Exception:
+            # 寫入失敗的變動會留在帳本中由背景重試
+            pass
+        invalidate_user_caches(st.session_state['username'])
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         st.rerun()
@@ -158,6 +230,10 @@ def main_app():
 
     st.sidebar.markdown("---")
 
+    if metrics.PROFILING and metrics.is_admin(st.session_state['username']):
+        metrics.show_debug_panel()
+        st.sidebar.markdown("---")
+
     st.sidebar.caption("圖源皆來自微博 : 小姚宋敏")
     st.sidebar.caption("程式開發者 : 玥庭(IG : lyw._.sxh)")
 
@@ -180,33 +256,45 @@ def main_app():
             st.session_state.page = "抽卡"
             st.rerun()
 
-    elif st.session_state.page == "翻翻樂":
-        flash_card.start_game(st.session_state['username'], update_popcorn_in_db)
-    
-    elif st.session_state.page == "比大小":
-        more_less.start_game(st.session_state['username'], update_popcorn_in_db)
+        if st.button("🏆 排行榜"):
+            st.session_state.page = "排行榜"
+            st.rerun()
 
-    # --- 新增：導航到抽卡遊戲 ---
-    elif st.session_state.page == "抽卡":
-        gacha.start_game(st.session_state['username'], update_popcorn_in_db)
+    elif st.session_state.page in GAME_MODULES:
+        game = load_game(st.session_state.page)
+        game.start_game(st.session_state['username'], update_popcorn_in_db)
 
 
-def update_popcorn_in_db(username, amount):
-    """更新資料庫中的爆米花數量"""
-    try:
-        user_ref = db.collection('users').document(username)
-        user_ref.update({'popcorn': firestore.Increment(amount)})
+def update_popcorn_in_db(username, amount, idempotency_key=None):
+    """
+    記錄爆米花變動：先累積在帳本中，由背景定期合併寫入資料庫。
+    同一個冪等鍵只會入帳一次 (重複呼叫直接回傳 True)。
+    """
+    if ledger.get_ledger(store).record(username, amount, idempotency_key):
         st.session_state.popcorn = st.session_state.get('popcorn', 0) + amount
-        return True
-    except Exception as e:
-        st.error(f"更新爆米花失敗: {e}")
-        return False
+    return True
+
+def page_label():
+    """效能紀錄用的頁面名稱"""
+    if st.session_state.get('deleting_account'):
+        return "account_deletion"
+    if not st.session_state.get('authentication_status'):
+        return "login"
+    page = GAME_MODULES.get(st.session_state.get('page'), "lobby")
+    if page == "gacha":
+        page = f"gacha:{getattr(game_state.get('gacha'), 'page', 'main_menu')}"
+    return page
 
 # --- 程式進入點 ---
 if 'authentication_status' not in st.session_state:
     st.session_state['authentication_status'] = None
 
-if st.session_state.get('authentication_status'):
-    main_app()
-else:
-    show_login_register_page()
\ No newline at end of file
+with metrics.profile_rerun(page_label()):
+    if st.session_state.get('deleting_account'):
+        show_deletion_progress()
+    elif st.session_state.get('authentication_status'):
+        main_app()
+    else:
+        show_login_register_page()
+
+metrics.mark_first_paint()
@@ -0,0 +1,281 @@
+# metrics.py
+# 效能紀錄：
+#   - 整個 process 的冷啟動時間 (模組載入、資料庫連線、第一次畫面完成)
+#   - 每次頁面執行 (rerun) 的耗時、資料庫操作次數與耗時、送出的圖片大小
+#     設定值 profiling 開啟時才會記錄；metrics_path 有設定時定期寫出 Prometheus 格式的文字檔
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import config
+
+PROCESS_T0 = time.perf_counter()  # 第一次載入本模組的時間點，視為冷啟動起點
+STARTED_AT = time.time()
+
+_lock = threading.Lock()
+_startup_timings = {}  # 名稱 -> 秒數，只保留第一次 (冷啟動) 的數值
+_first_paint_done = False
+
+@contextmanager
+def timed(name):
+    """量測區塊執行時間並記錄到冷啟動報告中 (同名稱只記錄第一次)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup_timing(name, time.perf_counter() - start)
+
+def record_startup_timing(name, seconds):
+    with _lock:
+        _startup_timings.setdefault(name, seconds)
+
+def startup_report():
+    """冷啟動報告：各階段耗時 (毫秒)"""
+    with _lock:
+        timings = dict(_startup_timings)
+    return {
+        'started_at': STARTED_AT,
+        'timings_ms': {name: round(seconds * 1000, 2) for name, seconds in timings.items()},
+    }
+
+def mark_first_paint():
+    """
+    每次頁面執行完畢時呼叫；只有整個 process 的第一次會被記錄，
+    並把冷啟動報告印到 log，若有設定 startup_report_path 也會寫成 JSON 檔。
+    """
+    global _first_paint_done
+    with _lock:
+        if _first_paint_done:
+            return
+        _first_paint_done = True
+        _startup_timings['first_paint'] = time.perf_counter() - PROCESS_T0
+    report = startup_report()
+    print(f"[startup] {json.dumps(report['timings_ms'], ensure_ascii=False)}")
+    report_path = config.get_setting('startup_report_path')
+    if report_path:
+        Path(report_path).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding='utf-8')
+
+# --- Rerun Profiling ---
+
+PROFILING = str(config.get_setting('profiling', '')).lower() in ('1', 'true', 'yes')
+RERUN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 秒
+HISTORY_SIZE = 20            # 每個 session 保留最近幾次執行的紀錄 (除錯面板用)
+WRITE_INTERVAL = 10.0        # Prometheus 檔案的最短寫入間隔 (秒)
+
+class RerunProfile:
+    """一次頁面執行的紀錄"""
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.storage_ops = {}  # 操作名稱 -> [次數, 秒數]
+        self.spans = {}        # 區塊名稱 -> 秒數
+        self.image_count = 0
+        self.image_bytes = 0
+
+    def summary(self):
+        return {
+            'page': self.page,
+            'ms': round(self.seconds * 1000, 1),
+            'storage_ops': {op: {'count': n, 'ms': round(sec * 1000, 1)} for op, (n, sec) in self.storage_ops.items()},
+            'spans_ms': {name: round(sec * 1000, 1) for name, sec in self.spans.items()},
+            'images': self.image_count,
+            'image_kb': round(self.image_bytes / 1024, 1),
+        }
+
+_current_profile = contextvars.ContextVar('rerun_profile', default=None)
+_page_totals = {}     # 頁面 -> {'reruns', 'seconds', 'buckets', 'images', 'image_bytes'}
+_storage_totals = {}  # 操作名稱 -> [次數, 秒數] (包含背景執行緒的操作)
+_failure_totals = {}  # 背景工作名稱 -> 失敗次數 (不論是否開啟 profiling 都會記錄)
+_last_write = 0.0
+
+@contextmanager
+def profile_rerun(page):
+    """
+    包住整個頁面執行；未開啟 profiling 時不做任何事。
+    已在紀錄中時 (例如整頁執行時呼叫到的 fragment) 沿用外層的紀錄。
+    """
+    if not PROFILING or _current_profile.get() is not None:
+        yield _current_profile.get()
+        return
+    profile = RerunProfile(page)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        # st.rerun() / st.stop() 以例外結束本次執行，同樣需要記錄
+        _current_profile.reset(token)
+        profile.seconds = time.perf_counter() - profile.started
+        _finish_rerun(profile)
+
+def _finish_rerun(profile):
+    with _lock:
+        totals = _page_totals.setdefault(profile.page, {
+            'reruns': 0, 'seconds': 0.0, 'buckets': [0] * len(RERUN_BUCKETS), 'images': 0, 'image_bytes': 0,
+        })
+        totals['reruns'] += 1
+        totals['seconds'] += profile.seconds
+        for i, bound in enumerate(RERUN_BUCKETS):
+            if profile.seconds <= bound:
+                totals['buckets'][i] += 1
+        totals['images'] += profile.image_count
+        totals['image_bytes'] += profile.image_bytes
+    try:
+        import streamlit as st
+        history = st.session_state.setdefault('_rerun_profiles', [])
+        history.append(profile.summary())
+        del history[:-HISTORY_SIZE]
+    except Exception:
+        # session 已被清除 (登出) 時不保留
+        pass
+    write_prometheus_file()
+
+@contextmanager
+def span(name):
+    """在目前的執行紀錄中量測一段區塊 (例如刻意的等待)"""
+    profile = _current_profile.get() if PROFILING else None
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.spans[name] = profile.spans.get(name, 0.0) + time.perf_counter() - start
+
+def record_storage_op(op, seconds):
+    profile = _current_profile.get()
+    if profile is not None:
+        entry = profile.storage_ops.setdefault(op, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    with _lock:
+        entry = _storage_totals.setdefault(op, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+def record_failure(task):
+    """背景工作 (例如帳本寫入) 失敗一次"""
+    with _lock:
+        _failure_totals[task] = _failure_totals.get(task, 0) + 1
+
+def failure_totals():
+    with _lock:
+        return dict(_failure_totals)
+
+def record_image(num_bytes):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.image_count += 1
+        profile.image_bytes += num_bytes
+
+class InstrumentedStorage:
+    """包住 Storage，記錄每個操作的次數與耗時 (只在開啟 profiling 時使用)"""
+    def __init__(self, store):
+        self._store = store
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def timed_call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record_storage_op(name, time.perf_counter() - start)
+        setattr(self, name, timed_call)
+        return timed_call
+
+def instrument_storage(store):
+    return InstrumentedStorage(store) if PROFILING else store
+
+# --- Export ---
+
+def prometheus_text():
+    """目前累計數值的 Prometheus 文字格式"""
+    with _lock:
+        pages = {page: dict(totals, buckets=list(totals['buckets'])) for page, totals in _page_totals.items()}
+        storage_ops = {op: list(entry) for op, entry in _storage_totals.items()}
+        failures = dict(_failure_totals)
+    lines = [
+        "# HELP popcorn_rerun_seconds 頁面執行時間",
+        "# TYPE popcorn_rerun_seconds histogram",
+    ]
+    for page, totals in sorted(pages.items()):
+        for bound, count in zip(RERUN_BUCKETS, totals['buckets']):
+            lines.append(f'popcorn_rerun_seconds_bucket{{page="{page}",le="{bound}"}} {count}')
+        lines.append(f'popcorn_rerun_seconds_bucket{{page="{page}",le="+Inf"}} {totals["reruns"]}')
+        lines.append(f'popcorn_rerun_seconds_sum{{page="{page}"}} {totals["seconds"]:.6f}')
+        lines.append(f'popcorn_rerun_seconds_count{{page="{page}"}} {totals["reruns"]}')
+    lines += ["# HELP popcorn_image_bytes_total 送出的圖片大小", "# TYPE popcorn_image_bytes_total counter"]
+    for page, totals in sorted(pages.items()):
+        lines.append(f'popcorn_image_bytes_total{{page="{page}"}} {totals["image_bytes"]}')
+    lines += ["# HELP popcorn_storage_ops_total 資料庫操作次數", "# TYPE popcorn_storage_ops_total counter"]
+    for op, (count, _) in sorted(storage_ops.items()):
+        lines.append(f'popcorn_storage_ops_total{{op="{op}"}} {count}')
+    lines += ["# HELP popcorn_storage_op_seconds_total 資料庫操作耗時", "# TYPE popcorn_storage_op_seconds_total counter"]
+    for op, (_, seconds) in sorted(storage_ops.items()):
+        lines.append(f'popcorn_storage_op_seconds_total{{op="{op}"}} {seconds:.6f}')
+    lines += ["# HELP popcorn_background_failures_total 背景工作失敗次數", "# TYPE popcorn_background_failures_total counter"]
+    for task, count in sorted(failures.items()):
+        lines.append(f'popcorn_background_failures_total{{task="{task}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_file(force=False):
+    """寫到設定值 metrics_path (供 node_exporter textfile collector 讀取)，最多每 WRITE_INTERVAL 秒一次"""
+    global _last_write
+    path = config.get_setting('metrics_path')
+    if not path:
+        return
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _last_write < WRITE_INTERVAL:
+            return
+        _last_write = now
+    tmp_path = f"{path}.tmp"
+    Path(tmp_path).write_text(prometheus_text(), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+def page_totals():
+    """每個頁面的平均執行時間與圖片大小 (除錯面板用)"""
+    with _lock:
+        return [{
+            'page': page,
+            'reruns': totals['reruns'],
+            'avg_ms': round(totals['seconds'] / totals['reruns'] * 1000, 1),
+            'avg_image_kb': round(totals['image_bytes'] / totals['reruns'] / 1024, 1),
+        } for page, totals in sorted(_page_totals.items())]
+
+def is_admin(username):
+    admins = config.get_setting('admin_users', '')
+    return username in {name.strip() for name in str(admins).split(',') if name.strip()}
+
+def show_debug_panel():
+    """管理員的效能除錯面板：本 session 最近幾次執行、各頁面平均與各 session 的遊戲狀態大小"""
+    import streamlit as st
+
+    with st.sidebar.expander("🛠️ 效能紀錄"):
+        history = st.session_state.get('_rerun_profiles', [])
+        if history:
+            st.caption("上一次執行")
+            st.json(history[-1])
+            st.caption("最近幾次執行 (毫秒)")
+            st.dataframe([{'page': h['page'], 'ms': h['ms'], 'image_kb': h['image_kb'],
+                           'storage_ops': sum(op['count'] for op in h['storage_ops'].values())}
+                          for h in reversed(history)], hide_index=True)
+        st.caption("各頁面平均")
+        st.dataframe(page_totals(), hide_index=True)
+        failures = failure_totals()
+        if failures:
+            st.caption(f"背景工作失敗次數: {failures}")
+        import game_state
+        st.caption(f"本 session 的遊戲狀態 (bytes): {game_state.session_memory()}")
+        st.caption("各 session 的遊戲狀態")
+        st.dataframe([{'session': row['session'], 'idle_s': row['idle_s'], 'bytes': row['bytes'],
+                       'games': ", ".join(row['games'])} for row in game_state.memory_report()], hide_index=True)
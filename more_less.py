@@ -1,8 +1,64 @@
 # more_less.py
 import streamlit as st
 import random
-import os
 import time
+import uuid
+import weakref
+import event_log
+import game_state
+import ledger
+import ui_images
+from storage import InsufficientPopcornError
+
+GAME = 'more_less'
+CARD_VALUES = range(1, 8)
+# 遊戲階段
+BETTING, PLAYER_CHOOSES, PLAYER_GUESSES, REVEAL = range(4)
+# 結果 (乘上下注金額就是爆米花變動；下注時已預扣賭注，揭曉時返還 (結果 + 1) 倍。
+# 沒有揭曉就被丟棄的一局 (重置、登出、閒置釋放、session 關閉) 退還賭注)
+WIN, TIE, LOSE = 1, 0, -1
+RESULT_NAMES = {WIN: 'win', TIE: 'tie', LOSE: 'lose'}
+
+class MoreLessState:
+    """一局比大小。deck 是還沒被選走的牌 (洗牌後的順序)，牌面 0 表示還沒決定"""
+    __slots__ = ('stage', 'deck', 'player_card', 'computer_card', 'bet', 'result', 'result_claimed', 'round_id',
+                 'refund', '__weakref__')
+
+    def __init__(self):
+        self.stage = BETTING
+        self.deck = bytes(CARD_VALUES)
+        self.player_card = 0
+        self.computer_card = 0
+        self.bet = 0
+        self.result = TIE
+        self.result_claimed = False       # 用於確保獎勵只領取一次
+        self.round_id = uuid.uuid4().hex  # 帳本的冪等鍵
+        self.refund = None                # 下注後登記的退款 (weakref.finalize)，結算時取消
+
+    def place_bet(self, book, username, bet):
+        """記錄已預扣的賭注；這一局沒有結算就被回收時，由 book (帳本) 退還"""
+        self.bet = bet
+        self.refund = weakref.finalize(self, book.record, username, bet, f"more_less:{self.round_id}:refund")
+
+    def settle(self):
+        """結算賭注 (取消退款)，回傳是否為第一次結算"""
+        if self.result_claimed:
+            return False
+        self.result_claimed = True
+        if self.refund is not None:
+            self.refund.detach()
+        return True
+
+    def shuffle(self):
+        deck = list(self.deck)
+        random.shuffle(deck)
+        self.deck = bytes(deck)
+
+    def choose(self, choice_index):
+        deck = list(self.deck)
+        self.player_card = deck.pop(choice_index)
+        self.computer_card = random.choice(deck)
+        self.deck = bytes(deck)
 
 def start_game(user_email, db_update_func):
     """開始比大小遊戲"""
@@ -10,34 +66,27 @@ def start_game(user_email, db_update_func):
     st.info("💡 遊戲規則：下注後選擇一張牌，再猜測您的牌中人物年齡比電腦的大還是小。")
 
     # --- 遊戲狀態初始化 ---
-    if 'mg_stage' not in st.session_state:
-        initialize_game()
+    state = game_state.get(GAME, MoreLessState)
 
     # 顯示當前爆米花數量
     current_popcorn = st.session_state.get('popcorn', 0)
     st.sidebar.success(f"您目前擁有 {current_popcorn} 🍿")
 
     # --- 根據不同遊戲階段顯示對應介面 ---
-    if st.session_state.mg_stage == 'betting':
-        show_betting_stage(current_popcorn)
-    elif st.session_state.mg_stage == 'player_chooses':
-        show_player_choice_stage()
-    elif st.session_state.mg_stage == 'player_guesses':
-        show_guessing_stage()
-    elif st.session_state.mg_stage == 'reveal':
-        show_reveal_stage(user_email, db_update_func)
+    if state.stage == BETTING:
+        show_betting_stage(state, user_email, current_popcorn)
+    elif state.stage == PLAYER_CHOOSES:
+        show_player_choice_stage(state)
+    elif state.stage == PLAYER_GUESSES:
+        show_guessing_stage(state)
+    elif state.stage == REVEAL:
+        show_reveal_stage(state, user_email, db_update_func)
 
 def initialize_game():
-    """初始化或重置遊戲狀態"""
-    st.session_state.mg_stage = 'betting'
-    st.session_state.mg_deck = list(range(1, 8))
-    st.session_state.mg_player_card = None
-    st.session_state.mg_computer_card = None
-    st.session_state.mg_bet_amount = 0
-    st.session_state.mg_game_message = ""
-    st.session_state.mg_result_claimed = False # 用於確保獎勵只領取一次
-
-def show_betting_stage(current_popcorn):
+    """重置遊戲狀態 (下次執行時重新開始一局)"""
+    game_state.reset(GAME)
+
+def show_betting_stage(state, user_email, current_popcorn):
     """顯示下注介面"""
     st.subheader("STEP 1: 請下注")
     if current_popcorn == 0:
@@ -56,114 +105,117 @@ def show_betting_stage(current_popcorn):
         )
         submitted = st.form_submit_button("下好離手！")
         if submitted:
-            st.session_state.mg_bet_amount = bet_amount
-            st.session_state.mg_stage = 'player_chooses'
-            random.shuffle(st.session_state.mg_deck)
+            # 下注時直接在資料庫中原子地預扣賭注，多個分頁同時下注也不會超出餘額
+            book = ledger.get_ledger(st.session_state['storage'])
+            try:
+                balance = book.spend(user_email, bet_amount, f"more_less:{state.round_id}:bet")
+            except InsufficientPopcornError as e:
+                st.session_state.popcorn = e.balance
+                st.error(f"爆米花不足！您目前只有 {e.balance} 🍿。")
+                return
+            except Exception as e:
+                st.error(f"下注失敗: {e}")
+                return
+            st.session_state.popcorn = balance
+            state.place_bet(book, user_email, bet_amount)
+            state.stage = PLAYER_CHOOSES
+            state.shuffle()
             st.rerun()
+    # 下注時先讓瀏覽器下載所有卡面，翻牌時不必等待
+    prefetch_faces()
 
-def show_player_choice_stage():
-    """顯示玩家選牌介面"""
-    st.subheader(f"STEP 2: 請選擇一張牌 (已下注 {st.session_state.mg_bet_amount} 🍿)")
-    image_folder = os.path.join("image", "more_less")
-    card_back_path = os.path.join(image_folder, "卡背.jpg")
+def prefetch_faces():
+    """一律預先下載全部卡面：只下載電腦的牌會讓網址洩漏答案"""
+    ui_images.prefetch_game_cards("more_less", ["card_back", *CARD_VALUES])
 
-    cols = st.columns(7)
-    for i in range(7):
+def show_player_choice_stage(state):
+    """顯示玩家選牌介面"""
+    st.subheader(f"STEP 2: 請選擇一張牌 (已下注 {state.bet} 🍿)")
+    cols = st.columns(len(state.deck))
+    for i in range(len(state.deck)):
         with cols[i]:
-            st.image(card_back_path, use_container_width=True)
+            ui_images.show_game_card("more_less", "card_back")
             if st.button(f"選擇", key=f"choice_{i}", use_container_width=True):
-                handle_player_choice(i)
+                handle_player_choice(state, i)
                 st.rerun()
+    prefetch_faces()
 
-def handle_player_choice(choice_index):
+def handle_player_choice(state, choice_index):
     """處理玩家選牌邏輯"""
-    deck = st.session_state.mg_deck
-    st.session_state.mg_player_card = deck.pop(choice_index)
-    st.session_state.mg_computer_card = random.choice(deck)
-    st.session_state.mg_stage = 'player_guesses'
+    state.choose(choice_index)
+    state.stage = PLAYER_GUESSES
 
-def show_guessing_stage():
+def show_guessing_stage(state):
     """顯示猜大小介面"""
     st.subheader("STEP 3: 您的牌比電腦的大還是小？")
-    image_folder = os.path.join("image", "more_less")
-    card_back_path = os.path.join(image_folder, "卡背.jpg")
-    player_card_path = os.path.join(image_folder, f"{st.session_state.mg_player_card}.jpg")
-
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("<h4 style='text-align: center;'>您的牌</h4>", unsafe_allow_html=True)
-        st.image(player_card_path, use_container_width=True)
+        ui_images.show_game_card("more_less", state.player_card)
     with col2:
         st.markdown("<h4 style='text-align: center;'>電腦的牌</h4>", unsafe_allow_html=True)
-        st.image(card_back_path, use_container_width=True)
+        ui_images.show_game_card("more_less", "card_back")
 
     st.markdown("---")
     c1, c2 = st.columns(2)
     if c1.button("🔼 比電腦大", use_container_width=True):
-        handle_guess('bigger')
+        handle_guess(state, 'bigger')
         st.rerun()
     if c2.button("🔽 比電腦小", use_container_width=True):
-        handle_guess('smaller')
+        handle_guess(state, 'smaller')
         st.rerun()
 
-def handle_guess(guess):
+def handle_guess(state, guess):
     """處理猜測邏輯並計算結果"""
-    player_card = st.session_state.mg_player_card
-    computer_card = st.session_state.mg_computer_card
-    bet = st.session_state.mg_bet_amount
+    player_card = state.player_card
+    computer_card = state.computer_card
 
-    result = "win" if (guess == 'bigger' and player_card > computer_card) or \
-                       (guess == 'smaller' and player_card < computer_card) else "lose"
+    result = WIN if (guess == 'bigger' and player_card > computer_card) or \
+                    (guess == 'smaller' and player_card < computer_card) else LOSE
     
     if player_card == computer_card:
-        result = "tie"
+        result = TIE
 
-    if result == "win":
-        st.session_state.mg_game_message = f"✅ 猜對了！您贏得了 {bet} 爆米花！"
-    elif result == "lose":
-        st.session_state.mg_game_message = f"❌ 猜錯了！您失去了 {bet} 爆米花！"
+    state.result = result
+    state.stage = REVEAL
+
+def result_message(state):
+    if state.result == WIN:
+        return f"✅ 猜對了！您贏得了 {state.bet} 爆米花！"
+    elif state.result == LOSE:
+        return f"❌ 猜錯了！您失去了 {state.bet} 爆米花！"
     else: # tie
-        st.session_state.mg_game_message = f"🤝 平手！下注的 {bet} 爆米花已退還。"
-    
-    st.session_state.mg_stage = 'reveal'
+        return f"🤝 平手！下注的 {state.bet} 爆米花已退還。"
 
-def show_reveal_stage(user_email, db_update_func):
+def show_reveal_stage(state, user_email, db_update_func):
     """顯示最終結果"""
     st.subheader("🎉 結果揭曉！")
-    image_folder = os.path.join("image", "more_less")
-    player_card_path = os.path.join(image_folder, f"{st.session_state.mg_player_card}.jpg")
-    computer_card_path = os.path.join(image_folder, f"{st.session_state.mg_computer_card}.jpg")
-
     col1, col2 = st.columns(2)
     with col1:
         st.markdown(f"<h4 style='text-align: center;'>您的牌</h4>", unsafe_allow_html=True)
-        st.image(player_card_path, use_container_width=True)
+        ui_images.show_game_card("more_less", state.player_card)
     with col2:
         st.markdown(f"<h4 style='text-align: center;'>電腦的牌</h4>", unsafe_allow_html=True)
-        st.image(computer_card_path, use_container_width=True)
+        ui_images.show_game_card("more_less", state.computer_card)
     
     st.markdown("---")
 
-    message = st.session_state.mg_game_message
-    if "贏得" in message:
+    message = result_message(state)
+    if state.result == WIN:
         st.success(message)
-    elif "失去" in message:
+    elif state.result == LOSE:
         st.error(message)
     else:
         st.info(message)
     
-    # 更新資料庫中的爆米花數量 (只在第一次顯示結果時執行)
-    if not st.session_state.mg_result_claimed:
-        popcorn_change = 0
-        if "贏得" in message:
-            popcorn_change = st.session_state.mg_bet_amount
-        elif "失去" in message:
-            popcorn_change = -st.session_state.mg_bet_amount
-        
-        if popcorn_change != 0:
-            db_update_func(user_email, popcorn_change)
-        
-        st.session_state.mg_result_claimed = True
+    # 結算預扣的賭注：贏返還兩倍、平手退還、輸不返還 (只在第一次顯示結果時執行)
+    if state.settle():
+        payout = (state.result + 1) * state.bet
+        if payout:
+            db_update_func(user_email, payout, f"more_less:{state.round_id}")
+        popcorn_change = state.result * state.bet
+        event_log.log('more_less', user_email, bet=state.bet, pc=state.player_card, cc=state.computer_card,
+                      r=RESULT_NAMES[state.result], d=popcorn_change)
 
     c1, c2 = st.columns(2)
     if c1.button("再玩一局", use_container_width=True):
@@ -172,4 +224,4 @@ def show_reveal_stage(user_email, db_update_func):
     if c2.button("返回大廳", use_container_width=True):
         initialize_game()
         st.session_state.page = "主頁"
-        st.rerun()
\ No newline at end of file
+        st.rerun()
@@ -0,0 +1,237 @@
+# pool_registry.py
+# 卡池設定：從 pools.toml (或 pool_config_path 設定的路徑) 讀取每個卡池的機率、保底、價格、
+# 是否開放與開放期間。
+#   - 設定檔修改後會自動重新讀取 (最多每秒檢查一次修改時間)，不需要重新啟動伺服器，
+#     進行中的 session 也不會被中斷；新設定有誤時繼續使用上一份設定
+#   - 抽樣表以 (卡池, 機率, 保底) 為 key 快取，設定沒變的卡池重新讀取後仍共用同一份
+#   python pool_registry.py     檢查設定檔並列出各卡池目前狀態
+import argparse
+import os
+import threading
+import time
+import tomllib
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import asset_manifest
+import config
+import gacha_engine
+
+DEFAULT_CONFIG_PATH = "pools.toml"
+# 兩次檢查設定檔修改時間的最短間隔 (秒)
+CHECK_INTERVAL = 1.0
+
+# 卡池狀態
+OPEN = 'open'
+DISABLED = 'disabled'
+UPCOMING = 'upcoming'
+ENDED = 'ended'
+
+DEFAULTS = {
+    'rates': gacha_engine.DEFAULT_RATES,
+    'guarantee_rates': gacha_engine.GUARANTEE_RATES,
+    'guarantee_block': gacha_engine.GUARANTEE_BLOCK,
+    'single_cost': 10,
+    'ten_pull_cost': 100,
+}
+
+class PoolConfigError(ValueError):
+    """設定檔格式錯誤"""
+
+# --- Pool Config ---
+
+def _parse_time(value, field, name):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise PoolConfigError(f"卡池 {name} 的 {field} 不是 ISO 8601 時間: {value}")
+    if not isinstance(value, datetime):
+        raise PoolConfigError(f"卡池 {name} 的 {field} 必須是時間")
+    # 沒有時區的時間視為 UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _parse_rates(value, field, name):
+    if not isinstance(value, dict) or not value:
+        raise PoolConfigError(f"卡池 {name} 的 {field} 必須是稀有度對機率的表")
+    unknown = set(value) - set(gacha_engine.RARITIES)
+    if unknown:
+        raise PoolConfigError(f"卡池 {name} 的 {field} 有未知的稀有度: {', '.join(sorted(unknown))}")
+    if any(not isinstance(v, (int, float)) or v < 0 for v in value.values()) or sum(value.values()) <= 0:
+        raise PoolConfigError(f"卡池 {name} 的 {field} 必須是非負數且總和大於 0")
+    # 排序後轉成 tuple，可以當作抽樣表快取的 key
+    return tuple(sorted((rarity, float(rate)) for rarity, rate in value.items()))
+
+class PoolConfig:
+    """單一卡池的設定 (建立後不再修改，重新讀取時整份替換)"""
+    def __init__(self, entry, defaults):
+        name = entry.get('name')
+        if not isinstance(name, str) or not name:
+            raise PoolConfigError("每個卡池都必須有 name")
+        merged = dict(defaults, **entry)
+        self.name = name
+        self.enabled = bool(merged.get('enabled', True))
+        self.start = _parse_time(merged.get('start'), 'start', name)
+        self.end = _parse_time(merged.get('end'), 'end', name)
+        if self.start and self.end and self.start >= self.end:
+            raise PoolConfigError(f"卡池 {name} 的 start 必須早於 end")
+        self.rates = _parse_rates(merged['rates'], 'rates', name)
+        self.guarantee_rates = _parse_rates(merged['guarantee_rates'], 'guarantee_rates', name)
+        for field in ('guarantee_block', 'single_cost', 'ten_pull_cost'):
+            value = merged[field]
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise PoolConfigError(f"卡池 {name} 的 {field} 必須是非負整數")
+            setattr(self, field, value)
+
+    def cost(self, num_draws):
+        """抽 num_draws 張的爆米花：每 10 張以十連抽計價，其餘以單抽計價"""
+        return (num_draws // 10) * self.ten_pull_cost + (num_draws % 10) * self.single_cost
+
+    def status(self, now=None):
+        """OPEN / DISABLED / UPCOMING / ENDED"""
+        if not self.enabled:
+            return DISABLED
+        now = now or datetime.now(timezone.utc)
+        if self.start and now < self.start:
+            return UPCOMING
+        if self.end and now >= self.end:
+            return ENDED
+        return OPEN
+
+    def is_open(self, now=None):
+        return self.status(now) == OPEN
+
+    def status_text(self, now=None):
+        """卡池無法抽卡時顯示給玩家的原因，可以抽卡時回傳 None"""
+        status = self.status(now)
+        if status == DISABLED:
+            return "此卡池正在開發中，敬請期待！"
+        if status == UPCOMING:
+            return f"此卡池將於 {self.start.astimezone():%Y-%m-%d %H:%M} 開放。"
+        if status == ENDED:
+            return f"此卡池已於 {self.end.astimezone():%Y-%m-%d %H:%M} 結束。"
+        return None
+
+    def sampler(self):
+        """此卡池的抽樣表 (快取，設定沒變時共用)"""
+        return compiled_sampler(self.name, self.rates, self.guarantee_rates, self.guarantee_block)
+
+def parse_config(data):
+    """解析 pools.toml 的內容，回傳依檔案順序排列的 {卡池名稱: PoolConfig}"""
+    defaults = dict(DEFAULTS, **data.get('defaults', {}))
+    pools = {}
+    for entry in data.get('pools', []):
+        pool = PoolConfig(entry, defaults)
+        if pool.name in pools:
+            raise PoolConfigError(f"卡池 {pool.name} 重複定義")
+        pools[pool.name] = pool
+    return pools
+
+def load_config(path):
+    with open(path, 'rb') as f:
+        try:
+            return parse_config(tomllib.load(f))
+        except tomllib.TOMLDecodeError as e:
+            raise PoolConfigError(f"{path} 格式錯誤: {e}")
+
+# --- Compiled Samplers ---
+
+@lru_cache(maxsize=64)
+def compiled_sampler(pool_name, rates, guarantee_rates, guarantee_block):
+    """依卡池與機率設定建立抽樣表 (整個 process 共用)"""
+    return gacha_engine.PoolSampler(asset_manifest.pool_cards(pool_name), dict(rates),
+                                    dict(guarantee_rates), guarantee_block)
+
+# --- Registry ---
+
+class PoolRegistry:
+    """
+    目前的卡池設定。pools() 每次呼叫時 (最多每 CHECK_INTERVAL 秒) 檢查設定檔修改時間，
+    有變動才重新讀取；讀取失敗時保留舊設定並記錄錯誤。
+    """
+    def __init__(self, path=None, check_interval=CHECK_INTERVAL):
+        self.path = path or config.get_setting('pool_config_path', DEFAULT_CONFIG_PATH)
+        self.check_interval = check_interval
+        self.error = None
+        self._pools = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload(force=True)
+
+    def reload(self, force=False):
+        """設定檔有變動 (或 force) 時重新讀取，回傳是否換成了新設定"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            self.error = f"找不到卡池設定檔 {self.path}: {e}"
+            return False
+        if not force and mtime == self._mtime:
+            return False
+        try:
+            pools = load_config(self.path)
+        except (OSError, PoolConfigError) as e:
+            # 記下 mtime，同一份錯誤的檔案不會每秒重新解析
+            self._mtime = mtime
+            self.error = str(e)
+            print(f"[pool_registry] 卡池設定有誤，繼續使用上一份設定: {e}")
+            return False
+        self._pools, self._mtime, self.error = pools, mtime, None
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            self.reload()
+
+    def pools(self):
+        """所有卡池設定 (依設定檔順序)"""
+        self._maybe_reload()
+        return list(self._pools.values())
+
+    def get(self, pool_name):
+        """指定卡池的設定，沒有時回傳 None"""
+        self._maybe_reload()
+        return self._pools.get(pool_name)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """整個 process 共用同一個 registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PoolRegistry()
+    return _registry
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="檢查卡池設定")
+    parser.add_argument('--config', default=None, help="設定檔路徑 (預設 pool_config_path 設定或 pools.toml)")
+    args = parser.parse_args(argv)
+
+    path = args.config or config.get_setting('pool_config_path', DEFAULT_CONFIG_PATH)
+    pools = load_config(path)
+    for pool in pools.values():
+        rates = " ".join(f"{rarity} {rate:g}" for rarity, rate in pool.rates)
+        print(f"{pool.name}：{pool.status()}  單抽 {pool.cost(1)} / 十連 {pool.cost(10)}  機率 {rates}  "
+              f"每 {pool.guarantee_block} 抽保底")
+        if pool.status() == DISABLED:
+            continue
+        try:
+            pool.sampler()
+        except ValueError as e:
+            print(f"  無法建立抽樣表: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# sprite_atlas.py
+# 翻翻樂與比大小的卡面合併圖 (sprite atlas)：python sprite_atlas.py
+# 每個遊戲的所有卡面與卡背縮到顯示用的大小後拼成一張圖，存為 static/atlas/<遊戲>.<內容 hash>.webp，
+# 並寫出 static/atlas/index.json (各卡面在圖中的格子位置)。
+# 盤面上每張卡只是一段以 CSS 裁切合併圖的 HTML，整個遊戲只需下載一張可長期快取的圖片。
+# 與 static_assets 相同，需開啟 server.enableStaticServing；未建置時退回逐張 st.image。
+# 部署時由 build_assets.py 依序建置全部衍生圖檔 (本工具為其中一步)。
+import argparse
+import hashlib
+import html
+import json
+import math
+from functools import lru_cache
+from pathlib import Path
+
+import asset_manifest
+import static_assets
+
+ATLAS_DIR = static_assets.STATIC_ROOT / "atlas"
+INDEX_PATH = ATLAS_DIR / "index.json"
+URL_PREFIX = "/app/static/atlas/"
+GAMES = ('flash_card', 'more_less')
+# 每格的寬度 (px)：約為盤面上卡片顯示寬度的兩倍，高解析度螢幕也清楚
+DEFAULT_CELL_WIDTH = 320
+CARD_BACK = 'card_back'
+
+# --- Build ---
+
+def game_sprites(game):
+    """{卡面名稱: 圖片路徑}，包含卡背 (名稱為 'card_back')"""
+    assets = asset_manifest.load_manifest()['games'][game]
+    sprites = dict(assets['faces'])
+    if assets['card_back']:
+        sprites[CARD_BACK] = assets['card_back']
+    return sprites
+
+def _source_key(sprites, cell_width):
+    """來源圖片內容與格子寬度的 hash，沒變時沿用舊的合併圖"""
+    digest = hashlib.sha256(str(cell_width).encode())
+    for name, path in sorted(sprites.items()):
+        info = asset_manifest.file_info(path) or {}
+        digest.update(f"{name}\0{path}\0{info.get('sha256') or info.get('size')}\0".encode())
+    return digest.hexdigest()
+
+def build_atlas(game, cell_width=DEFAULT_CELL_WIDTH, quality=80, atlas_dir=ATLAS_DIR):
+    """
+    產生單一遊戲的合併圖，回傳索引項目。
+    格子的長寬比取卡背 (沒有卡背時取第一張卡面)，每張圖等比例縮放後置中裁切填滿格子。
+    """
+    from PIL import Image, ImageOps  # 只有建置時才需要 Pillow
+
+    sprites = game_sprites(game)
+    if not sprites:
+        raise ValueError(f"{game} 沒有任何卡面")
+    names = sorted(sprites)
+    with Image.open(sprites.get(CARD_BACK, sprites[names[0]])) as reference:
+        cell_height = round(reference.height * cell_width / reference.width)
+    columns = math.ceil(math.sqrt(len(names)))
+    rows = math.ceil(len(names) / columns)
+
+    sheet = Image.new('RGB', (columns * cell_width, rows * cell_height), 'white')
+    positions = {}
+    for i, name in enumerate(names):
+        col, row = i % columns, i // columns
+        with Image.open(sprites[name]) as im:
+            cell = ImageOps.fit(im.convert('RGB'), (cell_width, cell_height), Image.LANCZOS)
+        sheet.paste(cell, (col * cell_width, row * cell_height))
+        positions[name] = [col, row]
+
+    data_path = Path(atlas_dir) / f"{game}.tmp.webp"
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(data_path, 'WEBP', quality=quality, method=6)
+    content_hash = hashlib.sha256(data_path.read_bytes()).hexdigest()[:static_assets.HASH_LENGTH]
+    target = data_path.with_name(f"{game}.{content_hash}.webp")
+    data_path.replace(target)
+    return {
+        'url': URL_PREFIX + target.name,
+        'file': target.name,
+        'cell': [cell_width, cell_height],
+        'grid': [columns, rows],
+        'sprites': positions,
+        'source': _source_key(sprites, cell_width),
+    }
+
+def build_all(games=GAMES, cell_width=DEFAULT_CELL_WIDTH, quality=80, atlas_dir=ATLAS_DIR):
+    """建置所有遊戲的合併圖並寫出索引，來源沒變的遊戲直接沿用，回傳 (重新建置數, 沿用數)"""
+    atlas_dir = Path(atlas_dir)
+    old_index = load_index.__wrapped__(atlas_dir / INDEX_PATH.name)
+    index = {}
+    built = reused = 0
+    for game in games:
+        old = old_index.get(game)
+        if (old and old.get('source') == _source_key(game_sprites(game), cell_width)
+                and (atlas_dir / old['file']).exists()):
+            index[game] = old
+            reused += 1
+        else:
+            index[game] = build_atlas(game, cell_width, quality, atlas_dir)
+            built += 1
+
+    keep = {entry['file'] for entry in index.values()} | {INDEX_PATH.name}
+    for stale in atlas_dir.iterdir():
+        if stale.name not in keep:
+            stale.unlink()
+    (atlas_dir / INDEX_PATH.name).write_text(json.dumps(index, ensure_ascii=False, indent=1, sort_keys=True), encoding='utf-8')
+    load_index.cache_clear()
+    return built, reused
+
+# --- Runtime Lookup ---
+
+@lru_cache(maxsize=1)
+def load_index(index_path=INDEX_PATH):
+    """讀取合併圖索引 (整個 process 只讀一次)，尚未建置時回傳空字典"""
+    try:
+        return json.loads(Path(index_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+@lru_cache(maxsize=len(GAMES))
+def atlas_for(game):
+    """遊戲的合併圖索引項目；未開啟靜態檔案服務或尚未建置時回傳 None"""
+    try:
+        import streamlit as st
+        enabled = st.get_option("server.enableStaticServing")
+    except Exception:
+        enabled = False
+    return load_index().get(game) if enabled else None
+
+def sprite_html(atlas, name, label=""):
+    """
+    以 CSS 裁切合併圖中的一格：寬度隨容器縮放，background-position 以百分比定位，
+    所以任何顯示大小都對得準。
+    """
+    col, row = atlas['sprites'][str(name)]
+    columns, rows = atlas['grid']
+    cell_width, cell_height = atlas['cell']
+    x = col * 100 / (columns - 1) if columns > 1 else 0
+    y = row * 100 / (rows - 1) if rows > 1 else 0
+    return (f'<div role="img" aria-label="{html.escape(label)}" style="width:100%;'
+            f'aspect-ratio:{cell_width}/{cell_height};border-radius:6px;'
+            f'background:url({html.escape(atlas["url"])}) {x:.4f}% {y:.4f}% / {columns * 100}% {rows * 100}% no-repeat;"></div>')
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="建置翻翻樂與比大小的卡面合併圖")
+    parser.add_argument('--cell-width', type=int, default=DEFAULT_CELL_WIDTH, help="每格寬度 (px)")
+    parser.add_argument('--quality', type=int, default=80, help="WebP 壓縮品質")
+    args = parser.parse_args(argv)
+
+    built, reused = build_all(cell_width=args.cell_width, quality=args.quality)
+    print(f"完成！重新建置 {built} 張合併圖，沿用 {reused} 張。索引檔：{INDEX_PATH.as_posix()}")
+
+if __name__ == "__main__":
+    main()
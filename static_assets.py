@@ -0,0 +1,149 @@
+# static_assets.py
+# 卡圖的靜態網址：python static_assets.py 會把 image/ 下的原圖與縮圖複製到
+# static/cards/<內容 hash>.<副檔名>，並寫出 static/cards/index.json (圖片路徑 -> 網址)。
+# 縮圖有更新時需在 thumbnails.py 之後重新執行。
+# 部署時由 build_assets.py 依序建置全部衍生圖檔 (本工具為其中一步)。
+#
+# 檔名就是內容 hash，同一個網址的內容永遠不變，瀏覽器可以長期快取；
+# 相同內容的圖片 (例如翻翻樂的成對卡片) 共用同一個網址。
+#   streamlit run main.py   : 需在 .streamlit/config.toml 開啟 server.enableStaticServing，
+#                             Streamlit 會附上 ETag / Last-Modified
+#   uvicorn asgi:app        : 另外加上一年期的 Cache-Control: immutable，並以 304 回應重複請求
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+from pathlib import Path
+
+import asset_manifest
+import thumbnails
+
+STATIC_ROOT = Path("static")
+CARDS_DIR = STATIC_ROOT / "cards"
+INDEX_PATH = CARDS_DIR / "index.json"
+URL_PREFIX = "/app/static/cards/"
+HASH_LENGTH = 20
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# --- Build ---
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_images():
+    """所有需要靜態網址的圖片 (資源索引中的原圖 + 已產生的縮圖)"""
+    paths = set(asset_manifest.load_manifest()['files'])
+    for entry in thumbnails.load_index().values():
+        paths.update(entry.get('thumbs', {}).values())
+    return sorted(paths)
+
+def build_static(cards_dir=CARDS_DIR, prune=True):
+    """
+    複製 (可以時使用硬連結) 所有圖片並寫出索引，回傳 (新增檔案數, 索引筆數)。
+    prune=True 時刪除已不在索引中的舊檔案。
+    """
+    cards_dir = Path(cards_dir)
+    cards_dir.mkdir(parents=True, exist_ok=True)
+    index = {}
+    created = 0
+    for path in source_images():
+        source = Path(path)
+        if not source.is_file():
+            continue
+        # 一律重新計算 hash：網址內容不可變，不能沿用可能過時的索引
+        name = f"{_sha256(source)[:HASH_LENGTH]}{source.suffix.lower()}"
+        target = cards_dir / name
+        if not target.exists():
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+            created += 1
+        index[path] = URL_PREFIX + name
+
+    if prune:
+        keep = {url[len(URL_PREFIX):] for url in index.values()} | {INDEX_PATH.name}
+        for stale in cards_dir.iterdir():
+            if stale.name not in keep:
+                stale.unlink()
+    (cards_dir / INDEX_PATH.name).write_text(json.dumps(index, ensure_ascii=False, indent=1, sort_keys=True), encoding='utf-8')
+    load_index.cache_clear()
+    return created, len(index)
+
+# --- Runtime Lookup ---
+
+@lru_cache(maxsize=1)
+def load_index(index_path=INDEX_PATH):
+    """讀取網址索引 (整個 process 只讀一次)，尚未建置時回傳空字典"""
+    try:
+        return json.loads(Path(index_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+@lru_cache(maxsize=1)
+def serving_enabled():
+    """Streamlit 有開啟靜態檔案服務且已建置索引時才使用靜態網址"""
+    try:
+        import streamlit as st
+        enabled = st.get_option("server.enableStaticServing")
+    except Exception:
+        enabled = False
+    return bool(enabled) and bool(load_index())
+
+def url_for(image_path):
+    """圖片路徑對應的靜態網址；沒有對應時回傳原路徑 (由 st.image 讀檔送出)"""
+    if not serving_enabled():
+        return image_path
+    return load_index().get(image_path, image_path)
+
+# --- ASGI Middleware ---
+
+class ImmutableCardsMiddleware:
+    """
+    內容 hash 網址的快取標頭：Cache-Control immutable、以檔名 hash 作為 ETag，
+    If-None-Match 相符時直接回 304，不讀檔案。
+    """
+    def __init__(self, app, prefix=URL_PREFIX):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] != 'http' or not path.startswith(self.prefix) or path.endswith(INDEX_PATH.name):
+            await self.app(scope, receive, send)
+            return
+
+        etag = f'"{Path(path).stem}"'.encode()
+        cache_headers = [(b'cache-control', CACHE_CONTROL.encode()), (b'etag', etag)]
+        if_none_match = dict(scope.get('headers', [])).get(b'if-none-match', b'')
+        if etag in [tag.strip() for tag in if_none_match.split(b',')]:
+            await send({'type': 'http.response.start', 'status': 304, 'headers': cache_headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start' and message['status'] == 200:
+                headers = [(k, v) for k, v in message.get('headers', []) if k.lower() not in (b'cache-control', b'etag')]
+                message = dict(message, headers=headers + cache_headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="建置卡圖的靜態網址")
+    parser.add_argument('--no-prune', action='store_true', help="保留已不在索引中的舊檔案")
+    args = parser.parse_args(argv)
+
+    created, total = build_static(prune=not args.no_prune)
+    print(f"完成！新增 {created} 個檔案，共 {total} 張圖片。索引檔：{INDEX_PATH.as_posix()}")
+
+if __name__ == "__main__":
+    main()
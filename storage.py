@@ -0,0 +1,495 @@
+# storage.py
+# 資料存取介面：使用者、爆米花餘額、卡片庫存、排行榜分片。
+# 由設定值 storage_backend 選擇實作：
+#   firestore : 正式環境 (storage_firestore.py)
+#   sqlite    : 本機單檔資料庫，路徑由 sqlite_path 設定
+#   memory    : 只存在記憶體中，用於效能測試與壓力測試
+import abc
+import json
+import sqlite3
+import threading
+import time
+
+import config
+
+BACKENDS = ('firestore', 'sqlite', 'memory')
+DEFAULT_SQLITE_PATH = "popcorn.db"
+
+class InsufficientPopcornError(Exception):
+    """扣款時讀到的最新餘額不足"""
+    def __init__(self, balance, cost):
+        super().__init__(f"需要 {cost} 爆米花，目前只有 {balance}")
+        self.balance = balance
+        self.cost = cost
+
+class Storage(abc.ABC):
+    """
+    所有實作都必須提供相同的語意：
+    - apply_popcorn_batch、spend_popcorn 與 commit_draw 是原子操作 (全部成功或全部失敗)
+    - 同一個 batch_id 的爆米花批次只會入帳一次，同一個冪等鍵也只會入帳一次 (保存在資料庫中，重新啟動後仍有效)
+      (Firestore 只保留每位使用者最近 RECENT_KEYS 個冪等鍵，見 storage_firestore.py)
+    """
+    name = None
+
+    # --- 使用者 ---
+
+    @abc.abstractmethod
+    def get_user(self, username):
+        """回傳使用者資料 dict (name, password_hash, popcorn, ...)，不存在時回傳 None"""
+
+    @abc.abstractmethod
+    def create_user(self, username, data):
+        """建立使用者，名稱已被使用時回傳 False"""
+
+    @abc.abstractmethod
+    def record_login(self, username, password_hash=None):
+        """記錄登入時間，password_hash 不為 None 時一併更新密碼雜湊"""
+
+    def get_balance(self, username):
+        user = self.get_user(username)
+        return user.get('popcorn', 0) if user else 0
+
+    # --- 爆米花 ---
+
+    @abc.abstractmethod
+    def apply_popcorn_batch(self, username, batch_id, entries):
+        """
+        原子地將 entries ({冪等鍵: 變動量}) 中尚未入帳的鍵加到餘額並保存明細，
+        回傳 (入帳後餘額, 實際入帳的 {冪等鍵: 變動量})。batch_id 已入帳過或所有鍵都已入帳過時不做任何事；
+        使用者不存在或刪除中時不做任何事並回傳 (None, {})。
+        """
+
+    @abc.abstractmethod
+    def spend_popcorn(self, username, idempotency_key, cost):
+        """
+        原子地檢查餘額並扣除 cost (例如下注)，回傳 (扣款後餘額, 是否為新的扣款)。
+        同一個冪等鍵已扣過時不再扣款；餘額不足或使用者不存在時拋出 InsufficientPopcornError。
+        """
+
+    # --- 卡片 ---
+
+    @abc.abstractmethod
+    def read_owned_cards(self, username):
+        """回傳 {圖片路徑: 張數}"""
+
+    @abc.abstractmethod
+    def commit_draw(self, username, cost, card_paths):
+        """原子地檢查餘額、扣除 cost 並加入所有卡片，回傳扣款後餘額；餘額不足時拋出 InsufficientPopcornError"""
+
+    # --- 排行榜 ---
+
+    @abc.abstractmethod
+    def update_leaderboard(self, board, shard, username, entry, capacity):
+        """
+        原子地更新排行榜分片 ({username: entry})：entry 為 None 時移除該使用者，
+        超過 capacity 筆時只保留分數最高的 capacity 筆 (見 merge_leaderboard_entry)。
+        內容沒有改變時不寫入。回傳更新後的分片內容。
+        """
+
+    @abc.abstractmethod
+    def read_leaderboard(self, board, num_shards):
+        """讀取排行榜的所有分片，回傳合併後的 {username: entry} (讀取次數只與分片數有關)"""
+
+    # --- 刪除 ---
+
+    @abc.abstractmethod
+    def delete_user_data(self, username, progress=None, parallel=None):
+        """
+        刪除使用者所有資料。刪除期間使用者會被標記為 deleting (無法登入)，
+        中斷後再次呼叫會繼續。progress(deleted, total) 會在過程中被呼叫；
+        parallel 為同時送出的批次數，不支援平行刪除的實作會忽略。
+        """
+
+    @abc.abstractmethod
+    def pending_deletions(self):
+        """被中斷、尚未完成的刪除工作 (使用者名稱列表)"""
+
+    @abc.abstractmethod
+    def inactive_users(self, days):
+        """超過 days 天未登入的使用者 (沒有登入紀錄的不列入)"""
+
+    def ping(self):
+        """預先建立連線"""
+
+def merge_leaderboard_entry(entries, username, entry, capacity):
+    """
+    排行榜分片的更新邏輯 (各實作共用)，回傳新的 {username: entry}。
+    分片中已有 'at' (讀取分數的時間) 較新的項目時保留原項目，避免較晚寫入的舊資料蓋掉新資料。
+    """
+    entries = dict(entries)
+    current = entries.get(username)
+    if entry is None:
+        entries.pop(username, None)
+    elif current is None or current.get('at', 0) <= entry.get('at', 0):
+        entries[username] = entry
+    if len(entries) > capacity:
+        ranked = sorted(entries.items(), key=lambda item: item[1]['score'], reverse=True)
+        entries = dict(ranked[:capacity])
+    return entries
+
+# --- Memory ---
+
+class MemoryStorage(Storage):
+    """所有資料放在記憶體中，以一把鎖確保原子性"""
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}     # username -> dict
+        self._cards = {}     # username -> {path: count}
+        self._ledger = {}    # username -> {batch_id: entries}
+        self._ledger_keys = {}  # username -> 已入帳的冪等鍵
+        self._leaderboards = {}  # (board, shard) -> {username: entry}
+        self._deleting = set()
+
+    def get_user(self, username):
+        with self._lock:
+            user = self._users.get(username)
+            return dict(user) if user is not None else None
+
+    def create_user(self, username, data):
+        with self._lock:
+            if username in self._users:
+                return False
+            self._users[username] = dict(data)
+            return True
+
+    def record_login(self, username, password_hash=None):
+        with self._lock:
+            user = self._users[username]
+            user['last_login'] = time.time()
+            if password_hash:
+                user['password_hash'] = password_hash
+
+    def apply_popcorn_batch(self, username, batch_id, entries):
+        with self._lock:
+            user = self._users.get(username)
+            if user is None or user.get('deleting'):
+                return None, {}
+            batches = self._ledger.setdefault(username, {})
+            if batch_id in batches:
+                return user.get('popcorn', 0), {}
+            keys = self._ledger_keys.setdefault(username, set())
+            applied = {key: amount for key, amount in entries.items() if key not in keys}
+            keys.update(applied)
+            batches[batch_id] = applied
+            user['popcorn'] = user.get('popcorn', 0) + sum(applied.values())
+            return user['popcorn'], applied
+
+    def spend_popcorn(self, username, idempotency_key, cost):
+        with self._lock:
+            user = self._users.get(username)
+            if user is None:
+                raise InsufficientPopcornError(0, cost)
+            balance = user.get('popcorn', 0)
+            keys = self._ledger_keys.setdefault(username, set())
+            if idempotency_key in keys:
+                return balance, False
+            if balance < cost:
+                raise InsufficientPopcornError(balance, cost)
+            keys.add(idempotency_key)
+            self._ledger.setdefault(username, {})[idempotency_key] = {idempotency_key: -cost}
+            user['popcorn'] = balance - cost
+            return balance - cost, True
+
+    def read_owned_cards(self, username):
+        with self._lock:
+            return dict(self._cards.get(username, {}))
+
+    def commit_draw(self, username, cost, card_paths):
+        with self._lock:
+            user = self._users.get(username)
+            balance = user.get('popcorn', 0) if user else 0
+            if user is None or balance < cost:
+                raise InsufficientPopcornError(balance, cost)
+            user['popcorn'] = balance - cost
+            cards = self._cards.setdefault(username, {})
+            for card_path in card_paths:
+                cards[card_path] = cards.get(card_path, 0) + 1
+            return balance - cost
+
+    def update_leaderboard(self, board, shard, username, entry, capacity):
+        with self._lock:
+            key = (board, shard)
+            entries = self._leaderboards[key] = merge_leaderboard_entry(
+                self._leaderboards.get(key, {}), username, entry, capacity)
+            return {name: dict(entry) for name, entry in entries.items()}
+
+    def read_leaderboard(self, board, num_shards):
+        with self._lock:
+            entries = {}
+            for shard in range(num_shards):
+                entries.update(self._leaderboards.get((board, shard), {}))
+            return {username: dict(entry) for username, entry in entries.items()}
+
+    def delete_user_data(self, username, progress=None, parallel=None):
+        with self._lock:
+            self._deleting.add(username)
+            if username in self._users:
+                self._users[username]['deleting'] = True
+            deleted = len(self._cards.pop(username, {})) + len(self._ledger.pop(username, {}))
+            deleted += len(self._ledger_keys.pop(username, set()))
+            deleted += 1 if self._users.pop(username, None) is not None else 0
+            self._deleting.discard(username)
+        if progress:
+            progress(deleted, deleted)
+        return deleted
+
+    def pending_deletions(self):
+        with self._lock:
+            return sorted(self._deleting)
+
+    def inactive_users(self, days):
+        cutoff = time.time() - days * 86400
+        with self._lock:
+            return sorted(name for name, user in self._users.items()
+                          if user.get('last_login') is not None and user['last_login'] < cutoff)
+
+# --- SQLite ---
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    name TEXT,
+    password_hash TEXT,
+    popcorn INTEGER NOT NULL DEFAULT 0,
+    last_login REAL,
+    deleting INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cards (
+    username TEXT NOT NULL,
+    path TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (username, path)
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    username TEXT NOT NULL,
+    batch_id TEXT NOT NULL,
+    entries TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (username, batch_id)
+);
+CREATE TABLE IF NOT EXISTS ledger_keys (
+    username TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (username, key)
+);
+CREATE TABLE IF NOT EXISTS leaderboard_shards (
+    board TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    entries TEXT NOT NULL,
+    PRIMARY KEY (board, shard)
+);
+CREATE INDEX IF NOT EXISTS users_last_login ON users (last_login);
+"""
+
+class SQLiteStorage(Storage):
+    """
+    單檔 SQLite 資料庫，每個執行緒一條連線 (WAL 模式)。
+    寫入都在 BEGIN IMMEDIATE 交易中進行，行為與 Firestore 交易相同。
+    """
+    name = 'sqlite'
+    DELETE_CHUNK = 500
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        # :memory: 無法跨連線共用，改用單一連線加鎖
+        self._shared = None
+        self._shared_lock = threading.RLock()
+        if path == ':memory:':
+            self._shared = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._shared.row_factory = sqlite3.Row
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    class _Transaction:
+        def __init__(self, storage):
+            self.storage = storage
+
+        def __enter__(self):
+            if self.storage._shared is not None:
+                self.storage._shared_lock.acquire()
+            self.conn = self.storage._connection()
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+            try:
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+            finally:
+                if self.storage._shared is not None:
+                    self.storage._shared_lock.release()
+            return False
+
+    def _transaction(self):
+        return self._Transaction(self)
+
+    def _query(self, sql, params=()):
+        if self._shared is not None:
+            with self._shared_lock:
+                return self._shared.execute(sql, params).fetchall()
+        return self._connection().execute(sql, params).fetchall()
+
+    def get_user(self, username):
+        rows = self._query("SELECT * FROM users WHERE username = ?", (username,))
+        if not rows:
+            return None
+        user = dict(rows[0])
+        user.pop('username')
+        user['deleting'] = bool(user['deleting'])
+        return user
+
+    def create_user(self, username, data):
+        with self._transaction() as conn:
+            try:
+                conn.execute(
+                    "INSERT INTO users (username, name, password_hash, popcorn) VALUES (?, ?, ?, ?)",
+                    (username, data.get('name'), data.get('password_hash'), data.get('popcorn', 0)),
+                )
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def record_login(self, username, password_hash=None):
+        with self._transaction() as conn:
+            conn.execute("UPDATE users SET last_login = ? WHERE username = ?", (time.time(), username))
+            if password_hash:
+                conn.execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username))
+
+    def apply_popcorn_batch(self, username, batch_id, entries):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT popcorn, deleting FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None or row['deleting']:
+                return None, {}
+            if conn.execute("SELECT 1 FROM ledger WHERE username = ? AND batch_id = ?", (username, batch_id)).fetchone():
+                return row['popcorn'], {}
+            applied = {key: amount for key, amount in entries.items()
+                       if conn.execute("INSERT OR IGNORE INTO ledger_keys (username, key) VALUES (?, ?)", (username, key)).rowcount}
+            conn.execute(
+                "INSERT INTO ledger (username, batch_id, entries, created_at) VALUES (?, ?, ?, ?)",
+                (username, batch_id, json.dumps(applied), time.time()),
+            )
+            conn.execute("UPDATE users SET popcorn = popcorn + ? WHERE username = ?", (sum(applied.values()), username))
+        return row['popcorn'] + sum(applied.values()), applied
+
+    def spend_popcorn(self, username, idempotency_key, cost):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT popcorn FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                raise InsufficientPopcornError(0, cost)
+            balance = row['popcorn']
+            if not conn.execute("INSERT OR IGNORE INTO ledger_keys (username, key) VALUES (?, ?)",
+                                (username, idempotency_key)).rowcount:
+                return balance, False
+            # 餘額不足時拋出例外，交易回復 (冪等鍵也不會留下)
+            if balance < cost:
+                raise InsufficientPopcornError(balance, cost)
+            conn.execute("UPDATE users SET popcorn = popcorn - ? WHERE username = ?", (cost, username))
+            conn.execute(
+                "INSERT INTO ledger (username, batch_id, entries, created_at) VALUES (?, ?, ?, ?)",
+                (username, idempotency_key, json.dumps({idempotency_key: -cost}), time.time()),
+            )
+        return balance - cost, True
+
+    def read_owned_cards(self, username):
+        rows = self._query("SELECT path, count FROM cards WHERE username = ?", (username,))
+        return {row['path']: row['count'] for row in rows}
+
+    def commit_draw(self, username, cost, card_paths):
+        counts = {}
+        for card_path in card_paths:
+            counts[card_path] = counts.get(card_path, 0) + 1
+        with self._transaction() as conn:
+            row = conn.execute("SELECT popcorn FROM users WHERE username = ?", (username,)).fetchone()
+            balance = row['popcorn'] if row else 0
+            if row is None or balance < cost:
+                raise InsufficientPopcornError(balance, cost)
+            conn.execute("UPDATE users SET popcorn = popcorn - ? WHERE username = ?", (cost, username))
+            conn.executemany(
+                "INSERT INTO cards (username, path, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (username, path) DO UPDATE SET count = count + excluded.count",
+                [(username, path, count) for path, count in counts.items()],
+            )
+        return balance - cost
+
+    def update_leaderboard(self, board, shard, username, entry, capacity):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT entries FROM leaderboard_shards WHERE board = ? AND shard = ?", (board, shard)).fetchone()
+            current = json.loads(row['entries']) if row else {}
+            entries = merge_leaderboard_entry(current, username, entry, capacity)
+            if entries != current:
+                conn.execute(
+                    "INSERT INTO leaderboard_shards (board, shard, entries) VALUES (?, ?, ?) "
+                    "ON CONFLICT (board, shard) DO UPDATE SET entries = excluded.entries",
+                    (board, shard, json.dumps(entries, ensure_ascii=False)),
+                )
+        return entries
+
+    def read_leaderboard(self, board, num_shards):
+        rows = self._query("SELECT entries FROM leaderboard_shards WHERE board = ? AND shard < ?", (board, num_shards))
+        entries = {}
+        for row in rows:
+            entries.update(json.loads(row['entries']))
+        return entries
+
+    def delete_user_data(self, username, progress=None, parallel=None):
+        with self._transaction() as conn:
+            conn.execute("UPDATE users SET deleting = 1 WHERE username = ?", (username,))
+        total = sum(self._query(f"SELECT COUNT(*) FROM {table} WHERE username = ?", (username,))[0][0]
+                    for table in ('cards', 'ledger', 'ledger_keys')) + 1
+        deleted = 0
+        for table in ('cards', 'ledger', 'ledger_keys'):
+            while True:
+                with self._transaction() as conn:
+                    cursor = conn.execute(
+                        f"DELETE FROM {table} WHERE rowid IN "
+                        f"(SELECT rowid FROM {table} WHERE username = ? LIMIT ?)",
+                        (username, self.DELETE_CHUNK),
+                    )
+                if cursor.rowcount <= 0:
+                    break
+                deleted += cursor.rowcount
+                if progress:
+                    progress(deleted, total)
+        with self._transaction() as conn:
+            deleted += conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount
+        if progress:
+            progress(deleted, max(total, deleted))
+        return deleted
+
+    def pending_deletions(self):
+        return [row['username'] for row in self._query("SELECT username FROM users WHERE deleting = 1")]
+
+    def inactive_users(self, days):
+        cutoff = time.time() - days * 86400
+        rows = self._query("SELECT username FROM users WHERE last_login IS NOT NULL AND last_login < ?", (cutoff,))
+        return [row['username'] for row in rows]
+
+    def ping(self):
+        self._query("SELECT 1")
+
+# --- Factory ---
+
+def open_storage(backend=None):
+    """依設定值 storage_backend 建立資料存取物件"""
+    backend = backend or config.get_setting('storage_backend', 'firestore')
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(config.get_setting('sqlite_path', DEFAULT_SQLITE_PATH))
+    if backend == 'firestore':
+        import storage_firestore
+        return storage_firestore.FirestoreStorage.from_config()
+    raise ValueError(f"未知的資料庫類型: {backend} (可用: {', '.join(BACKENDS)})")
@@ -0,0 +1,280 @@
+# storage_firestore.py
+# Storage 的 Firestore 實作 (正式環境)。
+#   users/<name>                   使用者主文件 (popcorn、password_hash、last_login、ledger_keys ...)
+#   users/<name>/cards|inventory   卡片庫存，格式見 inventory.py
+#   users/<name>/ledger/<batch_id> 爆米花入帳明細
+#
+# 已入帳的冪等鍵以短 hash 記在主文件的 ledger_keys (只保留最近 RECENT_KEYS 個)，
+# 入帳時不必另外讀寫每個鍵的文件：一次入帳只有一個 transaction、兩次寫入 (主文件 + 明細)。
+#   leaderboards/<board>/shards/<n> 排行榜分片 (entries: {name: entry})
+#   deletion_jobs/<name>           帳號刪除的檢查點
+import datetime
+import hashlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import firestore
+from google.api_core import exceptions as gcp_exceptions
+
+import firebase_setup
+import inventory
+from storage import Storage, InsufficientPopcornError, merge_leaderboard_entry
+
+LEDGER_SUBCOLLECTION = 'ledger'
+JOBS_COLLECTION = 'deletion_jobs'
+LEADERBOARD_COLLECTION = 'leaderboards'
+BATCH_LIMIT = 500      # Firestore 單一 batch 的寫入上限
+DEFAULT_PARALLEL = 4   # 刪除時同時送出的 batch 數
+RECENT_KEYS_FIELD = 'ledger_keys'
+RECENT_KEYS = 200      # 主文件中保留的冪等鍵數 (遠多於帳本在記憶體中去重的期間內會重送的鍵)
+KEY_DIGEST_LENGTH = 12
+
+class FirestoreStorage(Storage):
+    name = 'firestore'
+
+    def __init__(self, db, max_attempts=4):
+        self.db = db
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_config(cls):
+        """Streamlit 頁面中使用 st.secrets，命令列工具則讀取 .streamlit/secrets.toml"""
+        try:
+            import streamlit as st
+            section = st.secrets["firebase_credentials"]
+        except Exception:
+            return cls.from_secrets_file()
+        return cls(firebase_setup.init_firestore(section))
+
+    @classmethod
+    def from_secrets_file(cls, path=firebase_setup.SECRETS_PATH):
+        return cls(firebase_setup.client_from_secrets_file(path))
+
+    def _user_ref(self, username):
+        return self.db.collection('users').document(username)
+
+    def _run_transaction(self, run):
+        """執行 @firestore.transactional 函式，交易衝突時以指數退避重試"""
+        for attempt in range(self.max_attempts):
+            try:
+                return run(self.db.transaction())
+            except (gcp_exceptions.Aborted, ValueError) as e:
+                # ValueError: 函式庫內建重試次數用完 (底層原因為 Aborted)
+                if isinstance(e, ValueError) and not isinstance(e.__cause__, gcp_exceptions.Aborted):
+                    raise
+                if attempt == self.max_attempts - 1:
+                    raise
+                time.sleep(0.1 * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    # --- 使用者 ---
+
+    def get_user(self, username):
+        snapshot = self._user_ref(username).get()
+        if not snapshot.exists:
+            return None
+        return snapshot.to_dict() or {}
+
+    def create_user(self, username, data):
+        try:
+            self._user_ref(username).create(data)
+        except gcp_exceptions.AlreadyExists:
+            return False
+        return True
+
+    def record_login(self, username, password_hash=None):
+        updates = {'last_login': firestore.SERVER_TIMESTAMP}
+        if password_hash:
+            updates['password_hash'] = password_hash
+        self._user_ref(username).update(updates)
+
+    # --- 爆米花 ---
+
+    def apply_popcorn_batch(self, username, batch_id, entries):
+        """
+        一個 transaction：讀取主文件與明細文件，只把 ledger_keys 中沒有的鍵加到 popcorn，
+        再寫入主文件 (popcorn 與 ledger_keys) 與明細文件。明細文件已存在代表這批已經入帳 (例如回應逾時後重送)。
+        """
+        user_ref = self._user_ref(username)
+        batch_ref = user_ref.collection(LEDGER_SUBCOLLECTION).document(batch_id)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshots = {snapshot.reference.path: snapshot for snapshot in transaction.get_all([user_ref, batch_ref])}
+            user_snapshot = snapshots[user_ref.path]
+            user = (user_snapshot.to_dict() or {}) if user_snapshot.exists else None
+            if user is None or user.get('deleting'):
+                return None, {}
+            balance = user.get('popcorn', 0)
+            if snapshots[batch_ref.path].exists:
+                return balance, {}
+            recent = user.get(RECENT_KEYS_FIELD, [])
+            seen = set(recent)
+            applied = {key: amount for key, amount in entries.items() if _key_digest(key) not in seen}
+            if not applied:
+                return balance, {}
+            transaction.update(user_ref, {
+                'popcorn': firestore.Increment(sum(applied.values())),
+                RECENT_KEYS_FIELD: _recent_keys(recent, applied),
+            })
+            transaction.create(batch_ref, {'entries': applied, 'created_at': firestore.SERVER_TIMESTAMP})
+            return balance + sum(applied.values()), applied
+
+        return self._run_transaction(run)
+
+    def spend_popcorn(self, username, idempotency_key, cost):
+        """與 commit_draw 相同，在 transaction 中檢查餘額後扣款；ledger_keys 中已有這個冪等鍵時不再扣款"""
+        user_ref = self._user_ref(username)
+        batch_ref = user_ref.collection(LEDGER_SUBCOLLECTION).document(
+            hashlib.sha1(idempotency_key.encode('utf-8')).hexdigest())
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = user_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise InsufficientPopcornError(0, cost)
+            user = snapshot.to_dict() or {}
+            balance = user.get('popcorn', 0)
+            recent = user.get(RECENT_KEYS_FIELD, [])
+            if _key_digest(idempotency_key) in recent:
+                return balance, False
+            if balance < cost:
+                raise InsufficientPopcornError(balance, cost)
+            transaction.update(user_ref, {
+                'popcorn': firestore.Increment(-cost),
+                RECENT_KEYS_FIELD: _recent_keys(recent, [idempotency_key]),
+            })
+            transaction.create(batch_ref, {'entries': {idempotency_key: -cost}, 'created_at': firestore.SERVER_TIMESTAMP})
+            return balance - cost, True
+
+        return self._run_transaction(run)
+
+    # --- 卡片 ---
+
+    def read_owned_cards(self, username):
+        return inventory.read_owned_cards(self.db, username)
+
+    def commit_draw(self, username, cost, card_paths):
+        """
+        在同一個 transaction 中扣除爆米花並寫入所有抽到的卡片。
+        交易衝突時以指數退避重試。
+        """
+        user_ref = self._user_ref(username)
+        layout = inventory.configured_layout()
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = user_ref.get(transaction=transaction)
+            balance = (snapshot.to_dict() or {}).get('popcorn', 0)
+            if balance < cost:
+                raise InsufficientPopcornError(balance, cost)
+            transaction.update(user_ref, {'popcorn': firestore.Increment(-cost)})
+            inventory.stage_card_increments(transaction, user_ref, card_paths, layout)
+            return balance - cost
+
+        return self._run_transaction(run)
+
+    # --- 排行榜 ---
+
+    def _shard_ref(self, board, shard):
+        return self.db.collection(LEADERBOARD_COLLECTION).document(board).collection('shards').document(str(shard))
+
+    def update_leaderboard(self, board, shard, username, entry, capacity):
+        """
+        分片文件的讀取-修改-寫入在 transaction 中進行；使用者分散在各分片，降低同一文件的寫入衝突。
+        合併後內容沒有改變 (例如分數不夠進入已滿的分片) 時不寫入。
+        """
+        shard_ref = self._shard_ref(board, shard)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = shard_ref.get(transaction=transaction)
+            current = (snapshot.to_dict() or {}).get('entries', {}) if snapshot.exists else {}
+            entries = merge_leaderboard_entry(current, username, entry, capacity)
+            if entries != current:
+                transaction.set(shard_ref, {'entries': entries})
+            return entries
+
+        return self._run_transaction(run)
+
+    def read_leaderboard(self, board, num_shards):
+        refs = [self._shard_ref(board, shard) for shard in range(num_shards)]
+        entries = {}
+        for snapshot in self.db.get_all(refs):
+            if snapshot.exists:
+                entries.update((snapshot.to_dict() or {}).get('entries', {}))
+        return entries
+
+    # --- 刪除 ---
+
+    def delete_user_data(self, username, progress=None, parallel=DEFAULT_PARALLEL):
+        """
+        先在 deletion_jobs 建立檢查點並標記使用者為刪除中，再分批平行刪除子集合，
+        每批完成後更新檢查點的已刪除數。已刪除的文件不會再被讀到，因此中斷後重跑即可繼續。
+        total 無法取得時以 None 傳給 progress。
+        """
+        user_ref = self._user_ref(username)
+        job_ref = self.db.collection(JOBS_COLLECTION).document(username)
+        job = job_ref.get()
+        deleted = (job.to_dict() or {}).get('deleted', 0) if job.exists else 0
+        job_ref.set({'status': 'running', 'deleted': deleted, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+        if user_ref.get().exists:
+            user_ref.update({'deleting': True})
+
+        names = inventory.subcollection_names() + [LEDGER_SUBCOLLECTION]
+        counts = [_count(user_ref.collection(name)) for name in names]
+        total = None if None in counts else deleted + sum(counts) + 1
+        if progress:
+            progress(deleted, total)
+
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            for name in names:
+                collection_ref = user_ref.collection(name)
+                while True:
+                    refs = [doc.reference for doc in collection_ref.limit(BATCH_LIMIT * parallel).select([]).stream()]
+                    if not refs:
+                        break
+                    chunks = [refs[i:i + BATCH_LIMIT] for i in range(0, len(refs), BATCH_LIMIT)]
+                    deleted += sum(executor.map(self._delete_chunk, chunks))
+                    job_ref.update({'deleted': deleted, 'updated_at': firestore.SERVER_TIMESTAMP})
+                    if progress:
+                        progress(deleted, total)
+
+        user_ref.delete()
+        job_ref.delete()
+        deleted += 1
+        if progress:
+            progress(deleted, total or deleted)
+        return deleted
+
+    def _delete_chunk(self, refs):
+        batch = self.db.batch()
+        for ref in refs:
+            batch.delete(ref)
+        batch.commit()
+        return len(refs)
+
+    def pending_deletions(self):
+        return [doc.id for doc in self.db.collection(JOBS_COLLECTION).stream()]
+
+    def inactive_users(self, days):
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+        query = self.db.collection('users').where(filter=firestore.FieldFilter('last_login', '<', cutoff))
+        return [doc.id for doc in query.select([]).stream()]
+
+    def ping(self):
+        self.db.collection('users').limit(1).get()
+
+def _key_digest(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:KEY_DIGEST_LENGTH]
+
+def _recent_keys(recent, keys):
+    """加入新入帳的鍵後的 ledger_keys (舊的在前，只保留最近 RECENT_KEYS 個)"""
+    return (list(recent) + [_key_digest(key) for key in keys])[-RECENT_KEYS:]
+
+def _count(collection_ref):
+    """估算文件數 (用於進度條)，不支援 count 查詢時回傳 None"""
+    try:
+        return int(collection_ref.count().get()[0][0].value)
+    except Exception:
+        return None
@@ -0,0 +1,28 @@
+# test_build_assets.py
+# 啟動時缺少衍生圖檔才在背景建置，且整個 process 只建置一次。
+#   python -m pytest test_build_assets.py
+import build_assets
+
+def test_ensure_built_runs_once_when_outputs_missing(tmp_path, monkeypatch):
+    outputs = {name: tmp_path / name for name in build_assets.OUTPUTS}
+    monkeypatch.setattr(build_assets, 'OUTPUTS', outputs)
+    monkeypatch.setattr(build_assets, '_build_thread', None)
+    builds = []
+
+    def fake_build():
+        builds.append(True)
+        for path in outputs.values():
+            path.write_text("{}")
+    monkeypatch.setattr(build_assets, 'build_all', fake_build)
+
+    assert build_assets.missing_outputs() == list(outputs)
+    thread = build_assets.ensure_built()
+    thread.join()
+    assert build_assets.ensure_built() is None
+    assert builds == [True]
+
+def test_ensure_built_can_be_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_assets, 'OUTPUTS', {'thumbnails': tmp_path / 'missing'})
+    monkeypatch.setattr(build_assets, '_build_thread', None)
+    monkeypatch.setenv('BUILD_ASSETS_ON_START', 'false')
+    assert build_assets.ensure_built() is None
@@ -0,0 +1,67 @@
+# test_leaderboard.py
+# 帳本入帳後更新排行榜時的資料庫操作次數。
+#   python -m pytest test_leaderboard.py
+import leaderboard
+import ledger
+import storage
+
+class CountingStorage(storage.MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+
+    def _count(self, op):
+        self.calls[op] = self.calls.get(op, 0) + 1
+
+    def get_user(self, username):
+        self._count('get_user')
+        return super().get_user(username)
+
+    def update_leaderboard(self, *args):
+        self._count('update_leaderboard')
+        return super().update_leaderboard(*args)
+
+def make_service(store, capacity=2):
+    book = ledger.PopcornLedger(store)
+    service = leaderboard.LeaderboardService(store, num_shards=1, capacity=capacity)
+    book.add_listener(service.popcorn_changed)
+    return book, service
+
+def test_flush_uses_balance_from_ledger():
+    store = CountingStorage()
+    store.create_user('alice', {'name': 'Alice', 'popcorn': 0})
+    book, service = make_service(store)
+    for i in range(3):
+        book.record('alice', 5, f"flash_card:{i}")
+        book.flush('alice')
+    # 只有第一次需要讀取名稱
+    assert store.calls == {'get_user': 1, 'update_leaderboard': 3}
+    [(username, entry)] = service.top(leaderboard.POPCORN_BOARD)
+    assert (username, entry['name'], entry['score']) == ('alice', 'Alice', [15])
+
+def test_outranked_user_skips_shard_update():
+    store = CountingStorage()
+    for name, popcorn in (('a', 0), ('b', 0), ('c', 0)):
+        store.create_user(name, {'name': name, 'popcorn': popcorn})
+    book, service = make_service(store, capacity=2)
+    for name, amount in (('a', 50), ('b', 40)):
+        book.record(name, amount, f"grant:{name}")
+        book.flush(name)
+    store.calls.clear()
+    book.record('c', 1, "grant:c")
+    book.flush('c')
+    # 分片已滿且分數低於最低分：不執行分片的 transaction
+    assert store.calls == {'get_user': 1}
+    book.record('c', 100, "grant:c2")
+    book.flush('c')
+    assert store.calls == {'get_user': 1, 'update_leaderboard': 1}
+    assert [name for name, _ in service.top(leaderboard.POPCORN_BOARD)] == ['c', 'a']
+
+def test_deleting_user_is_not_listed():
+    store = CountingStorage()
+    store.create_user('alice', {'name': 'Alice', 'popcorn': 0})
+    book, service = make_service(store)
+    store.delete_user_data('alice')
+    book.record('alice', 5, "flash_card:1")
+    book.flush('alice')
+    assert service.top(leaderboard.POPCORN_BOARD) == []
@@ -0,0 +1,36 @@
+# test_ledger.py
+# 帳本寫入失敗時保留變動並重試，失敗會記錄到 log 與 metrics。
+#   python -m pytest test_ledger.py
+import logging
+
+import ledger
+import metrics
+import storage
+
+class FlakyStorage(storage.MemoryStorage):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def apply_popcorn_batch(self, username, batch_id, entries):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("資料庫無法連線")
+        return super().apply_popcorn_batch(username, batch_id, entries)
+
+def test_failed_flush_is_logged_and_retried(caplog):
+    store = FlakyStorage(failures=2)
+    store.create_user('alice', {'popcorn': 0})
+    book = ledger.PopcornLedger(store)
+    book.record('alice', 5, "flash_card:1")
+    before = metrics.failure_totals().get('ledger_flush', 0)
+    with caplog.at_level(logging.ERROR, logger='ledger'):
+        book.flush_all()
+        book.flush_all()
+    assert metrics.failure_totals()['ledger_flush'] == before + 2
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2 and 'user=alice' in messages[1] and '連續失敗=2' in messages[1]
+    assert book.pending_delta('alice') == 5
+    book.flush_all()
+    assert store.get_balance('alice') == 5
+    assert book.pending_delta('alice') == 0
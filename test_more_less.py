@@ -0,0 +1,33 @@
+# test_more_less.py
+# 比大小的賭注：沒有結算就被丟棄的一局退還賭注。
+#   python -m pytest test_more_less.py
+import gc
+
+import more_less
+
+class FakeLedger:
+    def __init__(self):
+        self.records = []
+
+    def record(self, username, amount, idempotency_key=None):
+        self.records.append((username, amount, idempotency_key))
+        return True
+
+def test_dropped_round_refunds_bet():
+    book = FakeLedger()
+    state = more_less.MoreLessState()
+    state.place_bet(book, 'alice', 5)
+    round_id = state.round_id
+    del state
+    gc.collect()
+    assert book.records == [('alice', 5, f"more_less:{round_id}:refund")]
+
+def test_settled_round_is_not_refunded():
+    book = FakeLedger()
+    state = more_less.MoreLessState()
+    state.place_bet(book, 'alice', 5)
+    assert state.settle()
+    assert not state.settle()
+    del state
+    gc.collect()
+    assert book.records == []
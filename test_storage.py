@@ -0,0 +1,107 @@
+# test_storage.py
+# MemoryStorage 與 SQLiteStorage 的語意必須一致 (見 storage.Storage)。
+#   python -m pytest test_storage.py
+import pytest
+
+import storage
+from storage import InsufficientPopcornError
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return storage.MemoryStorage()
+    return storage.SQLiteStorage(str(tmp_path / "popcorn.db"))
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        storage.Storage()
+
+# --- 使用者 ---
+
+def test_create_user(store):
+    assert store.create_user('alice', {'name': 'Alice', 'password_hash': 'x', 'popcorn': 10})
+    assert not store.create_user('alice', {'name': 'Other', 'password_hash': 'y', 'popcorn': 99})
+    user = store.get_user('alice')
+    assert user['name'] == 'Alice'
+    assert user['popcorn'] == 10
+    assert store.get_user('bob') is None
+    assert store.get_balance('bob') == 0
+
+# --- 爆米花 ---
+
+def test_apply_popcorn_batch_is_idempotent(store):
+    store.create_user('alice', {'popcorn': 10})
+    assert store.apply_popcorn_batch('alice', 'b1', {'k1': 3, 'k2': 4}) == (17, {'k1': 3, 'k2': 4})
+    # 同一個 batch_id 重送
+    assert store.apply_popcorn_batch('alice', 'b1', {'k1': 3, 'k2': 4}) == (17, {})
+    # 不同批次中已入帳的鍵
+    assert store.apply_popcorn_batch('alice', 'b2', {'k1': 3, 'k3': 1}) == (18, {'k3': 1})
+    assert store.get_balance('alice') == 18
+    # 使用者不存在
+    assert store.apply_popcorn_batch('bob', 'b1', {'k1': 5}) == (None, {})
+    assert store.get_user('bob') is None
+
+def test_spend_popcorn(store):
+    store.create_user('alice', {'popcorn': 10})
+    assert store.spend_popcorn('alice', 'bet-1', 6) == (4, True)
+    assert store.spend_popcorn('alice', 'bet-1', 6) == (4, False)
+    with pytest.raises(InsufficientPopcornError) as e:
+        store.spend_popcorn('alice', 'bet-2', 5)
+    assert e.value.balance == 4
+    # 失敗的扣款不會留下冪等鍵
+    assert store.apply_popcorn_batch('alice', 'b1', {'grant': 1}) == (5, {'grant': 1})
+    assert store.spend_popcorn('alice', 'bet-2', 5) == (0, True)
+
+def test_commit_draw_insufficient_balance(store):
+    store.create_user('alice', {'popcorn': 5})
+    with pytest.raises(InsufficientPopcornError) as e:
+        store.commit_draw('alice', 10, ['image/a.jpg'])
+    assert (e.value.balance, e.value.cost) == (5, 10)
+    assert store.get_balance('alice') == 5
+    assert store.read_owned_cards('alice') == {}
+    with pytest.raises(InsufficientPopcornError):
+        store.commit_draw('bob', 1, ['image/a.jpg'])
+
+def test_commit_draw(store):
+    store.create_user('alice', {'popcorn': 10})
+    assert store.commit_draw('alice', 4, ['image/a.jpg', 'image/a.jpg', 'image/b.jpg']) == 6
+    assert store.read_owned_cards('alice') == {'image/a.jpg': 2, 'image/b.jpg': 1}
+
+# --- 排行榜 ---
+
+def test_leaderboard_shard_capacity(store):
+    for i, score in enumerate([5, 1, 9, 3]):
+        store.update_leaderboard('popcorn', 0, f"u{i}", {'score': score, 'at': i}, capacity=3)
+    assert {name: entry['score'] for name, entry in store.read_leaderboard('popcorn', 1).items()} == \
+        {'u0': 5, 'u2': 9, 'u3': 3}
+
+def test_leaderboard_update_returns_shard(store):
+    entries = store.update_leaderboard('popcorn', 0, 'alice', {'score': 7, 'at': 1.0}, capacity=1)
+    assert entries == {'alice': {'score': 7, 'at': 1.0}}
+    # 分數不夠進入已滿的分片時內容不變
+    assert store.update_leaderboard('popcorn', 0, 'bob', {'score': 3, 'at': 1.0}, capacity=1) == entries
+
+def test_leaderboard_keeps_newer_entry(store):
+    store.update_leaderboard('popcorn', 0, 'alice', {'score': 7, 'at': 2.0}, capacity=10)
+    store.update_leaderboard('popcorn', 0, 'alice', {'score': 3, 'at': 1.0}, capacity=10)
+    assert store.read_leaderboard('popcorn', 1)['alice']['score'] == 7
+    store.update_leaderboard('popcorn', 0, 'alice', None, capacity=10)
+    assert store.read_leaderboard('popcorn', 2) == {}
+
+# --- 刪除 ---
+
+def test_delete_user_data(store):
+    store.create_user('alice', {'popcorn': 10})
+    store.create_user('bob', {'popcorn': 10})
+    store.apply_popcorn_batch('alice', 'b1', {'k1': 1})
+    store.commit_draw('alice', 1, ['image/a.jpg'])
+    calls = []
+    assert store.delete_user_data('alice', progress=lambda deleted, total: calls.append((deleted, total))) > 0
+    assert calls and calls[-1][0] == calls[-1][1]
+    assert store.get_user('alice') is None
+    assert store.read_owned_cards('alice') == {}
+    assert store.pending_deletions() == []
+    assert store.get_balance('bob') == 10
+    # 重新註冊同名帳號時，舊的冪等鍵不會擋住新的入帳
+    store.create_user('alice', {'popcorn': 0})
+    assert store.apply_popcorn_batch('alice', 'b1', {'k1': 1}) == (1, {'k1': 1})
@@ -0,0 +1,175 @@
+# test_storage_firestore.py
+# FirestoreStorage 的讀寫次數 (以記憶體中的假 Firestore 執行，不需要連線)。
+#   python -m pytest test_storage_firestore.py
+import pytest
+
+pytest.importorskip('firebase_admin')
+
+from firebase_admin import firestore
+
+import storage_firestore
+
+# --- Fake Firestore ---
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class FakeRef:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    def get(self, transaction=None):
+        if transaction is not None:
+            transaction.reads += 1
+        self.db.reads += 1
+        return FakeSnapshot(self, self.db.docs.get(self.path))
+
+    def create(self, data):
+        self.db.apply([('create', self, data)])
+
+    def update(self, data):
+        self.db.apply([('update', self, data)])
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeRef(self.db, f"{self.path}/{doc_id}")
+
+class FakeTransaction:
+    """提供 @firestore.transactional 需要的介面，寫入在 _commit 時才套用"""
+    _read_only = False
+    _max_attempts = 1
+    _id = b'fake'
+
+    def __init__(self, db):
+        self.db = db
+        self.reads = 0
+        self._writes = []
+
+    def _clean_up(self):
+        self._writes = []
+
+    def _begin(self, retry_id=None):
+        pass
+
+    def _rollback(self):
+        self._writes = []
+
+    def _commit(self):
+        self.db.commits.append(len(self._writes))
+        self.db.apply(self._writes)
+
+    def get_all(self, refs):
+        return [ref.get(transaction=self) for ref in refs]
+
+    def create(self, ref, data):
+        self._writes.append(('create', ref, data))
+
+    def update(self, ref, data):
+        self._writes.append(('update', ref, data))
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(('set', ref, data))
+
+class FakeDB:
+    def __init__(self):
+        self.docs = {}      # 路徑 -> dict
+        self.reads = 0
+        self.commits = []   # 每個 transaction 的寫入數
+        self.transactions = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def transaction(self):
+        transaction = FakeTransaction(self)
+        self.transactions.append(transaction)
+        return transaction
+
+    def apply(self, writes):
+        for op, ref, data in writes:
+            current = self.docs.get(ref.path)
+            if op == 'create' and current is not None:
+                raise storage_firestore.gcp_exceptions.AlreadyExists(ref.path)
+            if op == 'update' and current is None:
+                raise storage_firestore.gcp_exceptions.NotFound(ref.path)
+            doc = dict(current or {}) if op == 'update' else {}
+            for field, value in data.items():
+                if isinstance(value, firestore.Increment):
+                    value = doc.get(field, 0) + value.value
+                doc[field] = value
+            self.docs[ref.path] = doc
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+@pytest.fixture
+def store(db):
+    store = storage_firestore.FirestoreStorage(db)
+    store.create_user('alice', {'name': 'Alice', 'popcorn': 10})
+    return store
+
+# --- 爆米花 ---
+
+def test_flush_is_one_transaction_with_two_writes(db, store):
+    entries = {f"flash_card:{i}": 1 for i in range(50)}
+    assert store.apply_popcorn_batch('alice', 'b1', entries) == (60, entries)
+    assert db.commits == [2]
+    assert db.transactions[-1].reads == 2
+    assert store.get_balance('alice') == 60
+
+def test_flush_skips_applied_keys(db, store):
+    store.apply_popcorn_batch('alice', 'b1', {'k1': 3, 'k2': 4})
+    # 同一批重送
+    assert store.apply_popcorn_batch('alice', 'b1', {'k1': 3, 'k2': 4}) == (17, {})
+    # 其他批次中已入帳的鍵
+    assert store.apply_popcorn_batch('alice', 'b2', {'k1': 3, 'k3': 1}) == (18, {'k3': 1})
+    # 全部都已入帳時不寫入
+    assert store.apply_popcorn_batch('alice', 'b3', {'k2': 4}) == (18, {})
+    assert db.commits == [2, 0, 2, 0]
+    assert store.get_balance('alice') == 18
+    assert store.apply_popcorn_batch('bob', 'b1', {'k1': 1}) == (None, {})
+
+def test_flush_skips_deleting_user(db, store):
+    db.docs['users/alice']['deleting'] = True
+    assert store.apply_popcorn_batch('alice', 'b1', {'k1': 1}) == (None, {})
+    assert db.commits == [0]
+
+def test_recent_keys_are_bounded(store):
+    for i in range(storage_firestore.RECENT_KEYS + 10):
+        store.apply_popcorn_batch('alice', f"b{i}", {f"k{i}": 1})
+    recent = store.get_user('alice')[storage_firestore.RECENT_KEYS_FIELD]
+    assert len(recent) == storage_firestore.RECENT_KEYS
+    assert recent[-1] == storage_firestore._key_digest(f"k{storage_firestore.RECENT_KEYS + 9}")
+
+def test_spend_popcorn(db, store):
+    assert store.spend_popcorn('alice', 'bet-1', 6) == (4, True)
+    assert store.spend_popcorn('alice', 'bet-1', 6) == (4, False)
+    with pytest.raises(storage_firestore.InsufficientPopcornError):
+        store.spend_popcorn('alice', 'bet-2', 5)
+    assert db.commits == [2, 0]
+    assert store.get_balance('alice') == 4
+
+# --- 排行榜 ---
+
+def test_leaderboard_writes_only_changed_shard(db, store):
+    store.update_leaderboard('popcorn', 0, 'alice', {'score': [7], 'at': 1.0}, capacity=1)
+    # 相同內容、分數不夠進入已滿的分片：只讀取，不寫入
+    store.update_leaderboard('popcorn', 0, 'alice', {'score': [7], 'at': 1.0}, capacity=1)
+    store.update_leaderboard('popcorn', 0, 'bob', {'score': [3], 'at': 2.0}, capacity=1)
+    assert db.commits == [1, 0, 0]
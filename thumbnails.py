@@ -0,0 +1,128 @@
+# thumbnails.py
+# 卡圖縮圖產生工具：python thumbnails.py [--widths 240 480] [--format webp]
+# 部署時由 build_assets.py 依序建置全部衍生圖檔 (本工具為其中一步)。
+import argparse
+import hashlib
+import json
+from functools import lru_cache
+from pathlib import Path
+
+IMAGE_ROOT = Path("image")
+DEFAULT_SOURCE_ROOT = IMAGE_ROOT / "gacha"
+THUMB_DIR_NAME = "_thumbs"
+INDEX_PATH = IMAGE_ROOT / "thumbs_index.json"
+DEFAULT_WIDTHS = (240, 480, 960)
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+# --- Helper Functions ---
+
+def file_hash(path):
+    """計算檔案內容的 sha256 (取前 12 碼作為檔名用的 hash)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def iter_source_images(source_root):
+    """列出來源資料夾下所有原圖 (略過縮圖資料夾)"""
+    for path in sorted(Path(source_root).rglob('*.jpg')):
+        if THUMB_DIR_NAME not in path.parts:
+            yield path
+
+def thumb_path_for(source_path, width, content_hash, ext):
+    """縮圖與原圖放在同一層的 _thumbs 資料夾，檔名帶寬度與內容 hash"""
+    return source_path.parent / THUMB_DIR_NAME / f"{source_path.stem}.w{width}.{content_hash}.{ext}"
+
+def make_thumbnail(source_path, target_path, width, pil_format, quality):
+    """將原圖等比例縮到指定寬度後存檔"""
+    from PIL import Image  # 只有產生縮圖時才需要 Pillow
+
+    with Image.open(source_path) as im:
+        im = im.convert('RGB')
+        if im.width > width:
+            height = round(im.height * width / im.width)
+            im = im.resize((width, height), Image.LANCZOS)
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        if pil_format == 'WEBP':
+            im.save(target_path, pil_format, quality=quality, method=6)
+        else:
+            im.save(target_path, pil_format, quality=quality, optimize=True, progressive=True)
+
+def build_thumbnails(source_root=DEFAULT_SOURCE_ROOT, widths=DEFAULT_WIDTHS, fmt='webp',
+                     quality=80, index_path=INDEX_PATH):
+    """
+    產生所有卡圖的縮圖並寫出索引檔。
+    原圖內容沒變 (hash 相同) 且縮圖已存在時會直接沿用，舊版本的縮圖會被刪除。
+    """
+    pil_format, ext = FORMATS[fmt]
+    index_path = Path(index_path)
+    old_index = {}
+    if index_path.exists():
+        old_index = json.loads(index_path.read_text(encoding='utf-8'))
+
+    index = dict(old_index)
+    built = skipped = 0
+    for source_path in iter_source_images(source_root):
+        key = source_path.as_posix()
+        content_hash = file_hash(source_path)
+        thumbs = {}
+        for width in widths:
+            target = thumb_path_for(source_path, width, content_hash, ext)
+            if target.exists():
+                skipped += 1
+            else:
+                make_thumbnail(source_path, target, width, pil_format, quality)
+                built += 1
+            thumbs[str(width)] = target.as_posix()
+
+        # 清除同一張原圖的舊縮圖
+        old_thumbs = old_index.get(key, {}).get('thumbs', {})
+        for old in set(old_thumbs.values()) - set(thumbs.values()):
+            Path(old).unlink(missing_ok=True)
+
+        index[key] = {'hash': content_hash, 'thumbs': thumbs}
+
+    index_path.write_text(json.dumps(index, ensure_ascii=False, indent=1, sort_keys=True), encoding='utf-8')
+    load_index.cache_clear()
+    return built, skipped
+
+# --- Runtime Lookup ---
+
+@lru_cache(maxsize=1)
+def load_index(index_path=INDEX_PATH):
+    """讀取縮圖索引 (整個 process 只讀一次)，索引不存在時回傳空字典"""
+    try:
+        return json.loads(Path(index_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+def thumbnail_for(image_path, width=240):
+    """
+    取得適合顯示寬度的縮圖路徑。
+    會挑選寬度 >= 指定寬度的最小縮圖，沒有縮圖時直接回傳原圖路徑。
+    """
+    entry = load_index().get(image_path)
+    if not entry or not entry.get('thumbs'):
+        return image_path
+    available = sorted((int(w), p) for w, p in entry['thumbs'].items())
+    for thumb_width, thumb_path in available:
+        if thumb_width >= width:
+            return thumb_path
+    return available[-1][1]
+
+# --- CLI ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生卡圖縮圖")
+    parser.add_argument('--source', default=str(DEFAULT_SOURCE_ROOT), help="原圖資料夾")
+    parser.add_argument('--widths', type=int, nargs='+', default=list(DEFAULT_WIDTHS), help="縮圖寬度 (px)")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='webp', help="縮圖格式")
+    parser.add_argument('--quality', type=int, default=80, help="壓縮品質")
+    args = parser.parse_args(argv)
+
+    built, skipped = build_thumbnails(args.source, tuple(args.widths), args.format, args.quality)
+    print(f"完成！新產生 {built} 張縮圖，沿用 {skipped} 張。索引檔：{INDEX_PATH.as_posix()}")
+
+if __name__ == "__main__":
+    main()
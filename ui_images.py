@@ -0,0 +1,111 @@
+# ui_images.py
+# 所有遊戲畫面的圖片都經由 show_image 顯示：
+#   - 已建置靜態網址時改用內容 hash 網址 (瀏覽器可快取，不經過 Streamlit 的 media store)
+#   - 否則已建置打包檔 (asset_pack.py) 時從 mmap 取圖片內容，不逐檔開啟讀取
+#   - 開啟效能紀錄時統計每次執行送出的圖片大小
+# 翻翻樂與比大小的卡片經由 show_game_card 顯示，已建置合併圖時只送出裁切用的 HTML。
+# 下一個階段會用到的圖片可先以 prefetch_images / prefetch_game_cards 讓瀏覽器在背景下載。
+import html
+import os
+
+import streamlit as st
+
+import asset_manifest
+import asset_pack
+import metrics
+import sprite_atlas
+import static_assets
+
+def image_size(image):
+    """
+    估算圖片經由 Streamlit 送出的位元組數：檔案路徑取檔案大小，bytes 取長度，其餘 (PIL / numpy) 取像素資料大小。
+    靜態網址由瀏覽器自行下載 (通常來自快取)，計為 0。
+    """
+    if isinstance(image, (str, os.PathLike)):
+        try:
+            return os.path.getsize(image)
+        except OSError:
+            return 0
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return len(image)
+    return getattr(image, 'nbytes', 0)
+
+def show_image(image, **kwargs):
+    """st.image 的包裝，參數相同"""
+    if isinstance(image, str):
+        image = static_assets.url_for(image)
+    if isinstance(image, str):
+        # st.image 只接受 bytes，在這裡才從 mmap 複製一次
+        packed = asset_pack.read_image(image)
+        if packed is not None:
+            image = bytes(packed)
+    if metrics.PROFILING:
+        metrics.record_image(image_size(image))
+    st.image(image, **kwargs)
+
+def lazy_image_grid(items, min_width=110):
+    """
+    以 HTML 格子顯示靜態網址的圖片，<img loading="lazy"> 讓瀏覽器只下載捲動到畫面中的圖片。
+    items: [(圖片網址, 說明文字, 點擊後開啟的網址或 None)]
+    """
+    cells = []
+    for src, caption, href in items:
+        img = f'<img src="{html.escape(src)}" loading="lazy" decoding="async" style="width:100%;border-radius:6px;">'
+        if href:
+            img = f'<a href="{html.escape(href)}" target="_blank" rel="noopener">{img}</a>'
+        cells.append(f'<figure style="margin:0;text-align:center;">{img}'
+                     f'<figcaption style="font-size:0.8rem;opacity:0.7;">{html.escape(caption)}</figcaption></figure>')
+        if metrics.PROFILING:
+            metrics.record_image(0)
+    st.markdown(
+        f'<div style="display:grid;grid-template-columns:repeat(auto-fill,minmax({min_width}px,1fr));gap:0.75rem;">'
+        + "".join(cells) + '</div>',
+        unsafe_allow_html=True,
+    )
+
+def show_game_card(game, name):
+    """
+    顯示 flash_card / more_less 的一張卡 (name 為卡面名稱或 'card_back')。
+    有合併圖時以 CSS 裁切同一張圖，否則退回 show_image 逐張顯示。
+    """
+    atlas = sprite_atlas.atlas_for(game)
+    if atlas and str(name) in atlas['sprites']:
+        if metrics.PROFILING:
+            metrics.record_image(0)
+        st.markdown(sprite_atlas.sprite_html(atlas, name, "卡背" if name == 'card_back' else str(name)),
+                    unsafe_allow_html=True)
+        return
+    show_image(asset_manifest.game_image(game, name), use_container_width=True)
+
+def _prefetch_urls(urls):
+    """以隱藏的 <img> 讓瀏覽器在背景下載 (不佔版面)"""
+    if not urls:
+        return
+    imgs = "".join(f'<img src="{html.escape(url)}" alt="" decoding="async">' for url in urls)
+    st.markdown(f'<div aria-hidden="true" style="position:absolute;width:0;height:0;overflow:hidden;">{imgs}</div>',
+                unsafe_allow_html=True)
+
+def prefetch_images(image_paths):
+    """
+    讓瀏覽器在背景先下載下一個階段可能用到的圖片，之後顯示時直接來自瀏覽器快取。
+    只處理有靜態網址的圖片：內容 hash 網址可長期快取，由 st.image 送出的圖片網址無法事先得知。
+    """
+    if not static_assets.serving_enabled():
+        return
+    paths = list(dict.fromkeys(image_paths))
+    urls = [static_assets.url_for(path) for path in paths]
+    _prefetch_urls([url for url, path in zip(urls, paths) if url != path])
+
+def prefetch_game_cards(game, names):
+    """預先下載 flash_card / more_less 的卡面；有合併圖時整個遊戲只需要那一張圖"""
+    atlas = sprite_atlas.atlas_for(game)
+    if atlas:
+        _prefetch_urls([atlas['url']])
+        return
+    paths = []
+    for name in names:
+        try:
+            paths.append(asset_manifest.game_image(game, name))
+        except KeyError:
+            continue
+    prefetch_images(paths)